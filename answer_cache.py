@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Semantic answer cache for the chat loop.
+Stores final answers keyed by the embedding of the user question. A new
+question whose embedding is close enough to a cached one gets the stored
+answer back without any LLM call.
+
+Entries remember what they were grounded on: the content hashes of the data
+files returned by rag_search. Answers without such sources are not cached,
+since nothing tells when they go stale. An entry is only served while those
+hashes and the RAG index version are unchanged, so adding a data file that
+might answer better also invalidates it.
+
+With several users, entries carry a scope: None for answers shared by
+everyone (they must not depend on any chat history), or the id of the
+session whose history the answer may depend on; such entries are only
+served back to that session.
+"""
+
+import json
+import math
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class AnswerCache:
+    """Bounded, in-memory (optionally file-backed) cache of question -> final answer."""
+
+    def __init__(
+        self,
+        embed_fn: Callable[[str], Optional[List[float]]],
+        threshold: float = 0.92,
+        max_entries: int = 500,
+        ttl: float = 86400.0,
+        path: str | None = None,
+    ):
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = Path(path) if path else None
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._entries: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._load()
+
+    # --- Persistence ---
+    def _load(self):
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            self._entries = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception as e:
+            print(f"Cannot load answer cache '{self.path}': {e}")
+            self._entries = []
+
+    def _save(self):
+        if self.path is None:
+            return
+        try:
+            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+            tmp.write_text(json.dumps(self._entries, ensure_ascii=False), encoding="utf-8")
+            tmp.replace(self.path)
+        except Exception as e:
+            print(f"Cannot save answer cache '{self.path}': {e}")
+
+    # --- Validity ---
+    @staticmethod
+    def _is_valid(entry: Dict[str, Any], status: Dict[str, Any]) -> bool:
+        """Checks an entry against the current RAG status ({"index_version", "files"})."""
+        files = status.get("files") or {}
+        if not entry.get("file_hashes"):
+            return False  # ungrounded (written by an older version)
+        # Any re-index (including new files that might answer better) invalidates
+        if entry.get("index_version") != status.get("index_version"):
+            return False
+        return all(files.get(src) == h for src, h in entry["file_hashes"].items())
+
+    # --- Public API ---
+    def embed(self, question: str, **kwargs) -> Optional[List[float]]:
+        """Embeds a question (kwargs go to embed_fn); returns None if the embedding backend is unavailable."""
+        try:
+            vector = self.embed_fn(question, **kwargs)
+        except Exception as e:
+            print(f"(answer cache: embedding failed: {e})")
+            return None
+        return _normalize(vector) if vector else None
+
+    def lookup(self, vector: Optional[List[float]], status: Optional[Dict[str, Any]], scope: str | None = None):
+        """Returns (entry, similarity) for the closest valid cached question shared or in scope, or None."""
+        if vector is None or status is None:
+            self.misses += 1
+            return None
+        now = time.time()
+        best, best_sim = None, -1.0
+        with self._lock:
+            # Drop expired and invalidated entries while scanning
+            alive = []
+            for entry in self._entries:
+                if now - entry["created"] > self.ttl or not self._is_valid(entry, status):
+                    continue
+                alive.append(entry)
+                if entry.get("scope") not in (None, scope):
+                    continue
+                sim = sum(a * b for a, b in zip(vector, entry["vector"]))
+                if sim > best_sim:
+                    best, best_sim = entry, sim
+            if len(alive) != len(self._entries):
+                self._entries = alive
+                self._save()
+            if best is not None and best_sim >= self.threshold:
+                self.hits += 1
+                self.saved_seconds += best.get("llm_seconds", 0.0)
+                best["hits"] = best.get("hits", 0) + 1
+                return best, best_sim
+        self.misses += 1
+        return None
+
+    def store(
+        self,
+        question: str,
+        vector: Optional[List[float]],
+        answer: str,
+        status: Optional[Dict[str, Any]],
+        sources: List[str],
+        llm_seconds: float,
+        scope: str | None = None,
+    ):
+        """Caches a final answer grounded on the given data-file sources (scope None = shared)."""
+        if vector is None or status is None or not answer.strip() or not sources:
+            return
+        files = status.get("files") or {}
+        if any(src not in files for src in sources):
+            return  # grounded on something we cannot track
+        entry = {
+            "question": question,
+            "vector": vector,
+            "answer": answer,
+            "index_version": status.get("index_version"),
+            "file_hashes": {src: files[src] for src in sources},
+            "scope": scope,
+            "llm_seconds": llm_seconds,
+            "created": time.time(),
+            "hits": 0,
+        }
+        with self._lock:
+            self._entries.append(entry)
+            if len(self._entries) > self.max_entries:
+                # Evict the least used, then oldest, entries
+                self._entries.sort(key=lambda e: (e.get("hits", 0), e["created"]))
+                self._entries = self._entries[len(self._entries) - self.max_entries:]
+            self._save()
+
+    def forget(self, scope: str):
+        """Drops the entries of a scope (e.g. a closed session)."""
+        with self._lock:
+            alive = [entry for entry in self._entries if entry.get("scope") != scope]
+            if len(alive) != len(self._entries):
+                self._entries = alive
+                self._save()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "saved_llm_seconds": round(self.saved_seconds, 2),
+        }
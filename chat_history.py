@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Sliding-window chat history for the Ollama bot.
+Keeps the system prompt and the most recent turns verbatim. Older turns are
+compacted to the user question plus a short version of the final answer:
+mcp blocks, tool calls and tool results are dropped. The oldest turns are
+dropped altogether once the token budget is exceeded, so the prompt sent to
+/api/chat stays bounded however long the conversation runs.
+"""
+
+import json
+import re
+from typing import Any, Dict, List
+
+_MCP_BLOCK_RE = re.compile(r"```mcp\s*\{.*?\}\s*```", re.DOTALL)
+_THINK_RE = re.compile(r"<think>.*?(</think>|$)", re.DOTALL)
+
+# Per-message overhead of the chat template (role markers, separators)
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(message: Dict[str, Any], chars_per_token: float = 4.0) -> int:
+    """Rough token count of a chat message, tool calls included."""
+    size = len(message.get("content") or "")
+    if message.get("tool_calls"):
+        size += len(json.dumps(message["tool_calls"], ensure_ascii=False))
+    return int(size / chars_per_token) + _MESSAGE_OVERHEAD_TOKENS
+
+
+def _shorten(text: str, max_chars: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + "..."
+
+
+class ChatHistory:
+    """Conversation history with a token budget.
+
+    A turn is the user message plus everything appended after it (assistant
+    replies, tool results, finalization prompts) until the next start_turn().
+    """
+
+    def __init__(self, system_prompt: str, max_tokens: int, keep_turns: int = 2,
+                 summary_chars: int = 300, max_notes: int = 2):
+        self.system_prompt = system_prompt
+        self.max_tokens = max_tokens
+        self.keep_turns = max(1, keep_turns)
+        self.summary_chars = summary_chars
+        self.max_notes = max_notes
+        self.notes: List[str] = []
+        self.turns: List[List[Dict[str, Any]]] = []
+        self.compacted_turns = 0
+        self.dropped_turns = 0
+
+    # --- Building the conversation ---
+    def set_system(self, content: str):
+        self.system_prompt = content
+
+    def add_note(self, content: str):
+        """System note such as a tool-list update; only the latest few are kept."""
+        self.notes = (self.notes + [content])[-self.max_notes:]
+
+    def start_turn(self, user_content: str):
+        self.turns.append([{"role": "user", "content": user_content}])
+
+    def append(self, message: Dict[str, Any]):
+        if not self.turns:
+            self.turns.append([])
+        self.turns[-1].append(message)
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    # --- Compaction ---
+    def _summarize(self, turn: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Question plus the last assistant text of a turn, without tool traffic."""
+        question = turn[0]["content"] if turn and turn[0].get("role") == "user" else ""
+        answer = ""
+        for message in reversed(turn):
+            if message.get("role") == "assistant":
+                answer = _THINK_RE.sub("", _MCP_BLOCK_RE.sub("", message.get("content") or "")).strip()
+                if answer:
+                    break
+        summary = [{"role": "user", "content": _shorten(question, self.summary_chars)}]
+        if answer:
+            summary.append({"role": "assistant", "content": _shorten(answer, self.summary_chars)})
+        return summary
+
+    def messages(self, max_tokens: int | None = None) -> List[Dict[str, Any]]:
+        """Messages to send: system prompt, notes, compacted older turns and recent turns.
+
+        Older turns are compacted first, then dropped oldest first, until the
+        estimate fits max_tokens. The current turn is always sent verbatim.
+        """
+        budget = self.max_tokens if max_tokens is None else max_tokens
+        head = [{"role": "system", "content": self.system_prompt}]
+        head += [{"role": "system", "content": note} for note in self.notes]
+        used = sum(estimate_tokens(message) for message in head)
+
+        older = max(0, len(self.turns) - self.keep_turns)
+        rendered = [self._summarize(turn) for turn in self.turns[:older]]
+        rendered += [list(turn) for turn in self.turns[older:]]
+        cost = [sum(estimate_tokens(message) for message in turn) for turn in rendered]
+        last = len(rendered) - 1
+
+        # Still too long: compact the recent turns too (never the current one), oldest first
+        compacted = older
+        while used + sum(cost) > budget and compacted < last:
+            rendered[compacted] = self._summarize(rendered[compacted])
+            cost[compacted] = sum(estimate_tokens(message) for message in rendered[compacted])
+            compacted += 1
+
+        # Then drop whole turns, oldest first
+        first = 0
+        while used + sum(cost[first:]) > budget and first < last:
+            first += 1
+
+        self.compacted_turns = compacted
+        self.dropped_turns = first
+        return head + [message for turn in rendered[first:] for message in turn]
+
+    def compact(self):
+        """Forgets turns that no longer fit in the budget (keeps memory bounded too)."""
+        self.messages()
+        if self.dropped_turns:
+            self.turns = self.turns[self.dropped_turns:]
+            self.dropped_turns = 0
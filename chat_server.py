@@ -0,0 +1,597 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Multi-user chat server around the ollama_bot turn loop.
+Every session has its own history. The system prompt, tool parsing, result
+formatting and answer cache come from ollama_bot. Ollama and the MCP HTTP
+client are called with async HTTP, so one process serves many sessions.
+Replies stream as Server-Sent Events or over a WebSocket. Model requests
+go through llm_scheduler, which queues them and spreads them over
+OLLAMA_HOSTS.
+
+Usage:
+    python mcp_server.py & python mcp_client.py &
+    python chat_server.py
+    python ollama_bot.py        # CLI client
+
+Endpoints:
+    POST   /sessions                        -> {"session_id"}
+    POST   /sessions/{id}/messages          {"content"} -> text/event-stream
+                                            (?stream=false: final JSON only)
+    WS     /sessions/{id}/ws                send {"content"}, receive events
+    GET    /sessions/{id}, DELETE /sessions/{id}, GET /health, GET /stats,
+    POST   /refresh-tools
+
+Events: pass {stage}, token {text}, pass_end, notice {text},
+tool_result {call, ok}, done {answer, cleaned, cached, llm_seconds}, error {error}.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import aclosing
+
+import httpx
+import uvicorn
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+# Load variables from .env before ollama_bot reads its settings
+load_dotenv()
+
+import ollama_bot as bot  # noqa: E402
+from answer_cache import AnswerCache  # noqa: E402
+from chat_history import ChatHistory  # noqa: E402
+from llm_scheduler import (  # noqa: E402
+    PRIORITY_FINALIZE,
+    PRIORITY_NEW_TURN,
+    LLMScheduler,
+    SchedulerOverloaded,
+)
+
+CHAT_SERVER_HOST = os.environ.get("CHAT_SERVER_HOST", "127.0.0.1")
+CHAT_SERVER_PORT = int(os.environ.get("CHAT_SERVER_PORT", "8002"))
+# Sessions idle for longer than this (seconds) are forgotten; at most CHAT_MAX_SESSIONS are kept
+CHAT_SESSION_TTL = float(os.environ.get("CHAT_SESSION_TTL", "1800"))
+CHAT_MAX_SESSIONS = int(os.environ.get("CHAT_MAX_SESSIONS", "1000"))
+# Pooled HTTP connections to Ollama and the MCP client
+CHAT_HTTP_CONNECTIONS = int(os.environ.get("CHAT_HTTP_CONNECTIONS", "200"))
+
+# LLM scheduler: Ollama hosts to balance over (comma separated, default OLLAMA_HOST), requests
+# in flight per host (match OLLAMA_NUM_PARALLEL), queue size and wait limit (seconds), and
+# ejection of failing hosts (after N consecutive failures, for S seconds; probe interval)
+OLLAMA_HOSTS = [host.strip() for host in os.environ.get("OLLAMA_HOSTS", bot.OLLAMA_HOST).split(",") if host.strip()]
+OLLAMA_MAX_INFLIGHT = int(os.environ.get("OLLAMA_MAX_INFLIGHT", "2"))
+OLLAMA_QUEUE_MAX = int(os.environ.get("OLLAMA_QUEUE_MAX", "256"))
+OLLAMA_QUEUE_TIMEOUT = float(os.environ.get("OLLAMA_QUEUE_TIMEOUT", "120"))
+OLLAMA_EJECT_AFTER = int(os.environ.get("OLLAMA_EJECT_AFTER", "3"))
+OLLAMA_EJECT_SECONDS = float(os.environ.get("OLLAMA_EJECT_SECONDS", "30"))
+OLLAMA_HEALTH_INTERVAL = float(os.environ.get("OLLAMA_HEALTH_INTERVAL", "10"))
+
+# Answer passes finish turns already in progress, so they go before new turns
+STAGE_PRIORITY = {"answer": PRIORITY_FINALIZE, "tools": PRIORITY_NEW_TURN}
+
+app = FastAPI(title="Ollama Chat Server")
+
+
+class MessageBody(BaseModel):
+    content: str
+
+
+class OllamaError(Exception):
+    """Ollama answered an /api/chat request with an HTTP error."""
+
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"Ollama HTTP {status_code}: {text}")
+        self.status_code = status_code
+
+
+# --- Async Ollama and MCP calls ---
+async def ollama_chat(client: httpx.AsyncClient, session_id: str, messages, stage: str, tools=None, **options):
+    """Async counterpart of ollama_bot.stream_chat: yields the decoded chunks of a streamed /api/chat.
+
+    The request waits for a backend slot from the scheduler. If the backend
+    fails before the first chunk (connection error, 5xx), it is retried once
+    on another backend. Closing the generator closes the response, which
+    stops the generation.
+    """
+    scheduler = app.state.scheduler
+    timeout = httpx.Timeout(30.0, read=None)
+    failed = None
+    for attempt in range(2 if len(scheduler.backends) > 1 else 1):
+        streamed = False
+        try:
+            async with scheduler.slot(session_id, STAGE_PRIORITY.get(stage, PRIORITY_NEW_TURN), failed) as backend:
+                # num_ctx follows the context size loaded on this backend
+                payload = bot.chat_payload(messages, stage, tools, host=backend.url, **options)
+                async with client.stream("POST", f"{backend.url}/api/chat", json=payload, timeout=timeout) as r:
+                    if r.status_code >= 400:
+                        await r.aread()
+                        raise OllamaError(r.status_code, r.text)
+                    async for line in r.aiter_lines():
+                        chunk = bot.read_chat_line(line)
+                        if chunk is None:
+                            continue
+                        streamed = True
+                        try:
+                            yield chunk
+                        except GeneratorExit:
+                            if not chunk.get("done"):
+                                raise
+                            break  # closed after the last chunk: a complete answer for the scheduler
+            return
+        except (httpx.TransportError, OllamaError) as e:
+            retryable = isinstance(e, httpx.TransportError) or e.status_code >= 500
+            if streamed or not retryable or attempt == 1 or len(scheduler.backends) == 1:
+                raise
+            failed = backend
+
+
+async def call_mcp(client: httpx.AsyncClient, call: dict) -> dict:
+    """Async counterpart of call_client_http / read_client_resource."""
+    if "uri" in call:
+        path, body = "/read_resource", {"uri": call["uri"]}
+    else:
+        path, body = "/call_tool", {"tool": call["tool"], "arguments": call["arguments"]}
+    try:
+        resp = await client.post(f"{bot.MCP_CLIENT_URL}{path}", json=body, timeout=30)
+        if resp.status_code != 200:
+            return {"ok": False, "error": f"HTTP {resp.status_code}: {resp.text}"}
+        return resp.json()
+    except Exception as e:
+        return {"ok": False, "error": repr(e)}
+
+
+class AsyncToolDispatcher:
+    """asyncio counterpart of ollama_bot.ToolDispatcher: one task per distinct call.
+
+    Calls start as soon as they are submitted; collect() waits for them until
+    the deadline, counted from the collect() call.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, deadline: float = bot.MCP_TURN_DEADLINE):
+        self.client = client
+        self.deadline = deadline
+        self._tasks = {}
+
+    def submit(self, call: dict):
+        key = bot.call_key(call)
+        if key in self._tasks:
+            return
+        self._tasks[key] = asyncio.create_task(call_mcp(self.client, call))
+
+    async def collect(self, calls: list[dict]) -> list[dict]:
+        """Results for calls (submitting any not started yet), in order."""
+        for call in calls:
+            self.submit(call)
+        tasks = [self._tasks[bot.call_key(call)] for call in calls]
+        if tasks:
+            await asyncio.wait(set(tasks), timeout=self.deadline)
+        self.cancel()
+        return [
+            task.result() if task.done() and not task.cancelled()
+            else {"ok": False, "error": f"Timed out after {self.deadline:g}s"}
+            for task in tasks
+        ]
+
+    def cancel(self):
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+
+
+# --- Sessions ---
+class Session:
+    """One conversation: history, tool protocol and a lock serializing its turns."""
+
+    def __init__(self, session_id: str, tool_names: list[str], tool_mode: str):
+        self.id = session_id
+        self.tool_names = tool_names
+        self.tool_mode = tool_mode
+        self.history = ChatHistory(
+            bot.build_system_prompt(tool_names, native=tool_mode == "native"),
+            bot.history_budget("answer"),
+            keep_turns=bot.HISTORY_KEEP_TURNS,
+            summary_chars=bot.HISTORY_SUMMARY_CHARS,
+        )
+        self.lock = asyncio.Lock()
+        self.created = self.last_used = time.time()
+        self.turns = 0
+
+    def info(self) -> dict:
+        return {
+            "session_id": self.id,
+            "tool_mode": self.tool_mode,
+            "turns": self.turns,
+            "busy": self.lock.locked(),
+            "created": self.created,
+            "last_used": self.last_used,
+        }
+
+
+def _event(name: str, **data) -> dict:
+    return {"event": name, "data": data}
+
+
+def _sse(event: dict) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+
+
+async def run_turn(session: Session, user_input: str):
+    """One chat turn as a stream of events; same flow as ollama_bot.run_local."""
+    state = app.state
+    client = state.http
+
+    # Tool list changes are announced to the session like in the CLI
+    tool_names = await asyncio.to_thread(bot.discover_tools)
+    if set(tool_names) != set(session.tool_names):
+        session.tool_names = tool_names
+        session.history.add_note(bot.tools_update_note(tool_names, text_mode=session.tool_mode == "text"))
+
+    # Older turns are compacted or forgotten so the prompt stays inside NUM_CTX
+    session.history.compact()
+    session.history.start_turn(user_input)
+    session.turns += 1
+    state.stats["turns"] += 1
+
+    # Answer cache: near-duplicate of a past question grounded on unchanged data?
+    # Only a session's first turn (no history to depend on) is shared with other
+    # sessions; later answers are cached for this session alone
+    cache = state.answer_cache
+    cache_scope = None if session.turns == 1 else session.id
+    question_vec = rag_status = None
+    if cache is not None:
+        # The embedding runs on a scheduled Ollama backend like the chat passes;
+        # a saturated queue just skips the cache
+        try:
+            async with state.scheduler.slot(session.id, PRIORITY_NEW_TURN) as backend:
+                question_vec = await asyncio.to_thread(cache.embed, user_input, host=backend.url)
+        except SchedulerOverloaded:
+            question_vec = None
+        rag_status = await asyncio.to_thread(bot.fetch_rag_status)
+        # Scanning (and maybe rewriting the cache file) stays off the event loop
+        hit = await asyncio.to_thread(cache.lookup, question_vec, rag_status, session.id)
+        if hit is not None:
+            entry, similarity = hit
+            session.history.append({"role": "assistant", "content": entry["answer"]})
+            yield _event("pass", stage="cache")
+            yield _event("token", text=entry["answer"])
+            yield _event("pass_end")
+            yield _event("notice", text=f"answer cache hit: similarity {similarity:.2f}, "
+                                        f"saved ~{entry.get('llm_seconds', 0.0):.1f}s of LLM time")
+            yield _event("done", answer=entry["answer"], cleaned=False, cached=True, llm_seconds=0.0)
+            return
+
+    # First model response, parsed while it streams: complete ```mcp blocks and
+    # native tool_calls are dispatched right away (MCP_EARLY_DISPATCH)
+    parser = bot.McpBlockParser()
+    dispatcher = AsyncToolDispatcher(client)
+    native_raw, native_calls = [], []
+
+    def dispatch_early(call):
+        if bot.MCP_EARLY_DISPATCH and ("uri" in call or call["tool"] in session.tool_names):
+            dispatcher.submit(call)
+
+    async def model_pass(messages, stage, tools, out, stats=None, first=False, **options):
+        yield _event("pass", stage=stage)
+        async with aclosing(ollama_chat(client, session.id, messages, stage, tools, **options)) as chunks:
+            async for chunk in chunks:
+                msg = chunk.get("message") or {}
+                for raw in msg.get("tool_calls") or []:
+                    native_raw.append(raw)
+                    call = bot.native_tool_call(raw)
+                    if call is not None:
+                        native_calls.append(call)
+                        dispatch_early(call)
+                delta = msg.get("content", "")
+                if delta:
+                    out.append(delta)
+                    yield _event("token", text=delta)
+                    if first:
+                        for call in parser.feed(delta):
+                            dispatch_early(call)
+                        if bot.MCP_EARLY_STOP and parser.should_stop():
+                            break
+                if chunk.get("done"):
+                    if stats is not None:
+                        stats.update({key: value for key, value in chunk.items() if key != "message"})
+                    break
+        yield _event("pass_end")
+
+    async def first_pass(tools, out):
+        # Tool-decision pass with the tight "tools" budget, continued with the
+        # "answer" budget when it runs out before any tool call
+        messages = session.history.messages(bot.history_budget("tools", tools))
+        stats = {}
+        async for event in model_pass(messages, "tools", tools, out, stats, first=True):
+            yield event
+        remaining = bot.STAGE_PROFILES["answer"]["num_predict"] - bot.STAGE_PROFILES["tools"]["num_predict"]
+        if stats.get("done_reason") == "length" and not parser.calls and not native_calls and remaining > 0:
+            continued = messages + [{"role": "assistant", "content": "".join(out)}]
+            async for event in model_pass(continued, "answer", tools, out, first=True, num_predict=remaining):
+                yield event
+
+    try:
+        llm_started = time.perf_counter()
+        native_tools = None
+        if session.tool_mode == "native":
+            native_tools = await asyncio.to_thread(bot.native_tools_for, session.tool_names)
+        out = []
+        try:
+            async for event in first_pass(native_tools, out):
+                yield event
+        except OllamaError as e:
+            if native_tools is None or e.status_code != 400:
+                raise
+            # Model without tool support: this and new sessions use the ```mcp text protocol
+            yield _event("notice", text=f"native tools not supported by {bot.MODEL}: using the text tool protocol")
+            session.tool_mode = state.tool_mode = "text"
+            session.history.set_system(bot.build_system_prompt(session.tool_names))
+            out = []
+            async for event in first_pass(None, out):
+                yield event
+        assistant_text = "".join(out)
+        llm_seconds = time.perf_counter() - llm_started
+        assistant_message = {"role": "assistant", "content": assistant_text}
+        if native_raw:
+            assistant_message["tool_calls"] = native_raw
+        session.history.append(assistant_message)
+
+        # Tool calls and resource reads of the turn, then the final answer
+        turn_calls = parser.calls + native_calls
+        calls = bot.plan_calls(turn_calls, session.tool_names)
+        dispatched = await dispatcher.collect(calls)
+        for call, result in zip(calls, dispatched):
+            yield _event("tool_result", call=call, ok=bool(result.get("ok")))
+        results, cacheable, grounded_sources = bot.format_results(turn_calls, dispatched, session.tool_names)
+
+        cleaned = False
+        if results:
+            session.history.extend(bot.finalization_messages(results, native=bool(native_calls)))
+            out = []
+            llm_started = time.perf_counter()
+            messages = session.history.messages(bot.history_budget("answer"))
+            async for event in model_pass(messages, "answer", None, out):
+                yield event
+            llm_seconds += time.perf_counter() - llm_started
+            assistant_text = "".join(out)
+            session.history.append({"role": "assistant", "content": assistant_text})
+            # Filter any remaining MCP blocks in output (not in memory)
+            final_answer = bot.TOOL_BLOCK_RE.sub("", assistant_text).strip()
+            cleaned = bot.TOOL_BLOCK_RE.search(assistant_text) is not None
+        else:
+            final_answer = assistant_text
+
+        if cache is not None and cacheable and not bot.TOOL_BLOCK_RE.search(final_answer):
+            await asyncio.to_thread(cache.store, user_input, question_vec, final_answer, rag_status,
+                                    sorted(grounded_sources), llm_seconds, cache_scope)
+        yield _event("done", answer=final_answer, cleaned=cleaned, cached=False,
+                     llm_seconds=round(llm_seconds, 3))
+    finally:
+        dispatcher.cancel()
+
+
+async def turn_events(session: Session, user_input: str):
+    """run_turn() under the session lock; failures become an error event."""
+    async with session.lock:
+        session.last_used = time.time()
+        try:
+            async for event in run_turn(session, user_input):
+                yield event
+        except Exception as e:
+            app.state.stats["errors"] += 1
+            yield _event("error", error=f"{type(e).__name__}: {e}")
+        finally:
+            session.last_used = time.time()
+
+
+def _get_session(session_id: str) -> Session:
+    session = app.state.sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown session: {session_id}")
+    return session
+
+
+async def _forget_session(session_id: str):
+    """Removes a session together with its private answer cache entries."""
+    app.state.sessions.pop(session_id, None)
+    if app.state.answer_cache is not None:
+        await asyncio.to_thread(app.state.answer_cache.forget, session_id)
+
+
+async def _expire_sessions():
+    while True:
+        await asyncio.sleep(min(60.0, CHAT_SESSION_TTL))
+        now = time.time()
+        for session_id, session in list(app.state.sessions.items()):
+            if not session.lock.locked() and now - session.last_used > CHAT_SESSION_TTL:
+                await _forget_session(session_id)
+                app.state.stats["sessions_expired"] += 1
+
+
+# --- Lifecycle ---
+@app.on_event("startup")
+async def startup():
+    state = app.state
+    state.http = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=CHAT_HTTP_CONNECTIONS, max_keepalive_connections=CHAT_HTTP_CONNECTIONS),
+        timeout=30,
+    )
+    state.scheduler = LLMScheduler(
+        OLLAMA_HOSTS,
+        max_inflight=OLLAMA_MAX_INFLIGHT,
+        max_queue=OLLAMA_QUEUE_MAX,
+        queue_timeout=OLLAMA_QUEUE_TIMEOUT,
+        eject_after=OLLAMA_EJECT_AFTER,
+        eject_seconds=OLLAMA_EJECT_SECONDS,
+        health_interval=OLLAMA_HEALTH_INTERVAL,
+    )
+    state.sessions = {}
+    state.stats = {"sessions_created": 0, "sessions_expired": 0, "turns": 0, "errors": 0, "rejected": 0}
+    state.tool_mode = bot.TOOL_MODE if bot.TOOL_MODE in {"native", "text"} else "text"
+    state.tool_names = await asyncio.to_thread(bot.discover_tools, True)
+    await asyncio.to_thread(bot.discover_resources, True)
+    state.answer_cache = None
+    if bot.ANSWER_CACHE_ENABLED:
+        state.answer_cache = AnswerCache(
+            bot.embed_text,
+            threshold=bot.ANSWER_CACHE_THRESHOLD,
+            max_entries=bot.ANSWER_CACHE_MAX,
+            ttl=bot.ANSWER_CACHE_TTL,
+            path=bot.ANSWER_CACHE_FILE or None,
+        )
+
+    # Cold start: load the model and prime the system prompt before the first customer
+    if bot.OLLAMA_WARMUP:
+        native_tools = None
+        if state.tool_mode == "native":
+            native_tools = await asyncio.to_thread(bot.native_tools_for, state.tool_names)
+        system_prompt = bot.build_system_prompt(state.tool_names, native=state.tool_mode == "native")
+
+        async def warm(host):
+            try:
+                timings = await asyncio.to_thread(bot.warm_up, system_prompt, native_tools, host)
+                print(f"Warm-up of {bot.MODEL} on {host}: {timings}")
+            except Exception as e:
+                print(f"Warm-up on {host} failed: {e}")
+
+        await asyncio.gather(*(warm(host) for host in OLLAMA_HOSTS))
+    state.keep_warm_stop = threading.Event()
+    if bot.OLLAMA_KEEP_WARM_INTERVAL > 0:
+        threading.Thread(target=bot.keep_warm, args=(state.keep_warm_stop, bot.OLLAMA_KEEP_WARM_INTERVAL, OLLAMA_HOSTS),
+                         name="ollama-keep-warm", daemon=True).start()
+    state.expiry_task = asyncio.create_task(_expire_sessions())
+    state.health_task = asyncio.create_task(state.scheduler.run_health_checks(state.http))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.expiry_task.cancel()
+    app.state.health_task.cancel()
+    app.state.keep_warm_stop.set()
+    await app.state.http.aclose()
+
+
+# --- Endpoints ---
+@app.get("/health")
+async def health():
+    backends = app.state.scheduler.stats()["backends"]
+    return {"ok": any(backend["healthy"] for backend in backends), "model": bot.MODEL,
+            "sessions": len(app.state.sessions), "tool_mode": app.state.tool_mode,
+            "tools": app.state.tool_names, "backends": backends}
+
+
+@app.get("/stats")
+async def stats():
+    sessions = app.state.sessions
+    cache = app.state.answer_cache
+    return {
+        **app.state.stats,
+        "sessions": len(sessions),
+        "busy_sessions": sum(1 for session in sessions.values() if session.lock.locked()),
+        "answer_cache": cache.stats() if cache is not None else None,
+        "scheduler": app.state.scheduler.stats(),
+    }
+
+
+@app.post("/refresh-tools")
+async def refresh_tools():
+    """Reloads the tool and resource listings; sessions pick up changes on their next turn."""
+    app.state.tool_names = await asyncio.to_thread(bot.discover_tools, False, True)
+    await asyncio.to_thread(bot.discover_resources, False, True)
+    return {"tools": app.state.tool_names}
+
+
+@app.post("/sessions")
+async def create_session():
+    sessions = app.state.sessions
+    if len(sessions) >= CHAT_MAX_SESSIONS:
+        # Make room by forgetting the least recently used idle session
+        idle = [session for session in sessions.values() if not session.lock.locked()]
+        if not idle:
+            raise HTTPException(status_code=503, detail="Too many active sessions")
+        await _forget_session(min(idle, key=lambda session: session.last_used).id)
+        app.state.stats["sessions_expired"] += 1
+    session = Session(uuid.uuid4().hex, app.state.tool_names, app.state.tool_mode)
+    sessions[session.id] = session
+    app.state.stats["sessions_created"] += 1
+    return {"session_id": session.id}
+
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    return _get_session(session_id).info()
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    _get_session(session_id)
+    await _forget_session(session_id)
+    return {"ok": True}
+
+
+@app.post("/sessions/{session_id}/messages")
+async def post_message(session_id: str, body: MessageBody, stream: bool = True):
+    """Runs one turn; streams its events as SSE, or returns the final answer with stream=false."""
+    session = _get_session(session_id)
+    content = body.content.strip()
+    if not content:
+        raise HTTPException(status_code=400, detail="Empty message")
+    if session.lock.locked():
+        raise HTTPException(status_code=409, detail="A reply is already being generated for this session")
+    if app.state.scheduler.saturated():
+        app.state.stats["rejected"] += 1
+        raise HTTPException(status_code=503, detail="Too many requests waiting for the model, retry later",
+                            headers={"Retry-After": "5"})
+
+    if not stream:
+        final = None
+        async for event in turn_events(session, content):
+            if event["event"] in {"done", "error"}:
+                final = event
+        if final is None or final["event"] == "error":
+            error = (final or {}).get("data", {}).get("error", "No answer")
+            status = 503 if error.startswith(SchedulerOverloaded.__name__) else 502
+            raise HTTPException(status_code=status, detail=error)
+        return final["data"]
+
+    async def events():
+        async for event in turn_events(session, content):
+            yield _sse(event)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.websocket("/sessions/{session_id}/ws")
+async def session_ws(websocket: WebSocket, session_id: str):
+    """Chat over a WebSocket: each {"content": ...} message runs a turn, events come back as JSON."""
+    session = app.state.sessions.get(session_id)
+    if session is None:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                data = json.loads(message)
+                content = data.get("content", "") if isinstance(data, dict) else str(data)
+            except json.JSONDecodeError:
+                content = message
+            if not content.strip():
+                continue
+            async for event in turn_events(session, content.strip()):
+                await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=CHAT_SERVER_HOST, port=CHAT_SERVER_PORT, reload=False)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Persistent, content-addressed embedding store.
+Vectors are keyed by sha256(model name + chunk text) and kept on disk as an
+append-only memory-mapped float16/float32 matrix plus an index file with one
+key per row, so restarts and rebuilds only run the model on new text.
+
+Layout inside the store directory, per embedding model:
+- <model>.vec: raw row-major vectors
+- <model>.idx: one hex key per line, line N -> row N
+- <model>.json: {"model", "dim", "dtype"}
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+try:
+    import fcntl  # POSIX only: serializes appends between processes
+except ImportError:  # Windows
+    fcntl = None
+
+
+def content_key(model: str, text: str) -> str:
+    """Content address of a chunk for a given embedding model."""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """Append-only on-disk embedding store for one embedding model."""
+
+    def __init__(self, directory: Path, model: str, dtype: str = "float16"):
+        self.directory = Path(directory)
+        self.model = model
+        self.dtype = np.dtype(dtype)
+        self.dim = 0
+        self.hits = 0
+        self.misses = 0
+
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model)
+        self._vec_path = self.directory / f"{slug}.vec"
+        self._idx_path = self.directory / f"{slug}.idx"
+        self._meta_path = self.directory / f"{slug}.json"
+        self._lock_path = self.directory / f"{slug}.lock"
+
+        self._rows: Dict[str, int] = {}
+        self._row_count = 0
+        self._idx_pos = 0
+        self._mmap = None
+        self._lock = threading.Lock()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self._meta_path.exists():
+            meta = json.loads(self._meta_path.read_text(encoding="utf-8"))
+            if meta.get("dtype") != self.dtype.name:
+                # Stored with another dtype: keep reading it as it was written
+                self.dtype = np.dtype(meta["dtype"])
+            self.dim = int(meta.get("dim", 0))
+        with self._lock:
+            self._refresh()
+
+    # --- Index and mapping ---
+    def _refresh(self):
+        """Loads index lines appended since the last refresh (also by other processes)."""
+        if not self._idx_path.exists():
+            return
+        with open(self._idx_path, "r", encoding="ascii") as f:
+            f.seek(self._idx_pos)
+            while True:
+                line = f.readline()
+                if not line.endswith("\n"):
+                    break  # missing or partially written last line
+                self._rows.setdefault(line.strip(), self._row_count)
+                self._row_count += 1
+                self._idx_pos = f.tell()
+
+    def _vectors(self):
+        """Memory-maps the vector file, remapping when it has grown."""
+        if not self.dim or not self._vec_path.exists():
+            return None
+        row_bytes = self.dim * self.dtype.itemsize
+        rows = self._vec_path.stat().st_size // row_bytes
+        if self._mmap is None or self._mmap.shape[0] < rows:
+            self._mmap = np.memmap(self._vec_path, dtype=self.dtype, mode="r", shape=(rows, self.dim))
+        return self._mmap
+
+    def _lock_file(self):
+        handle = open(self._lock_path, "a")
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    # --- Public API ---
+    def get_many(self, texts: List[str]) -> List[List[float] | None]:
+        """Returns the stored vector for each text, or None where it is missing."""
+        keys = [content_key(self.model, text) for text in texts]
+        with self._lock:
+            if any(key not in self._rows for key in keys):
+                self._refresh()
+            vectors = self._vectors()
+            results = []
+            for key in keys:
+                row = self._rows.get(key)
+                if vectors is None or row is None or row >= vectors.shape[0]:
+                    results.append(None)
+                    self.misses += 1
+                else:
+                    results.append(np.asarray(vectors[row], dtype=np.float32).tolist())
+                    self.hits += 1
+            return results
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]):
+        """Appends vectors for texts not stored yet."""
+        if not texts:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            lock_handle = self._lock_file()
+            try:
+                self._refresh()
+                if not self.dim:
+                    self.dim = int(matrix.shape[1])
+                    self._meta_path.write_text(
+                        json.dumps({"model": self.model, "dim": self.dim, "dtype": self.dtype.name}),
+                        encoding="utf-8",
+                    )
+                elif matrix.shape[1] != self.dim:
+                    raise ValueError(f"Embedding dimension {matrix.shape[1]} != stored dimension {self.dim}")
+
+                new_keys, new_rows = [], []
+                for text, vector in zip(texts, matrix):
+                    key = content_key(self.model, text)
+                    if key in self._rows or key in new_keys:
+                        continue
+                    new_keys.append(key)
+                    new_rows.append(vector)
+                if not new_keys:
+                    return
+
+                # Vectors first, then the index: a crash in between only leaves unreferenced rows
+                row_bytes = self.dim * self.dtype.itemsize
+                with open(self._vec_path, "ab") as f:
+                    # Realign if an earlier append was cut short
+                    f.truncate(self._row_count * row_bytes)
+                    f.write(np.asarray(new_rows, dtype=self.dtype).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                with open(self._idx_path, "a", encoding="ascii") as f:
+                    f.write("".join(f"{key}\n" for key in new_keys))
+                self._refresh()
+            finally:
+                lock_handle.close()
+
+    def embed(self, texts: List[str], embed_fn: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        """Returns vectors for texts, running embed_fn only on texts not in the store."""
+        vectors = self.get_many(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = embed_fn([texts[i] for i in missing])
+            self.put_many([texts[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        return vectors
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "path": str(self._vec_path),
+            "model": self.model,
+            "dtype": self.dtype.name,
+            "vectors": len(self._rows),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Local stand-in for the Brave Search API, for tests and benchmarks.
+Serves /res/v1/web/search with deterministic results and configurable
+latency and failures, and counts the requests it receives.
+
+Usage:
+    python fake_brave_server.py --port 8010 --latency-ms 300 --fail-rate 0.2
+    export BRAVE_API_URL=http://127.0.0.1:8010/res/v1/web/search
+    export BRAVE_API_KEY=fake
+    python mcp_server.py
+
+GET /stats returns the request counters; POST /reset clears them.
+"""
+
+import argparse
+import asyncio
+import random
+
+import uvicorn
+from fastapi import FastAPI, Header, Query
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Fake Brave Search API")
+
+# Set from the command line in __main__
+SETTINGS = {"latency_ms": 200.0, "fail_rate": 0.0, "fail_first": 0, "rate_limit_every": 0}
+COUNTERS = {"requests": 0, "served": 0, "failed": 0, "rate_limited": 0, "queries": {}}
+
+
+def _results(q: str, count: int):
+    return [
+        {
+            "title": f"{q} - result {i + 1}",
+            "url": f"https://example.com/{i + 1}?q={q.replace(' ', '+')}",
+            "description": f"Fake <strong>{q}</strong> description {i + 1}.",
+            "meta_url": {"hostname": "example.com"},
+            "profile": {"name": "Example"},
+        }
+        for i in range(count)
+    ]
+
+
+@app.get("/res/v1/web/search")
+async def web_search(
+    q: str = Query(...),
+    count: int = Query(10),
+    country: str | None = None,
+    search_lang: str | None = None,
+    safesearch: str | None = None,
+    x_subscription_token: str | None = Header(None),
+):
+    COUNTERS["requests"] += 1
+    COUNTERS["queries"][q] = COUNTERS["queries"].get(q, 0) + 1
+    if not x_subscription_token:
+        return JSONResponse({"error": "missing X-Subscription-Token"}, status_code=401)
+
+    await asyncio.sleep(SETTINGS["latency_ms"] / 1000.0)
+
+    every = SETTINGS["rate_limit_every"]
+    if every and COUNTERS["requests"] % every == 0:
+        COUNTERS["rate_limited"] += 1
+        return JSONResponse({"error": "rate limited"}, status_code=429, headers={"Retry-After": "0.1"})
+    if COUNTERS["requests"] <= SETTINGS["fail_first"] or random.random() < SETTINGS["fail_rate"]:
+        COUNTERS["failed"] += 1
+        return JSONResponse({"error": "unavailable"}, status_code=503)
+
+    COUNTERS["served"] += 1
+    return {
+        "query": {"original": q, "country": country, "search_lang": search_lang, "safesearch": safesearch},
+        "web": {"results": _results(q, max(0, min(count, 20)))},
+    }
+
+
+@app.get("/stats")
+async def stats():
+    return COUNTERS
+
+
+@app.post("/reset")
+async def reset():
+    COUNTERS.update({"requests": 0, "served": 0, "failed": 0, "rate_limited": 0, "queries": {}})
+    return {"ok": True}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Brave Search API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--latency-ms", type=float, default=SETTINGS["latency_ms"], help="delay per request")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--fail-first", type=int, default=0, help="answer the first N requests with 503")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="answer every Nth request with 429")
+    args = parser.parse_args()
+
+    SETTINGS.update(
+        latency_ms=args.latency_ms,
+        fail_rate=args.fail_rate,
+        fail_first=args.fail_first,
+        rate_limit_every=args.rate_limit_every,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
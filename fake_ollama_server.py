@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Local stand-in for an Ollama server, for load tests of the chat server.
+Streams /api/chat replies as NDJSON. The time to first token, the token rate
+and the number of requests served in parallel are configurable; extra
+requests queue like in Ollama. It can emit native tool calls and fail a
+share of the requests. /api/generate (model load), /api/embed, /api/version
+and /api/tags are enough for the warm-up, the answer cache and the health
+probes.
+
+Usage:
+    python fake_ollama_server.py --port 11501 --parallel 2 --tokens-per-second 40 &
+    python fake_ollama_server.py --port 11502 --parallel 2 --tokens-per-second 40 &
+    export OLLAMA_HOSTS=http://127.0.0.1:11501,http://127.0.0.1:11502
+    python chat_server.py
+
+GET /stats returns the request counters; POST /reset clears them.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Fake Ollama API")
+
+# Set from the command line in __main__
+SETTINGS = {
+    "ttft_ms": 150.0,
+    "tokens_per_second": 40.0,
+    "reply_tokens": 60,
+    "parallel": 2,
+    "fail_rate": 0.0,
+    "tool_calls": True,
+}
+COUNTERS = {"requests": 0, "served": 0, "failed": 0, "active": 0, "max_active": 0, "queued_max": 0, "tokens": 0}
+_slots: asyncio.Semaphore | None = None
+_waiting = 0
+
+
+def _slots_semaphore() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(max(1, SETTINGS["parallel"]))
+    return _slots
+
+
+def _reply_words(messages) -> list[str]:
+    question = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+    seed = " ".join(question.split()[:8]) or "your question"
+    words = f"This is a fake answer about {seed}.".split()
+    filler = "The restaurant is open every day and the menu changes with the season.".split()
+    while len(words) < SETTINGS["reply_tokens"]:
+        words += filler
+    return words[:SETTINGS["reply_tokens"]]
+
+
+def _wants_tool_call(body: dict) -> bool:
+    messages = body.get("messages") or []
+    return bool(SETTINGS["tool_calls"] and body.get("tools") and messages and messages[-1].get("role") == "user")
+
+
+@app.post("/api/chat")
+async def chat(body: dict):
+    COUNTERS["requests"] += 1
+    if random.random() < SETTINGS["fail_rate"]:
+        COUNTERS["failed"] += 1
+        return JSONResponse({"error": "fake failure"}, status_code=500)
+
+    options = body.get("options") or {}
+    num_predict = int(options.get("num_predict") or 0) or None
+    model = body.get("model", "fake")
+
+    if _wants_tool_call(body):
+        tool = body["tools"][0]["function"]["name"]
+        words, tool_calls = [], [{"function": {"name": tool, "arguments": {}}}]
+    else:
+        words, tool_calls = _reply_words(body.get("messages") or []), []
+    truncated = num_predict is not None and len(words) > num_predict
+    words = words[:num_predict] if num_predict else words
+
+    def chunk(message: dict, done: bool, **extra) -> str:
+        return json.dumps({"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                           "message": {"role": "assistant", **message}, "done": done, **extra}) + "\n"
+
+    async def stream():
+        # The slot is taken and given back inside the generator: a client that
+        # disconnects before the body is iterated never holds one
+        global _waiting
+        semaphore = _slots_semaphore()
+        _waiting += 1
+        COUNTERS["queued_max"] = max(COUNTERS["queued_max"], _waiting)
+        try:
+            await semaphore.acquire()
+        finally:
+            _waiting -= 1
+        COUNTERS["active"] += 1
+        COUNTERS["max_active"] = max(COUNTERS["max_active"], COUNTERS["active"])
+        started = time.perf_counter()
+        try:
+            await asyncio.sleep(SETTINGS["ttft_ms"] / 1000.0)
+            if tool_calls:
+                yield chunk({"content": "", "tool_calls": tool_calls}, False)
+            delay = 1.0 / SETTINGS["tokens_per_second"] if SETTINGS["tokens_per_second"] > 0 else 0.0
+            for index, word in enumerate(words):
+                if index:
+                    await asyncio.sleep(delay)
+                COUNTERS["tokens"] += 1
+                yield chunk({"content": word + " "}, False)
+            COUNTERS["served"] += 1
+            yield chunk({"content": ""}, True, done_reason="length" if truncated else "stop",
+                        total_duration=int((time.perf_counter() - started) * 1e9),
+                        prompt_eval_count=sum(len(m.get("content") or "") for m in body.get("messages") or []) // 4,
+                        eval_count=len(words))
+        finally:
+            COUNTERS["active"] -= 1
+            semaphore.release()
+
+    if body.get("stream") is False:
+        text = []
+        async for line in stream():
+            data = json.loads(line)
+            text.append(data["message"]["content"])
+        return {**data, "message": {"role": "assistant", "content": "".join(text), "tool_calls": tool_calls}}
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.post("/api/generate")
+async def generate(body: dict):
+    # Only model loads (no prompt) are simulated
+    return {"model": body.get("model", "fake"), "response": "", "done": True, "done_reason": "load"}
+
+
+@app.post("/api/embed")
+async def embed(body: dict):
+    inputs = body.get("input")
+    inputs = inputs if isinstance(inputs, list) else [inputs or ""]
+
+    def vector(text: str) -> list[float]:
+        digest = hashlib.sha256(" ".join(text.lower().split()).encode("utf-8")).digest()
+        return [(byte - 128) / 128.0 for byte in digest]
+
+    return {"model": body.get("model", "fake"), "embeddings": [vector(text) for text in inputs]}
+
+
+@app.get("/api/version")
+async def version():
+    return {"version": "0.0.0-fake"}
+
+
+@app.get("/api/tags")
+async def tags():
+    return {"models": [{"name": "fake:latest"}]}
+
+
+@app.get("/stats")
+async def stats():
+    return COUNTERS
+
+
+@app.post("/reset")
+async def reset():
+    COUNTERS.update({"requests": 0, "served": 0, "failed": 0, "max_active": 0, "queued_max": 0, "tokens": 0})
+    return {"ok": True}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake streaming Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--ttft-ms", type=float, default=SETTINGS["ttft_ms"], help="delay before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=SETTINGS["tokens_per_second"])
+    parser.add_argument("--reply-tokens", type=int, default=SETTINGS["reply_tokens"], help="words per answer")
+    parser.add_argument("--parallel", type=int, default=SETTINGS["parallel"],
+                        help="requests generated at once (like OLLAMA_NUM_PARALLEL); the rest queue")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of chat requests answered with 500")
+    parser.add_argument("--no-tool-calls", action="store_true", help="never emit native tool calls")
+    args = parser.parse_args()
+
+    SETTINGS.update(
+        ttft_ms=args.ttft_ms,
+        tokens_per_second=args.tokens_per_second,
+        reply_tokens=args.reply_tokens,
+        parallel=args.parallel,
+        fail_rate=args.fail_rate,
+        tool_calls=not args.no_tool_calls,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
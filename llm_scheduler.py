@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Admission control and load balancing for LLM requests of the chat server.
+A request waits in a bounded queue until an Ollama backend has a free slot
+(max_inflight requests per backend). Finalization passes are admitted before
+new turns, and within a priority the sessions take turns, so a busy session
+cannot starve the others. An admitted request goes to the healthy backend
+with the fewest outstanding requests. A backend is ejected for a while after
+repeated failures or a failed health probe.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
+
+import httpx
+
+# Priorities, best first
+PRIORITY_FINALIZE = 0  # answer passes of turns already in progress
+PRIORITY_NEW_TURN = 1  # tool-decision passes that start a turn
+
+
+class SchedulerOverloaded(Exception):
+    """The queue is full, or a request found no free backend slot before its timeout."""
+
+
+def _is_backend_failure(e: BaseException) -> bool:
+    """Connection problems and 5xx answers count against a backend; other errors do not."""
+    if isinstance(e, (httpx.TransportError, ConnectionError)):
+        return True
+    return getattr(e, "status_code", 0) >= 500
+
+
+class Backend:
+    """One Ollama host and its load."""
+
+    def __init__(self, url: str, max_inflight: int):
+        self.url = url.rstrip("/")
+        self.max_inflight = max(1, max_inflight)
+        self.outstanding = 0
+        self.failures = 0  # consecutive
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+
+    def ejected(self, now: float) -> bool:
+        return self.ejected_until > now
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "outstanding": self.outstanding,
+            "max_inflight": self.max_inflight,
+            "healthy": not self.ejected(now),
+            "ejected_for": round(max(0.0, self.ejected_until - now), 1),
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+        }
+
+
+class _Waiter:
+    __slots__ = ("future", "session_id", "priority", "avoid", "enqueued")
+
+    def __init__(self, future: asyncio.Future, session_id: str, priority: int, avoid: "Backend | None"):
+        self.future = future
+        self.session_id = session_id
+        self.priority = priority
+        self.avoid = avoid  # backend that just failed this request (a retry)
+        self.enqueued = time.monotonic()
+
+
+class LLMScheduler:
+    """Bounded, fair, priority queue in front of a pool of Ollama backends (asyncio, single loop)."""
+
+    def __init__(
+        self,
+        hosts: List[str],
+        max_inflight: int = 2,
+        max_queue: int = 256,
+        queue_timeout: float = 120.0,
+        eject_after: int = 3,
+        eject_seconds: float = 30.0,
+        health_interval: float = 10.0,
+    ):
+        if not hosts:
+            raise ValueError("LLMScheduler needs at least one backend host")
+        self.backends = [Backend(host, max_inflight) for host in hosts]
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.eject_after = max(1, eject_after)
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        # Per priority: session_id -> its waiting requests; sessions are served round-robin
+        self._queues: List["OrderedDict[str, deque]"] = [OrderedDict(), OrderedDict()]
+        self._queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.max_wait = 0.0
+
+    # --- Admission ---
+    def saturated(self) -> bool:
+        """True when new requests would be rejected right away."""
+        return self._queued >= self.max_queue
+
+    def _pick_backend(self, avoid: Backend | None = None) -> Backend | None:
+        """Healthy backend with a free slot and the fewest outstanding requests (avoid only if it is the sole one)."""
+        now = time.monotonic()
+        free = [b for b in self.backends if not b.ejected(now) and b.outstanding < b.max_inflight]
+        if avoid is not None and len(free) > 1:
+            free = [b for b in free if b is not avoid]
+        return min(free, key=lambda b: b.outstanding / b.max_inflight, default=None)
+
+    def _next_waiter(self) -> _Waiter | None:
+        for queue in self._queues:
+            while queue:
+                session_id, waiters = next(iter(queue.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    queue.move_to_end(session_id)
+                else:
+                    del queue[session_id]
+                self._queued -= 1
+                if not waiter.future.done():
+                    return waiter
+        return None
+
+    def _dispatch(self):
+        """Hands free backend slots to waiting requests."""
+        while self._queued:
+            if self._pick_backend() is None:
+                return
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            backend = self._pick_backend(waiter.avoid)
+            backend.outstanding += 1
+            waiter.future.set_result(backend)
+
+    def _abandon(self, waiter: _Waiter):
+        """Takes a timed-out or cancelled request out of the queue (returning a slot it got meanwhile)."""
+        if waiter.future.done() and not waiter.future.cancelled():
+            self.release(waiter.future.result(), None)
+            return
+        waiter.future.cancel()
+        queue = self._queues[waiter.priority]
+        waiters = queue.get(waiter.session_id)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self._queued -= 1
+            if not waiters:
+                del queue[waiter.session_id]
+
+    async def acquire(self, session_id: str, priority: int = PRIORITY_NEW_TURN,
+                      avoid: Backend | None = None) -> Backend:
+        """Waits for a backend slot; release() it when done (or use slot())."""
+        if not self._queued:
+            backend = self._pick_backend(avoid)
+            if backend is not None:
+                backend.outstanding += 1
+                self.admitted += 1
+                return backend
+        if self.saturated():
+            self.rejected += 1
+            raise SchedulerOverloaded(f"LLM queue full ({self.max_queue} requests waiting)")
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), session_id, priority, avoid)
+        self._queues[priority].setdefault(session_id, deque()).append(waiter)
+        self._queued += 1
+        try:
+            done, _ = await asyncio.wait({waiter.future}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if not done:
+            self._abandon(waiter)
+            self.timeouts += 1
+            raise SchedulerOverloaded(f"No LLM backend slot within {self.queue_timeout:g}s")
+        self.admitted += 1
+        self.max_wait = max(self.max_wait, time.monotonic() - waiter.enqueued)
+        return waiter.future.result()
+
+    def release(self, backend: Backend, ok: bool | None):
+        """Frees a slot; ok=False counts a failure against the backend, None is neutral."""
+        backend.outstanding -= 1
+        if ok is True:
+            backend.requests += 1
+            backend.failures = 0
+        elif ok is False:
+            backend.requests += 1
+            backend.errors += 1
+            backend.failures += 1
+            if backend.failures >= self.eject_after and not backend.ejected(time.monotonic()):
+                self._eject(backend, f"{backend.failures} consecutive failures")
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, session_id: str, priority: int = PRIORITY_NEW_TURN, avoid: Backend | None = None):
+        """async with scheduler.slot(session_id, priority) as backend: ... (released on exit)."""
+        backend = await self.acquire(session_id, priority, avoid)
+        ok: bool | None = True
+        try:
+            yield backend
+        except (GeneratorExit, asyncio.CancelledError):
+            ok = None  # the caller stopped early; says nothing about the backend
+            raise
+        except Exception as e:
+            ok = not _is_backend_failure(e)
+            raise
+        finally:
+            self.release(backend, ok)
+
+    # --- Health ---
+    def _eject(self, backend: Backend, reason: str):
+        backend.ejected_until = time.monotonic() + self.eject_seconds
+        backend.ejections += 1
+        print(f"LLM backend {backend.url} ejected for {self.eject_seconds:g}s: {reason}")
+        # Waiters get the backend back once the ejection expires (it is then on probation:
+        # one more failure ejects it again)
+        asyncio.get_running_loop().call_later(self.eject_seconds, self._dispatch)
+
+    async def _probe(self, client: httpx.AsyncClient, backend: Backend):
+        try:
+            resp = await client.get(f"{backend.url}/api/version", timeout=5)
+            resp.raise_for_status()
+        except Exception as e:
+            if not backend.ejected(time.monotonic()):
+                backend.failures = max(backend.failures, self.eject_after)
+                self._eject(backend, f"health probe failed ({type(e).__name__})")
+            return
+        if backend.ejected(time.monotonic()):
+            print(f"LLM backend {backend.url} is healthy again")
+            backend.ejected_until = 0.0
+        backend.failures = 0
+        self._dispatch()
+
+    async def run_health_checks(self, client: httpx.AsyncClient):
+        """Probes every backend each health_interval seconds (run as a task; 0 = off)."""
+        while self.health_interval > 0:
+            await asyncio.sleep(self.health_interval)
+            await asyncio.gather(*(self._probe(client, backend) for backend in self.backends))
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "queued": self._queued,
+            "queued_finalize": sum(len(w) for w in self._queues[PRIORITY_FINALIZE].values()),
+            "queued_new_turns": sum(len(w) for w in self._queues[PRIORITY_NEW_TURN].values()),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "max_wait_seconds": round(self.max_wait, 3),
+            "backends": [backend.stats(now) for backend in self.backends],
+        }
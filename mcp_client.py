@@ -1,12 +1,22 @@
 #!/usr/bin/env python3
 # mcp_client_server.py
 import os
-from fastapi import FastAPI, HTTPException
+import time
+import json
+import asyncio
+import hashlib
+import anyio
+import httpx
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import uvicorn
 from dotenv import load_dotenv
 
+from mcp import types as mcp_types
 from mcp.client.session import ClientSession
+from mcp.shared.exceptions import McpError
 from mcp.client.streamable_http import streamablehttp_client  # 👈 HTTP client
 
 # Load variables from .env if present
@@ -20,157 +30,478 @@ class ToolCall(BaseModel):
     tool: str
     arguments: dict | None = None
 
-# Connection state (lazy)
-app.state._http_cm = None
-app.state._session_cm = None
-app.state.session = None
+# --- MCP session pool ---
+# Each pooled session is owned by its own background task: the streamable HTTP
+# and ClientSession context managers are anyio task groups, which must be
+# entered and exited by the same task.
+MCP_POOL_SIZE = max(1, int(os.environ.get("MCP_POOL_SIZE", "4")))
+MCP_HEALTH_INTERVAL = float(os.environ.get("MCP_HEALTH_INTERVAL", "30"))
+MCP_CONNECT_TIMEOUT = float(os.environ.get("MCP_CONNECT_TIMEOUT", "10"))
 
-async def ensure_session():
-    if app.state.session is not None:
-        return
-    try:
-        app.state._http_cm = streamablehttp_client(MCP_SERVER_URL)
-        streams = await app.state._http_cm.__aenter__()
-        # streamablehttp_client may return a tuple with more than two items in newer versions.
-        if isinstance(streams, tuple) and len(streams) >= 2:
-            read_stream, write_stream = streams[0], streams[1]
-        else:
-            read_stream, write_stream = streams
-        app.state._session_cm = ClientSession(read_stream, write_stream)
-        app.state.session = await app.state._session_cm.__aenter__()
-        await app.state.session.initialize()
-    except Exception as e:
-        # partial cleanup in case of error
-        if app.state._session_cm:
+# Errors meaning the connection is gone (as opposed to a tool failing)
+CONNECTION_ERRORS = (
+    httpx.HTTPError,
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    anyio.EndOfStream,
+    ConnectionError,
+)
+
+
+def _is_connection_error(e: BaseException) -> bool:
+    """True for a dead transport, including the JSON-RPC errors the MCP client reports for one.
+
+    After a server restart the old session id gets a 404, which the client
+    turns into an McpError "Session terminated"; a dropped stream gives
+    CONNECTION_CLOSED.
+    """
+    if isinstance(e, CONNECTION_ERRORS):
+        return True
+    if isinstance(e, McpError):
+        return e.error.code == mcp_types.CONNECTION_CLOSED or e.error.message == "Session terminated"
+    return False
+
+
+def _describe_error(e: BaseException) -> str:
+    """Readable message for an error, unwrapping anyio task group exception groups."""
+    while isinstance(e, BaseExceptionGroup) and e.exceptions:
+        e = e.exceptions[0]
+    return f"{type(e).__name__}: {e}"
+
+
+class PooledSession:
+    """One MCP connection, opened lazily and reopened after failures."""
+
+    def __init__(self, url: str, index: int, message_handler=None, on_reconnect=None):
+        self.url = url
+        self.index = index
+        # Receives server notifications; on_reconnect() runs when a dropped session is reopened
+        self.message_handler = message_handler
+        self.on_reconnect = on_reconnect
+        self.session: ClientSession | None = None
+        self.in_flight = 0
+        self.connects = 0
+        self.failures = 0
+        self.last_error: str | None = None
+        self._task: asyncio.Task | None = None
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def _run(self):
+        try:
+            async with streamablehttp_client(self.url) as streams:
+                # streamablehttp_client may return a tuple with more than two items in newer versions.
+                read_stream, write_stream = streams[0], streams[1]
+                async with ClientSession(read_stream, write_stream, message_handler=self.message_handler) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._stop.wait()
+        except Exception as e:
+            self.last_error = _describe_error(e)
+        finally:
+            self.session = None
+            self._ready.set()
+
+    async def connect(self) -> ClientSession:
+        """Returns the live session, opening it if needed (only one opener at a time)."""
+        async with self._lock:
+            if self.connected:
+                return self.session
+            self._ready = asyncio.Event()
+            self._stop = asyncio.Event()
+            self.last_error = None
+            self._task = asyncio.create_task(self._run())
             try:
-                await app.state._session_cm.__aexit__(None, None, None)
-            except Exception:
-                pass
-            app.state._session_cm = None
-        if app.state._http_cm:
+                await asyncio.wait_for(self._ready.wait(), MCP_CONNECT_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.last_error = "connection timed out"
+            if self.session is None:
+                self.failures += 1
+                await self._shutdown()
+                raise HTTPException(502, f"MCP connection failed to {self.url}: {self.last_error}")
+            if self.connects and self.on_reconnect is not None:
+                self.on_reconnect()
+            self.connects += 1
+            return self.session
+
+    async def _shutdown(self):
+        self._stop.set()
+        task, self._task = self._task, None
+        if task is not None:
             try:
-                await app.state._http_cm.__aexit__(None, None, None)
+                await asyncio.wait_for(task, MCP_CONNECT_TIMEOUT)
             except Exception:
-                pass
-            app.state._http_cm = None
-        app.state.session = None
-        raise HTTPException(502, f"MCP connection failed to {MCP_SERVER_URL}: {e}")
+                task.cancel()
+        self.session = None
+
+    async def close(self):
+        async with self._lock:
+            await self._shutdown()
+
+    async def check(self):
+        """Pings an open session; closes it if the server does not answer."""
+        if not self.connected or self.in_flight:
+            return
+        try:
+            await asyncio.wait_for(self.session.send_ping(), MCP_CONNECT_TIMEOUT)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f"health check failed: {_describe_error(e)}"
+            await self.close()
+
+    def stats(self) -> dict:
+        return {
+            "index": self.index,
+            "connected": self.connected,
+            "in_flight": self.in_flight,
+            "connects": self.connects,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+class SessionPool:
+    """Spreads MCP requests over up to `size` sessions, least busy first."""
+
+    def __init__(self, url: str, size: int, message_handler=None, on_reconnect=None):
+        self.url = url
+        self.slots = [PooledSession(url, i, message_handler, on_reconnect) for i in range(size)]
+        self._health_task: asyncio.Task | None = None
+
+    def _pick(self) -> PooledSession:
+        # Fewest requests in flight; on ties reuse an open session before opening another
+        return min(self.slots, key=lambda slot: (slot.in_flight, not slot.connected, slot.index))
+
+    async def run(self, operation):
+        """Runs `await operation(session)` on the least busy session.
+
+        If the connection turns out to be dead (e.g. the server restarted and
+        no longer knows the session), the session is reopened and the
+        operation retried once.
+        """
+        for attempt in range(2):
+            slot = self._pick()
+            slot.in_flight += 1
+            try:
+                session = await slot.connect()
+                return await operation(session)
+            except Exception as e:
+                if not _is_connection_error(e):
+                    raise
+                slot.failures += 1
+                slot.last_error = _describe_error(e)
+                await slot.close()
+                if attempt:
+                    raise
+            finally:
+                slot.in_flight -= 1
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(MCP_HEALTH_INTERVAL)
+            await asyncio.gather(*(slot.check() for slot in self.slots), return_exceptions=True)
+
+    def start(self):
+        if MCP_HEALTH_INTERVAL > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        await asyncio.gather(*(slot.close() for slot in self.slots), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.slots),
+            "connected": sum(1 for slot in self.slots if slot.connected),
+            "in_flight": sum(slot.in_flight for slot in self.slots),
+            "sessions": [slot.stats() for slot in self.slots],
+        }
+
+
+class ListingCache:
+    """Caches the /tools and /resources payloads, each with an ETag.
+
+    Entries stay valid until invalidated: by an MCP list-changed notification,
+    a reconnect (the server may have restarted with other tools) or an
+    explicit ?refresh=true.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, tuple[dict, str]] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._generation: dict[str, int] = {}
+        self.hits = 0
+        self.loads = 0
+        self.invalidations = 0
+
+    async def get(self, name: str, loader, refresh: bool = False) -> tuple[dict, str]:
+        """Returns (payload, etag), running `await loader()` only when not cached."""
+        if refresh:
+            self.invalidate(name)
+        entry = self._entries.get(name)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            # Concurrent misses wait for the first loader instead of listing again
+            entry = self._entries.get(name)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            generation = self._generation.get(name, 0)
+            payload = jsonable_encoder(await loader())
+            self.loads += 1
+            digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+            entry = (payload, f'"{digest[:32]}"')
+            # Do not keep a listing that was invalidated while it was loading
+            if self._generation.get(name, 0) == generation:
+                self._entries[name] = entry
+            return entry
+
+    def invalidate(self, name: str):
+        self._entries.pop(name, None)
+        self._generation[name] = self._generation.get(name, 0) + 1
+        self.invalidations += 1
+
+    def invalidate_all(self):
+        for name in ("tools", "resources"):
+            self.invalidate(name)
+
+    def stats(self) -> dict:
+        return {"cached": sorted(self._entries), "hits": self.hits, "loads": self.loads, "invalidations": self.invalidations}
+
+
+app.state.listings = ListingCache()
+
+async def _on_server_message(message):
+    """Drops cached listings when the server announces that they changed."""
+    root = getattr(message, "root", None)
+    if isinstance(root, mcp_types.ToolListChangedNotification):
+        app.state.listings.invalidate("tools")
+    elif isinstance(root, mcp_types.ResourceListChangedNotification):
+        app.state.listings.invalidate("resources")
+
+app.state.pool = SessionPool(MCP_SERVER_URL, MCP_POOL_SIZE, _on_server_message, app.state.listings.invalidate_all)
+
+@app.on_event("startup")
+async def startup():
+    app.state.pool.start()
 
 @app.on_event("shutdown")
 async def shutdown():
-    if getattr(app.state, "_session_cm", None):
-        try:
-            await app.state._session_cm.__aexit__(None, None, None)
-        except Exception:
-            pass
-        app.state._session_cm = None
-        app.state.session = None
-    if getattr(app.state, "_http_cm", None):
-        try:
-            await app.state._http_cm.__aexit__(None, None, None)
-        except Exception:
-            pass
-        app.state._http_cm = None
+    await app.state.pool.close()
 
 @app.get("/health")
 async def health():
-    return {"ok": True, "connected": app.state.session is not None}
+    pool_stats = app.state.pool.stats()
+    return {"ok": True, "connected": pool_stats["connected"] > 0, "pool": pool_stats,
+            "listings": app.state.listings.stats()}
+
+
+def _listing_response(request: Request, payload: dict, etag: str) -> Response:
+    """200 with the payload and its ETag, or 304 if the caller already has this version."""
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(payload, headers={"ETag": etag})
+
+async def _load_tools() -> dict:
+    res = await app.state.pool.run(lambda session: session.list_tools())
+    items = []
+    for t in res.tools:
+        item = {"name": getattr(t, "name", None)}
+        desc = getattr(t, "description", None) or getattr(t, "descriptions", None)
+        schema = getattr(t, "input_schema", None) or getattr(t, "inputSchema", None)
+        if desc:
+            item["description"] = desc
+        if schema:
+            item["input_schema"] = schema
+        items.append(item)
+    return {"ok": True, "tools": items}
+
 
 @app.get("/tools")
-async def tools():
+async def tools(request: Request, refresh: bool = False):
     """
     Ritorna l’elenco tool. Include anche descrizione e schema se disponibili.
     Output: {"ok": true, "tools": [{"name":"echo","description":"...", "input_schema": {...}}, ...]}
+    The listing is cached: send If-None-Match with the last ETag to get 304 when
+    unchanged; ?refresh=true lists the tools from the server again.
     """
-    await ensure_session()
     try:
-        res = await app.state.session.list_tools()
-        items = []
-        for t in res.tools:
-            item = {"name": getattr(t, "name", None)}
-            desc = getattr(t, "description", None) or getattr(t, "descriptions", None)
-            schema = getattr(t, "input_schema", None) or getattr(t, "inputSchema", None)
-            if desc:
-                item["description"] = desc
-            if schema:
-                item["input_schema"] = schema
-            items.append(item)
-        return {"ok": True, "tools": items}
+        payload, etag = await app.state.listings.get("tools", _load_tools, refresh)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Error in list_tools: {e}")
+    return _listing_response(request, payload, etag)
 
 
 # --- New endpoints for MCP Resources ---
+async def _load_resources() -> dict:
+    async def list_all(session):
+        return await session.list_resources(), await session.list_resource_templates()
+
+    items = []
+    res, tmpl = await app.state.pool.run(list_all)
+    # Material resources
+    resources_list = getattr(res, "resources", []) or []
+    for r in resources_list:
+        items.append({
+            "uri": getattr(r, "uri", None) or getattr(r, "uri_template", None),
+            "name": getattr(r, "name", None),
+            "description": getattr(r, "description", None),
+            "type": "resource",
+        })
+    # Resource templates (e.g. restaurant://menu/{date})
+    templates_list = getattr(tmpl, "templates", None)
+    if templates_list is None:
+        templates_list = getattr(tmpl, "resource_templates", []) or []
+    for t in templates_list:
+        items.append({
+            "uri": getattr(t, "uri", None) or getattr(t, "uri_template", None),
+            "name": getattr(t, "name", None),
+            "description": getattr(t, "description", None),
+            "type": "template",
+        })
+    # De-dup
+    seen = set()
+    deduped = []
+    for it in items:
+        key = (it.get("uri"), it.get("type"))
+        if key in seen:
+            continue
+        seen.add(key)
+        deduped.append(it)
+    return {"ok": True, "resources": deduped}
+
+
 @app.get("/resources")
-async def resources():
-    """Lists available resources from the MCP server."""
-    await ensure_session()
+async def resources(request: Request, refresh: bool = False):
+    """Lists available resources from the MCP server (cached, with ETag like /tools)."""
     try:
-        items = []
-        # Material resources
-        res = await app.state.session.list_resources()
-        resources_list = getattr(res, "resources", []) or []
-        for r in resources_list:
-            items.append({
-                "uri": getattr(r, "uri", None) or getattr(r, "uri_template", None),
-                "name": getattr(r, "name", None),
-                "description": getattr(r, "description", None),
-                "type": "resource",
-            })
-        # Resource templates (e.g. restaurant://menu/{date})
-        tmpl = await app.state.session.list_resource_templates()
-        templates_list = getattr(tmpl, "templates", None)
-        if templates_list is None:
-            templates_list = getattr(tmpl, "resource_templates", []) or []
-        for t in templates_list:
-            items.append({
-                "uri": getattr(t, "uri", None) or getattr(t, "uri_template", None),
-                "name": getattr(t, "name", None),
-                "description": getattr(t, "description", None),
-                "type": "template",
-            })
-        # De-dup
-        seen = set()
-        deduped = []
-        for it in items:
-            key = (it.get("uri"), it.get("type"))
-            if key in seen:
-                continue
-            seen.add(key)
-            deduped.append(it)
-        return {"ok": True, "resources": deduped}
+        payload, etag = await app.state.listings.get("resources", _load_resources, refresh)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Error in list_resources: {e}")
+    return _listing_response(request, payload, etag)
 
 
 class ReadResourceBody(BaseModel):
     uri: str
 
+
+def _resource_payload(result, uri: str) -> dict:
+    """Flattens a ReadResourceResult into {"uri", "mime_type", "text"}."""
+    # ReadResourceResult carries a list of contents (uri, mimeType, text | blob);
+    # some clients return a single object with those fields instead
+    contents = getattr(result, "contents", None) or [result]
+    first = contents[0]
+    texts = [getattr(c, "text", None) for c in contents if getattr(c, "text", None) is not None]
+    return {
+        "uri": str(getattr(first, "uri", None) or uri),
+        "mime_type": getattr(first, "mime_type", None) or getattr(first, "mimeType", None),
+        "text": "\n".join(texts) if texts else None,
+    }
+
+
 @app.post("/read_resource")
 async def read_resource(body: ReadResourceBody):
     """Reads an MCP resource given its complete URI."""
-    await ensure_session()
     try:
-        result = await app.state.session.read_resource(body.uri)
-        # Some clients return an object with fields like uri, mimeType, text, blob
-        payload = {
-            "uri": getattr(result, "uri", body.uri),
-            "mime_type": getattr(result, "mime_type", None) or getattr(result, "mimeType", None),
-            "text": getattr(result, "text", None),
-        }
-        return {"ok": True, "result": payload}
+        result = await app.state.pool.run(lambda session: session.read_resource(body.uri))
+        return {"ok": True, "result": _resource_payload(result, body.uri)}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Error in read_resource: {e}")
 
 
 @app.post("/call_tool")
 async def call_tool(body: ToolCall):
-    await ensure_session()
     try:
-        result = await app.state.session.call_tool(body.tool, body.arguments or {})
+        result = await app.state.pool.run(lambda session: session.call_tool(body.tool, body.arguments or {}))
         return {"ok": True, "result": result}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Error in call_tool: {e}")
 
+# --- Batch endpoint ---
+MCP_BATCH_ITEM_TIMEOUT = float(os.environ.get("MCP_BATCH_ITEM_TIMEOUT", "60"))
+MCP_BATCH_MAX_ITEMS = int(os.environ.get("MCP_BATCH_MAX_ITEMS", "16"))
+
+
+class BatchItem(BaseModel):
+    # Either a tool call (tool + arguments) or a resource read (uri)
+    tool: str | None = None
+    arguments: dict | None = None
+    uri: str | None = None
+
+
+class BatchBody(BaseModel):
+    items: list[BatchItem]
+    # Per-item timeout in seconds (default MCP_BATCH_ITEM_TIMEOUT)
+    timeout: float | None = None
+
+
+async def _run_batch_item(item: BatchItem, timeout: float) -> dict:
+    """Runs one batch item; failures are reported in the item instead of failing the batch."""
+    started = time.perf_counter()
+    if item.tool:
+        kind, operation = "tool", lambda session: session.call_tool(item.tool, item.arguments or {})
+    else:
+        kind, operation = "resource", lambda session: session.read_resource(item.uri)
+    try:
+        result = await asyncio.wait_for(app.state.pool.run(operation), timeout)
+        if kind == "resource":
+            result = _resource_payload(result, item.uri)
+        entry = {"ok": True, "kind": kind, "result": result}
+    except asyncio.TimeoutError:
+        entry = {"ok": False, "kind": kind, "error": f"Timed out after {timeout:g}s"}
+    except HTTPException as e:
+        entry = {"ok": False, "kind": kind, "error": e.detail}
+    except Exception as e:
+        entry = {"ok": False, "kind": kind, "error": f"Error in {'call_tool' if kind == 'tool' else 'read_resource'}: {e}"}
+    entry["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return entry
+
+
+@app.post("/call_batch")
+async def call_batch(body: BatchBody):
+    """
+    Runs several tool calls and resource reads concurrently.
+    Input: {"items": [{"tool": "rag_search", "arguments": {...}}, {"uri": "restaurant://info"}], "timeout": 30}
+    Output: {"ok": true, "results": [...]} in the same order as items; each result has
+    "ok" and either "result" or "error", so one failing item does not fail the others.
+    """
+    if not body.items:
+        raise HTTPException(400, "Empty batch: provide at least one item.")
+    if len(body.items) > MCP_BATCH_MAX_ITEMS:
+        raise HTTPException(400, f"Too many items: {len(body.items)} (max {MCP_BATCH_MAX_ITEMS}).")
+    for index, item in enumerate(body.items):
+        if bool(item.tool) == bool(item.uri):
+            raise HTTPException(400, f"Item {index}: provide either 'tool' or 'uri'.")
+
+    timeout = body.timeout if body.timeout and body.timeout > 0 else MCP_BATCH_ITEM_TIMEOUT
+    started = time.perf_counter()
+    results = await asyncio.gather(*(_run_batch_item(item, timeout) for item in body.items))
+    return {
+        "ok": all(entry["ok"] for entry in results),
+        "results": results,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8000, reload=False)
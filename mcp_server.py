@@ -7,19 +7,63 @@ import os
 import requests
 from typing import Any, List, Dict
 from dotenv import load_dotenv
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
 import json
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import pytz
 
+from rag_config import DATA_CONFIG, SEARCH_CONFIG
+from rag_context import default_budget, pack_context
+from rag_engine import SEARCH_MODES, RagEngine
+from web_search import BraveSearchClient
+
 # Carica variabili da .env se presente
 load_dotenv()
 
 # Minimal FastMCP server
 mcp = FastMCP(name="demo-basic-http")
 
+# --- Blocking tool execution ---
+# FastMCP calls sync tools directly on the event loop, so one slow Brave call or
+# embedding would stall every other session. Blocking tools run on this pool
+# instead, each with its own concurrency cap ("tool=limit,..."; 0 = pool size only).
+TOOL_WORKERS = int(os.environ.get("MCP_TOOL_WORKERS", "8"))
+TOOL_CONCURRENCY = {
+    "rag_search": 4,
+    "rag_search_batch": 2,
+    "search": 4,
+}
+for _item in os.environ.get("MCP_TOOL_CONCURRENCY", "").split(","):
+    if "=" in _item:
+        _name, _limit = _item.split("=", 1)
+        TOOL_CONCURRENCY[_name.strip()] = int(_limit)
+
+_tool_executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="mcp-tool")
+_tool_semaphores: dict[str, asyncio.Semaphore] = {
+    name: asyncio.Semaphore(limit) for name, limit in TOOL_CONCURRENCY.items() if limit > 0
+}
+
+def _blocking_tool(fn):
+    """Turns a blocking tool into an async one that runs on the tool thread pool.
+
+    The wrapper keeps fn's signature and docstring, so the MCP schema is unchanged.
+    """
+    semaphore = _tool_semaphores.get(fn.__name__)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(fn, *args, **kwargs)
+        if semaphore is None:
+            return await loop.run_in_executor(_tool_executor, call)
+        async with semaphore:
+            return await loop.run_in_executor(_tool_executor, call)
+
+    return wrapper
+
 # --- Helpers for reading data files ---
 from pathlib import Path
 
@@ -43,228 +87,44 @@ def _read_text(filename: str) -> str:
         raise ValueError(f"Cannot read '{file_path}': {e}") from e
 
 
-# --- Helpers for RAG with ChromaDB ---
-def _get_chroma_client():
-    """Initializes and returns the ChromaDB client."""
-    data_dir = _get_data_dir()
-    chroma_path = data_dir / "chroma_db"
-    return chromadb.PersistentClient(
-        path=str(chroma_path),
-        settings=Settings(anonymized_telemetry=False)
-    )
+# --- RAG engine (one per server process) ---
+_rag_engine: RagEngine | None = None
+_rag_engine_lock = threading.Lock()
 
+def _get_rag_engine() -> RagEngine:
+    """Returns the process-wide RAG engine, creating it on first use."""
+    global _rag_engine
+    if _rag_engine is None:
+        with _rag_engine_lock:
+            if _rag_engine is None:
+                _rag_engine = RagEngine(_get_data_dir())
+    return _rag_engine
 
-# Global cache for collection and file hashes
-_collection_cache = None
-_file_hashes = {}
 
-def _get_file_hash(file_path: Path) -> str:
-    """Get a hash of file content and modification time."""
-    try:
-        stat = file_path.stat()
-        content = file_path.read_text(encoding='utf-8')
-        import hashlib
-        hash_content = hashlib.md5(f"{content}{stat.st_mtime}".encode()).hexdigest()
-        return hash_content
-    except Exception:
-        return ""
-
-def _check_files_changed() -> bool:
-    """Check if any files have changed since last cache."""
-    global _file_hashes
-    
-    data_dir = _get_data_dir()
-    text_extensions = {'.txt', '.md', '.rst', '.text'}
-    current_hashes = {}
-    
-    # Get current file hashes
-    for file_path in data_dir.rglob('*'):
-        if file_path.is_file() and file_path.suffix.lower() in text_extensions:
-            relative_path = str(file_path.relative_to(data_dir))
-            current_hashes[relative_path] = _get_file_hash(file_path)
-    
-    # Check if files changed
-    if _file_hashes != current_hashes:
-        _file_hashes = current_hashes
-        return True
-    
-    return False
+# --- Brave web search client (one pooled session and cache per server process) ---
+_web_search_client: BraveSearchClient | None = None
+_web_search_lock = threading.Lock()
 
-def _initialize_rag_database():
-    """Initializes the RAG database with restaurant data by scanning for text files."""
-    global _collection_cache
-    
-    try:
-        client = _get_chroma_client()
-        collection_name = "restaurant_knowledge"
-        
-        # Check if files have changed
-        files_changed = _check_files_changed()
-        
-        # If collection exists and files haven't changed, return cached collection
-        if not files_changed and _collection_cache is not None:
-            try:
-                # Verify collection still exists
-                collection = client.get_collection(collection_name)
-                print(f"Using cached RAG database (no files changed)")
-                return collection
-            except:
-                # Collection was deleted, need to rebuild
-                pass
-        
-        # Files changed or collection doesn't exist, rebuild
-        print(f"Files changed or collection missing, rebuilding RAG database...")
-        
-        # Delete existing collection if it exists
-        try:
-            client.delete_collection(collection_name)
-            print(f"Deleted existing collection: {collection_name}")
-        except:
-            pass  # Collection didn't exist
-        
-        # Create new collection
-        collection = client.create_collection(
-            name=collection_name,
-            metadata={"description": "Restaurant knowledge for RAG"}
-        )
-        
-        # Scan data directory for text files
-        data_dir = _get_data_dir()
-        text_extensions = {'.txt', '.md', '.rst', '.text'}
-        
-        documents = []
-        metadatas = []
-        ids = []
-        
-        print(f"Scanning directory: {data_dir}")
-        
-        # Find all text files in the data directory
-        for file_path in data_dir.rglob('*'):
-            if file_path.is_file() and file_path.suffix.lower() in text_extensions:
-                try:
-                    # Read file content
-                    content = file_path.read_text(encoding='utf-8').strip()
-                    if not content:  # Skip empty files
-                        continue
-                    
-                    # Determine file type based on name or path
-                    file_type = _determine_file_type(file_path)
-                    
-                    # Create relative path for source
-                    relative_path = file_path.relative_to(data_dir)
-                    
-                    documents.append(content)
-                    metadatas.append({
-                        "source": str(relative_path),
-                        "type": file_type,
-                        "filename": file_path.name,
-                        "full_path": str(file_path)
-                    })
-                    ids.append(f"{relative_path}_{len(documents)}")
-                    
-                    print(f"Loaded: {relative_path} (type: {file_type})")
-                    
-                except Exception as e:
-                    print(f"Error reading {file_path}: {e}")
-                    continue
-        
-        # Add documents if any exist
-        if documents:
-            collection.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
-            print(f"Added {len(documents)} documents to RAG database")
-        else:
-            print("No text files found to add to RAG database")
-        
-        # Cache the collection
-        _collection_cache = collection
-        
-        return collection
-        
-    except Exception as e:
-        print(f"Error in RAG initialization: {e}")
-        return None
-
-
-def _determine_file_type(file_path: Path) -> str:
-    """Determines the type of a file based on its name and content."""
-    filename = file_path.name.lower()
-    
-    # Menu files
-    if 'menu' in filename:
-        if 'today' in filename:
-            return 'menu_today'
-        elif any(date_pattern in filename for date_pattern in ['2024', '2025', '2023']):
-            return 'menu_dated'
-        else:
-            return 'menu'
-    
-    # Location files
-    if any(loc_word in filename for loc_word in ['location', 'address', 'where', 'map']):
-        return 'location'
-    
-    # Contact files
-    if any(contact_word in filename for contact_word in ['contact', 'phone', 'email', 'info']):
-        return 'contact'
-    
-    # Hours files
-    if any(hour_word in filename for hour_word in ['hours', 'schedule', 'time', 'open']):
-        return 'hours'
-    
-    # Special files
-    if 'special' in filename or 'promo' in filename:
-        return 'special'
-    
-    if 'policy' in filename or 'terms' in filename:
-        return 'policy'
-    
-    # Default type based on extension
-    if file_path.suffix == '.md':
-        return 'markdown'
-    elif file_path.suffix == '.rst':
-        return 'restructured'
-    else:
-        return 'general'
+def _get_web_search_client() -> BraveSearchClient:
+    """Returns the process-wide Brave search client, creating it on first use."""
+    global _web_search_client
+    if _web_search_client is None:
+        with _web_search_lock:
+            if _web_search_client is None:
+                _web_search_client = BraveSearchClient()
+    return _web_search_client
 
 
 def _refresh_rag_database():
-    """Manually refresh the RAG database by clearing cache."""
-    global _collection_cache, _file_hashes
-    _collection_cache = None
-    _file_hashes = {}
-    print("RAG database cache cleared, will rebuild on next request")
+    """Manually refresh the RAG database by re-hashing every data file."""
+    _get_rag_engine().reindex(full=True)
+
 
-def _rag_search(query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+def _rag_search(
+    query: str, top_k: int = 3, mode: str | None = None, types: List[str] | None = None
+) -> List[Dict[str, Any]]:
     """Performs RAG search on restaurant data."""
-    try:
-        collection = _initialize_rag_database()
-        if not collection:
-            return []
-        
-        results = collection.query(
-            query_texts=[query],
-            n_results=top_k,
-            include=["documents", "metadatas", "distances"]
-        )
-        
-        formatted_results = []
-        if results['documents'] and results['documents'][0]:
-            for i, doc in enumerate(results['documents'][0]):
-                formatted_results.append({
-                    "content": doc,
-                    "source": results['metadatas'][0][i].get('source', 'unknown'),
-                    "type": results['metadatas'][0][i].get('type', 'unknown'),
-                    "relevance_score": 1.0 - (results['distances'][0][i] if results['distances'] and results['distances'][0] else 0.0)
-                })
-        
-        return formatted_results
-        
-    except Exception as e:
-        print(f"Error in RAG search: {e}")
-        return []
+    return _get_rag_engine().search(query, top_k, mode, types)
 
 
 @mcp.tool()
@@ -279,6 +139,7 @@ def echo(message: str | None = None, payload: str | None = None) -> str:
     return value
 
 @mcp.tool()
+@_blocking_tool
 def search(
     q: str | None = None,
     query: str | None = None,
@@ -319,26 +180,16 @@ def search(
         except ValueError:
             raise ValueError("'count' must be an integer or numeric string.")
 
-    url = "https://api.search.brave.com/res/v1/web/search"
-    headers = {
-        "X-Subscription-Token": key,
-        "Accept": "application/json",
-        "Accept-Encoding": "gzip",
-    }
-    params: dict[str, Any] = {"q": q_value}
-    if count is not None:
-        params["count"] = count
-    if country:
-        params["country"] = country
-    if search_lang:
-        params["search_lang"] = search_lang
-    if safesearch:
-        params["safesearch"] = safesearch
-
     try:
-        resp = requests.get(url, headers=headers, params=params, timeout=15)
-        resp.raise_for_status()
-        data = resp.json()
+        # Pooled, cached and retried (see web_search.BraveSearchClient)
+        data = _get_web_search_client().search(
+            key,
+            q_value,
+            count=count,
+            country=country,
+            search_lang=search_lang,
+            safesearch=safesearch,
+        )
 
         # Post-processing: extract only essential data
         def strip_html(text: str | None) -> str:
@@ -401,29 +252,87 @@ def search(
             "results": compact,
         }
     except requests.HTTPError as http_err:
+        resp = http_err.response
+        status = resp.status_code if resp is not None else "?"
+        body = resp.text[:500] if resp is not None else str(http_err)
         raise ValueError(
-            f"Brave API HTTP error {resp.status_code}: {resp.text[:500]}"
+            f"Brave API HTTP error {status}: {body}"
         ) from http_err
     except Exception as e:
         raise ValueError(f"Error calling Brave API: {e}") from e
 
 
+def _normalize_rag_types(type: str | None, types: list[str] | str | None) -> list[str] | None:
+    """Merges the type/types arguments into a list of file types (None when not given)."""
+    values = []
+    for value in ([type] if type else []) + ([types] if isinstance(types, str) else list(types or [])):
+        values.extend(part.strip().lower() for part in str(value).split(",") if part.strip())
+    if not values:
+        return None
+    known = set(DATA_CONFIG["type_patterns"]) | {"menu_today", "menu_dated", "markdown", "restructured", "general"}
+    unknown = [value for value in values if value not in known]
+    if unknown:
+        raise ValueError(f"Invalid type: '{unknown[0]}'. Use one of: {', '.join(sorted(known))}.")
+    return values
+
+
+def _normalize_rag_options(top_k: int | str | None, mode: str | None):
+    """Validates the top_k and mode arguments shared by the RAG search tools."""
+    if isinstance(top_k, str):
+        try:
+            top_k = int(top_k)
+        except ValueError:
+            raise ValueError("'top_k' must be an integer or numeric string.")
+    top_k = min(max(1, top_k or SEARCH_CONFIG["default_top_k"]), SEARCH_CONFIG["max_top_k"])
+    
+    if mode is not None:
+        mode = mode.strip().lower()
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Invalid mode: '{mode}'. Use one of: {', '.join(SEARCH_MODES)}.")
+    
+    return top_k, mode
+
+
+def _normalize_max_tokens(max_tokens: int | str | None) -> int | None:
+    """Validates the optional context token budget of the RAG search tools."""
+    if max_tokens is None or max_tokens == "":
+        return None
+    try:
+        max_tokens = int(max_tokens)
+    except (TypeError, ValueError):
+        raise ValueError("'max_tokens' must be an integer or numeric string.")
+    if max_tokens <= 0:
+        raise ValueError("'max_tokens' must be positive.")
+    return max_tokens
+
+
 @mcp.tool()
+@_blocking_tool
 def rag_search(
     query: str | None = None,
     question: str | None = None,
     q: str | None = None,
-    top_k: int | None = 3
+    top_k: int | None = 3,
+    mode: str | None = None,
+    type: str | None = None,
+    types: list[str] | str | None = None,
+    max_tokens: int | None = None
 ) -> dict[str, Any]:
     """Performs a RAG (Retrieval-Augmented Generation) search on restaurant data.
     
-    This tool performs semantic search on local restaurant data using ChromaDB.
+    This tool performs semantic and keyword (BM25) search on local restaurant data using ChromaDB.
     
     Parameters:
     - query/question/q: search query or question (required, equivalent aliases)
     - top_k: number of local results to retrieve (default 3)
+    - mode: 'auto' (default: keyword fast path for short queries, hybrid otherwise),
+            'hybrid' (keyword + semantic), 'vector' (semantic only) or 'lexical' (keyword only)
+    - type/types: only search these document types ('menu', 'menu_today', 'hours', 'location',
+                  'contact', 'special', 'policy', ...). If omitted, the type is guessed from the query.
+    - max_tokens: token budget for the returned passages (default: a share of OLLAMA_NUM_CTX)
     
-    Returns structured results with local content.
+    Returns structured results with local content. Low-relevance and duplicate passages
+    are dropped and long ones excerpted to fit the budget ('context' reports what was done).
     """
     # Normalize query
     query_value = query or question or q
@@ -431,25 +340,103 @@ def rag_search(
         raise ValueError("Missing parameter: provide 'query', 'question' or 'q'.")
     
     # Normalize parameters
-    if isinstance(top_k, str):
-        try:
-            top_k = int(top_k)
-        except ValueError:
-            raise ValueError("'top_k' must be an integer or numeric string.")
+    top_k, mode = _normalize_rag_options(top_k, mode)
+    type_filter = _normalize_rag_types(type, types)
+    max_tokens = _normalize_max_tokens(max_tokens)
     
-    # Perform local RAG search
-    local_results = _rag_search(query_value, top_k or 3)
+    # Perform local RAG search, then fit the hits into the context budget
+    local_results = _rag_search(query_value, top_k, mode, type_filter)
+    local_results, context = pack_context(query_value, local_results, max_tokens)
     
     # Prepare result
     result = {
         "query": query_value,
         "local_results": local_results,
-        "local_count": len(local_results)
+        "local_count": len(local_results),
+        "context": context,
+        "index_version": _get_rag_engine().index_version
     }
     
     return result
 
 
+@mcp.tool()
+@_blocking_tool
+def rag_search_batch(
+    queries: list[str] | str | None = None,
+    top_k: int | None = 3,
+    mode: str | None = None,
+    type: str | None = None,
+    types: list[str] | str | None = None,
+    max_tokens: int | None = None
+) -> dict[str, Any]:
+    """Performs several RAG searches on restaurant data in one call.
+    
+    Use it instead of multiple rag_search calls when you need to look up several things.
+    
+    Parameters:
+    - queries: list of search queries (a single string is accepted too)
+    - top_k: number of local results per query (default 3)
+    - mode: same as rag_search ('auto', 'hybrid', 'vector', 'lexical')
+    - type/types: same as rag_search, applied to every query
+    - max_tokens: token budget shared by all queries (default: a share of OLLAMA_NUM_CTX)
+    
+    Returns per-query hits that reference a shared 'documents' map, so passages
+    matched by more than one query are only returned (and counted) once.
+    """
+    if isinstance(queries, str):
+        queries = [queries]
+    queries = [str(item).strip() for item in (queries or []) if str(item).strip()]
+    if not queries:
+        raise ValueError("Missing parameter: provide 'queries' as a list of questions.")
+    
+    top_k, mode = _normalize_rag_options(top_k, mode)
+    type_filter = _normalize_rag_types(type, types)
+    max_tokens = _normalize_max_tokens(max_tokens)
+    engine = _get_rag_engine()
+    
+    # The hits of all queries are packed together: a passage matched by more than
+    # one query is charged to the budget once (with its best score), and excerpts
+    # keep the lines that mention any of the queries
+    budget = max_tokens if max_tokens is not None else default_budget()
+    batches = engine.search_batch(queries, top_k, mode, type_filter)
+    candidates: dict[str, dict[str, Any]] = {}
+    for local_results in batches:
+        for item in local_results:
+            best = candidates.get(item["id"])
+            if best is None or item["relevance_score"] > best["relevance_score"]:
+                candidates[item["id"]] = item
+    packed, context = pack_context(" ".join(queries), list(candidates.values()), budget)
+    
+    # Each passage is returned once; queries reference it by id
+    documents: dict[str, dict[str, Any]] = {
+        item["id"]: {
+            "content": item["content"],
+            "source": item["source"],
+            "type": item["type"],
+            "section": item["section"],
+        }
+        for item in packed
+    }
+    floor = SEARCH_CONFIG["min_relevance_score"]
+    groups = []
+    for query_value, local_results in zip(queries, batches):
+        hits = [
+            {"id": item["id"], "relevance_score": item["relevance_score"]}
+            for item in local_results
+            if item["id"] in documents and item["relevance_score"] >= floor
+        ]
+        groups.append({"query": query_value, "local_results": hits, "local_count": len(hits)})
+    
+    return {
+        "queries": groups,
+        "documents": documents,
+        "unique_count": len(documents),
+        "context": context,
+        "index_version": engine.index_version
+    }
+
+
 @mcp.tool()
 def current_time(
     timezone: str | None = None,
@@ -514,6 +501,17 @@ def current_time(
         raise ValueError(f"Error getting current time: {e}")
 
 
+# --- MCP Resources for the RAG index ---
+@mcp.resource("rag://status")
+def rag_status() -> dict[str, Any]:
+    """RAG index version and content hash of every indexed data file.
+
+    Lets clients (e.g. the bot's answer cache) check whether data they relied on has changed.
+    """
+    engine = _get_rag_engine()
+    return {"index_version": engine.index_version, "files": engine.manifest()}
+
+
 # --- MCP Resources for restaurant (from files in 'data/') ---
 #@mcp.resource("restaurant://info")
 def restaurant_info() -> dict[str, Any]:
@@ -555,6 +553,10 @@ def restaurant_menu(date: str) -> dict[str, Any]:
     return {"date": label, "text": content}
 
 if __name__ == "__main__":
+    # Open the RAG index and warm up the embedder before serving the first request;
+    # the watcher then keeps the index in sync in the background, off the query path
+    _get_rag_engine().start(watch=DATA_CONFIG["auto_rebuild"])
+
     # Serve the Streamable HTTP app on /mcp
     app = mcp.streamable_http_app()
     host = os.environ.get("MCP_SERVER_HOST", "127.0.0.1")
@@ -6,13 +6,22 @@
 # 2. Use fast mode: ./run_fast_bot.sh
 # 3. Adjust settings: export OLLAMA_NUM_CTX=1024
 # 4. For maximum speed: export OLLAMA_MODEL=llama3.2:1b
+#
+# The CLI is a client of chat_server.py (start that first);
+# `python ollama_bot.py --local` runs a single-user chat in this process.
 
 import os
 import sys
 import re
 import time
 import json
+import threading
+import uuid
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from answer_cache import AnswerCache
+from chat_history import ChatHistory, estimate_tokens
 
 OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
 MODEL = os.environ.get("OLLAMA_MODEL", "qwen3:1.7b")
@@ -27,55 +36,151 @@ NUM_THREAD = int(os.environ.get("OLLAMA_NUM_THREAD", "4"))
 NUM_GPU = int(os.environ.get("OLLAMA_NUM_GPU", "1"))
 TEMPERATURE = float(os.environ.get("OLLAMA_TEMPERATURE", "0.7"))
 
+# Context sizes the bot may request (comma separated, capped at OLLAMA_NUM_CTX which is
+# always included; set it empty to always use OLLAMA_NUM_CTX). Each request uses the
+# smallest bucket that fits the prompt and reply; a change of num_ctx makes Ollama
+# reload the model, so keep the set small
+CTX_BUCKETS = sorted({NUM_CTX} | {
+    int(size) for size in os.environ.get("OLLAMA_CTX_BUCKETS", "1024,2048").split(",")
+    if size.strip().isdigit() and 0 < int(size) <= NUM_CTX
+})
+
+def _stage_option(stage: str, name: str, default, cast):
+    value = os.environ.get(f"OLLAMA_{stage.upper()}_{name}", "").strip()
+    return cast(value) if value else default
+
+# Per-stage sampling profiles: "tools" is the first pass, which decides on tool calls
+# (a few mcp blocks, so a tight num_predict), "answer" writes the reply for the user.
+# OLLAMA_<STAGE>_<OPTION> overrides the global OLLAMA_<OPTION> for one stage.
+STAGE_PROFILES = {
+    stage: {
+        "num_predict": _stage_option(stage, "NUM_PREDICT", num_predict, int),
+        "temperature": _stage_option(stage, "TEMPERATURE", TEMPERATURE, float),
+        "top_k": _stage_option(stage, "TOP_K", TOP_K, int),
+        "top_p": _stage_option(stage, "TOP_P", TOP_P, float),
+        "repeat_penalty": _stage_option(stage, "REPEAT_PENALTY", REPEAT_PENALTY, float),
+    }
+    for stage, num_predict in (("tools", min(NUM_PREDICT, 256)), ("answer", NUM_PREDICT))
+}
+
+# Tool protocol: "native" passes the MCP tool schemas in Ollama's `tools` field and reads
+# structured tool_calls (falls back to "text" if the model does not support tools);
+# "text" uses the ```mcp JSON blocks described in the system prompt
+TOOL_MODE = os.environ.get("OLLAMA_TOOL_MODE", "native").strip().lower()
+
+# Chat server (chat_server.py) the CLI connects to
+CHAT_SERVER_URL = os.environ.get("CHAT_SERVER_URL", "http://127.0.0.1:8002")
+
 # Persistent MCP client endpoint
 MCP_CLIENT_URL = os.environ.get("MCP_CLIENT_URL", "http://127.0.0.1:8000")
 
 # TTL for automatic tool refresh (in seconds)
 MCP_TOOL_TTL = int(os.environ.get("MCP_TOOL_TTL", "60"))
 
+# Overall deadline for all tool calls and resource reads of one turn (in seconds)
+MCP_TURN_DEADLINE = float(os.environ.get("MCP_TURN_DEADLINE", "30"))
+# Items per /call_batch request (must not exceed the client's MCP_BATCH_MAX_ITEMS)
+MCP_BATCH_MAX_ITEMS = int(os.environ.get("MCP_BATCH_MAX_ITEMS", "16"))
+# Start each tool call as soon as its ```mcp block is complete, while the model is still generating
+MCP_EARLY_DISPATCH = os.environ.get("MCP_EARLY_DISPATCH", "1").lower() in {"1", "true", "yes"}
+# Stop generating once the model writes prose after its tool blocks (that text is never used:
+# the finalization pass produces the answer); MCP_EARLY_STOP_CHARS of prose are tolerated
+MCP_EARLY_STOP = os.environ.get("MCP_EARLY_STOP", "0").lower() in {"1", "true", "yes"}
+MCP_EARLY_STOP_CHARS = int(os.environ.get("MCP_EARLY_STOP_CHARS", "80"))
+
+# Semantic answer cache (skips the LLM for repeat questions)
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "1").lower() in {"1", "true", "yes"}
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_MAX = int(os.environ.get("ANSWER_CACHE_MAX", "500"))
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_FILE = os.environ.get("ANSWER_CACHE_FILE", "")
+OLLAMA_EMBED_MODEL = os.environ.get("OLLAMA_EMBED_MODEL", "all-minilm")
+# Tools whose results only depend on the local data files (safe to cache answers built on them)
+ANSWER_CACHE_TOOLS = {"rag_search", "rag_search_batch"}
+# How long the RAG index status used to validate cached answers is reused (seconds)
+RAG_STATUS_TTL = float(os.environ.get("RAG_STATUS_TTL", "5"))
+
+# Model residency: Ollama unloads an idle model after keep_alive (a duration such as "30m",
+# "-1" = never). OLLAMA_KEEP_ALIVE applies during business hours (OLLAMA_BUSINESS_HOURS,
+# local "start-end" hours, may wrap midnight), OLLAMA_KEEP_ALIVE_OFF_HOURS outside them
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_KEEP_ALIVE_OFF_HOURS = os.environ.get("OLLAMA_KEEP_ALIVE_OFF_HOURS", "5m")
+OLLAMA_BUSINESS_HOURS = os.environ.get("OLLAMA_BUSINESS_HOURS", "10-23")
+# Load the model and prime the system prompt at startup
+OLLAMA_WARMUP = os.environ.get("OLLAMA_WARMUP", "1").lower() in {"1", "true", "yes"}
+# During business hours, ping Ollama after this many idle seconds so the model stays loaded (0 = off)
+OLLAMA_KEEP_WARM_INTERVAL = float(os.environ.get("OLLAMA_KEEP_WARM_INTERVAL", "240"))
+
+# Sliding-window history: prompt budget in tokens (0 = NUM_CTX minus the stage's num_predict
+# and the native tool schemas), turns kept verbatim, and length of the compacted older turns
+HISTORY_MAX_TOKENS = int(os.environ.get("HISTORY_MAX_TOKENS", "0"))
+HISTORY_KEEP_TURNS = int(os.environ.get("HISTORY_KEEP_TURNS", "2"))
+HISTORY_SUMMARY_CHARS = int(os.environ.get("HISTORY_SUMMARY_CHARS", "300"))
+
 TOOL_BLOCK_RE = re.compile(r"```mcp\s*(\{.*?\})\s*```", re.DOTALL)
+# Function name under which native mode exposes MCP resources
+READ_RESOURCE_TOOL = "read_resource"
+THINK_RE = re.compile(r"<think>.*?(</think>|$)", re.DOTALL)
 
-# Tools cache
+# Tools cache (ETag of the last listing: an unchanged list costs a 304)
 _cached_tools = []
+_tool_specs = {}  # name -> {"description", "input_schema"} for native tool calling
+_tools_etag = None
 _last_refresh = 0.0
 
 # Resources cache
 _cached_resources = []
+_resources_etag = None
 _last_res_refresh = 0.0
 
-def discover_tools(force: bool = False):
-    """Downloads the tool list from the MCP HTTP client with caching/TTL."""
-    global _cached_tools, _last_refresh
+def _get_listing(path: str, etag: str | None, refresh: bool):
+    """GETs a cached listing from the MCP HTTP client; returns (data or None if unchanged, etag)."""
+    headers = {"If-None-Match": etag} if etag and not refresh else {}
+    params = {"refresh": "true"} if refresh else None
+    r = requests.get(f"{MCP_CLIENT_URL}{path}", headers=headers, params=params, timeout=10)
+    if r.status_code == 304:
+        return None, etag
+    r.raise_for_status()
+    return r.json(), r.headers.get("ETag")
+
+def discover_tools(force: bool = False, refresh: bool = False):
+    """Downloads the tool list from the MCP HTTP client with caching/TTL.
+
+    refresh=True also makes the client list the tools from the MCP server again.
+    """
+    global _cached_tools, _tool_specs, _tools_etag, _last_refresh
     now = time.time()
-    if not force and _cached_tools and (now - _last_refresh) < MCP_TOOL_TTL:
+    if not force and not refresh and _cached_tools and (now - _last_refresh) < MCP_TOOL_TTL:
         return _cached_tools
     try:
-        r = requests.get(f"{MCP_CLIENT_URL}/tools", timeout=10)
-        r.raise_for_status()
-        data = r.json()
+        data, _tools_etag = _get_listing("/tools", _tools_etag if _cached_tools else None, refresh)
+        _last_refresh = now
+        if data is None:
+            return _cached_tools
         tools = data.get("tools", [])
         # Normalize to name list (accepts both [{"name":...},...] and ["echo",...])
         if tools and isinstance(tools[0], dict):
             names = [t.get("name") for t in tools if t.get("name")]
+            _tool_specs = {t["name"]: t for t in tools if t.get("name")}
         else:
             names = [str(t) for t in tools]
         _cached_tools = sorted(set(names))
-        _last_refresh = now
     except Exception:
         # keep previous cache in case of error
         pass
     return _cached_tools
 
-def discover_resources(force: bool = False):
+def discover_resources(force: bool = False, refresh: bool = False):
     """Downloads the resource list from the MCP HTTP client with caching/TTL."""
-    global _cached_resources, _last_res_refresh
+    global _cached_resources, _resources_etag, _last_res_refresh
     now = time.time()
-    if not force and _cached_resources and (now - _last_res_refresh) < MCP_TOOL_TTL:
+    if not force and not refresh and _cached_resources and (now - _last_res_refresh) < MCP_TOOL_TTL:
         return _cached_resources
     try:
-        r = requests.get(f"{MCP_CLIENT_URL}/resources", timeout=10)
-        r.raise_for_status()
-        data = r.json()
+        data, _resources_etag = _get_listing("/resources", _resources_etag if _cached_resources else None, refresh)
+        _last_res_refresh = now
+        if data is None:
+            return _cached_resources
         items = data.get("resources", [])
         # Keep only URIs for simplicity
         uris = []
@@ -84,19 +189,139 @@ def discover_resources(force: bool = False):
             if uri:
                 uris.append(uri)
         _cached_resources = sorted(set(uris))
-        _last_res_refresh = now
     except Exception:
         pass
     return _cached_resources
 
-def build_system_prompt(tools: list[str]) -> str:
+# RAG index status cache
+_rag_status = None
+_last_status_refresh = 0.0
+
+def fetch_rag_status(force: bool = False):
+    """Reads the RAG index version and file hashes (rag://status) with caching/TTL."""
+    global _rag_status, _last_status_refresh
+    now = time.time()
+    if not force and _rag_status is not None and (now - _last_status_refresh) < RAG_STATUS_TTL:
+        return _rag_status
+    result = read_client_resource("rag://status")
+    try:
+        if result.get("ok"):
+            _rag_status = json.loads(result.get("result", {}).get("text") or "null")
+            _last_status_refresh = now
+        else:
+            _rag_status = None
+    except Exception:
+        _rag_status = None
+    return _rag_status
+
+def embed_text(text: str, host: str = OLLAMA_HOST) -> list[float]:
+    """Embeds text with the Ollama embedding model."""
+    r = requests.post(
+        f"{host}/api/embed",
+        json={"model": OLLAMA_EMBED_MODEL, "input": text, "keep_alive": keep_alive()},
+        timeout=30,
+    )
+    r.raise_for_status()
+    return r.json()["embeddings"][0]
+
+def extract_rag_sources(result: dict) -> list[str]:
+    """Returns the data files a rag_search / rag_search_batch result was grounded on."""
+    payloads = []
+    structured = result.get("structuredContent") or result.get("structured_content")
+    if isinstance(structured, dict):
+        payloads.append(structured.get("result", structured))
+    for item in result.get("content") or []:
+        try:
+            payloads.append(json.loads(item.get("text") or ""))
+        except Exception:
+            continue
+    sources = set()
+    for payload in payloads:
+        if isinstance(payload, dict):
+            # rag_search: hits in local_results; rag_search_batch: passages in documents
+            hits = list(payload.get("local_results") or []) + list((payload.get("documents") or {}).values())
+            for hit in hits:
+                if isinstance(hit, dict) and hit.get("source"):
+                    sources.add(hit["source"])
+    return sorted(sources)
+
+def _compact_schema(schema):
+    """Drops titles and collapses optional `anyOf [T, null]` so tool schemas cost fewer prompt tokens."""
+    if isinstance(schema, list):
+        return [_compact_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    compact = {key: _compact_schema(value) for key, value in schema.items() if key != "title"}
+    options = compact.get("anyOf")
+    if isinstance(options, list):
+        non_null = [option for option in options if option != {"type": "null"}]
+        if len(non_null) == 1 and len(non_null) < len(options):
+            del compact["anyOf"]
+            compact = {**non_null[0], **compact}
+    if compact.get("default", 0) is None:
+        del compact["default"]
+    return compact
+
+def native_tool_definitions(tools: list[str], resources: list[str]) -> list[dict]:
+    """Ollama `tools` entries built from the MCP tool schemas (first docstring paragraph only)."""
+    definitions = []
+    for name in tools:
+        spec = _tool_specs.get(name, {})
+        description = re.split(r"\n\s*\n", (spec.get("description") or "").strip())[0]
+        definitions.append({
+            "type": "function",
+            "function": {
+                "name": name,
+                "description": " ".join(description.split()),
+                "parameters": _compact_schema(spec.get("input_schema") or {"type": "object", "properties": {}}),
+            },
+        })
+    if resources:
+        # MCP resources are exposed as one extra function
+        definitions.append({
+            "type": "function",
+            "function": {
+                "name": READ_RESOURCE_TOOL,
+                "description": "Reads an MCP resource. Available: " + ", ".join(resources),
+                "parameters": {"type": "object", "properties": {"uri": {"type": "string"}}, "required": ["uri"]},
+            },
+        })
+    return definitions
+
+def native_tool_call(call: dict):
+    """Converts an Ollama tool_calls entry to {"tool", "arguments"} or {"uri"}; None if invalid."""
+    function = call.get("function") or {}
+    name, arguments = function.get("name"), function.get("arguments") or {}
+    if isinstance(arguments, str):
+        try:
+            arguments = json.loads(arguments)
+        except Exception:
+            return None
+    if not isinstance(name, str) or not isinstance(arguments, dict):
+        return None
+    if name == READ_RESOURCE_TOOL:
+        uri = arguments.get("uri")
+        return {"uri": uri} if isinstance(uri, str) and uri.startswith("restaurant://") else None
+    return {"tool": name, "arguments": arguments}
+
+def build_system_prompt(tools: list[str], native: bool = False) -> str:
     base = (
         "You are a helpful and concise assistant. Respond in English unless specifically requested otherwise. do not allucinate, if you don't know the answer, say so or use the tools to find the answer. do not pass the turn to the user if you didn't end your response. \n"
     )
 
+    if tools and native:
+        # Tool schemas travel in the request's `tools` field: only usage hints are needed here
+        return base + (
+            "You can call the provided tools to look up information; call several at once if needed. "
+            "If no tools are needed, answer directly.\n"
+            + ("To look up several things in the restaurant data, prefer one rag_search_batch call.\n"
+               if "rag_search_batch" in tools else "")
+        )
+
     if tools:
         elenco = ", ".join(tools)
-        resources = discover_resources(force=False)
+        # Only restaurant:// resources can be read from MCP blocks (see parse_resource_read)
+        resources = [uri for uri in discover_resources(force=False) if uri.startswith("restaurant://")]
         elenco_res = ", ".join(resources) if resources else "(no resources)"
 
         howto = (
@@ -124,6 +349,9 @@ def build_system_prompt(tools: list[str]) -> str:
             "- Pick the most relevant tools for the user's request. You can use multiple tools if needed.\n"
             "- If you use tools, do not explain the calls — just output the MCP blocks.\n"
             "- You can chain multiple tool calls in sequence to accomplish complex tasks.\n"
+            + ("- To look up several things in the restaurant data, prefer one rag_search_batch call "
+               'with "queries": [...] over several rag_search calls.\n'
+               if "rag_search_batch" in tools else "") +
             "- If no tools are needed, respond normally in English.\n\n"
             "Example multiple tool calls:\n"
             "```mcp\n"
@@ -146,71 +374,244 @@ def build_system_prompt(tools: list[str]) -> str:
         )
 
 
-def stream_chat(messages, temperature=TEMPERATURE):
-    url = f"{OLLAMA_HOST}/api/chat"
+_ctx_buckets: dict[str, int] = {}  # host -> num_ctx of its last request (its model is loaded with it)
+_last_request_at = 0.0  # time.time() of the last request to the chat model
+
+def in_business_hours(now: float | None = None) -> bool:
+    """True if the local hour is inside OLLAMA_BUSINESS_HOURS ("10-23", "18-2"; empty = always)."""
+    if not OLLAMA_BUSINESS_HOURS.strip():
+        return True
+    try:
+        start, end = (int(part) for part in OLLAMA_BUSINESS_HOURS.split("-", 1))
+    except ValueError:
+        return True
+    hour = time.localtime(now).tm_hour
+    return start <= hour < end if start <= end else (hour >= start or hour < end)
+
+def keep_alive() -> str:
+    """keep_alive for the next request: long during business hours, short outside them."""
+    return OLLAMA_KEEP_ALIVE if in_business_hours() else OLLAMA_KEEP_ALIVE_OFF_HOURS
+
+def prompt_tokens(messages, tools=None) -> int:
+    """Estimated prompt size: messages plus the native tool schemas."""
+    tokens = sum(estimate_tokens(message) for message in messages)
+    if tools:
+        tokens += estimate_tokens({"content": json.dumps(tools)})
+    return tokens
+
+def choose_num_ctx(needed: int, host: str = OLLAMA_HOST) -> int:
+    """Smallest context bucket holding `needed` tokens (the largest if none does).
+
+    A larger bucket that is already loaded on `host` is kept as long as it fits:
+    switching down would reload the model, which costs more than the bigger KV
+    cache. Each host loads its own model, so the choice is tracked per host.
+    """
+    fitting = [size for size in CTX_BUCKETS if size >= needed]
+    size = fitting[0] if fitting else CTX_BUCKETS[-1]
+    loaded = _ctx_buckets.get(host, 0)
+    if loaded in fitting and loaded > size:
+        size = loaded
+    _ctx_buckets[host] = size
+    return size
+
+def chat_options(stage: str, messages, tools=None, host: str = OLLAMA_HOST, **overrides) -> dict:
+    """Ollama options for one request to `host`: the stage profile, a fitting num_ctx and overrides."""
+    options = dict(STAGE_PROFILES[stage])
+    options.update(overrides)
+    options["num_ctx"] = choose_num_ctx(prompt_tokens(messages, tools) + options["num_predict"], host)
+    options["num_thread"] = NUM_THREAD
+    options["num_gpu"] = NUM_GPU  # Use GPU if available
+    return options
+
+def chat_payload(messages, stage="answer", tools=None, stream=True, host: str = OLLAMA_HOST, **options) -> dict:
+    """Body of an /api/chat request to `host`: stage options, keep_alive and the native tool schemas."""
+    global _last_request_at
     payload = {
-        "model": MODEL, 
-        "messages": messages, 
-        "stream": True, 
-        "options": {
-            "temperature": temperature,
-            "num_ctx": NUM_CTX,  # Reduce context window for faster processing
-            "num_predict": NUM_PREDICT,  # Limit response length
-            "top_k": TOP_K,  # Reduce top-k for faster token selection
-            "top_p": TOP_P,  # Slightly reduce top-p
-            "repeat_penalty": REPEAT_PENALTY,  # Reduce repetition penalty
-            "num_thread": NUM_THREAD,  # Use more CPU threads
-            "num_gpu": NUM_GPU,  # Use GPU if available
-        }
+        "model": MODEL,
+        "messages": messages,
+        "stream": stream,
+        "options": chat_options(stage, messages, tools, host, **options),
+        "keep_alive": keep_alive(),
     }
+    if tools:
+        payload["tools"] = tools
+    _last_request_at = time.time()
+    return payload
+
+def read_chat_line(line: str):
+    """Decodes one line of a streamed /api/chat response; None for blank or invalid lines."""
+    if not line:
+        return None
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError:
+        return None
+
+def stream_chat(messages, stage="answer", on_delta=None, tools=None, on_tool_call=None, stats=None, **options):
+    """Streams a chat completion to stdout and returns its text.
+
+    stage selects the sampling profile ("tools" or "answer", see STAGE_PROFILES);
+    extra keyword arguments override single options. on_delta(delta) is called
+    for every chunk; if it returns True the stream is closed, which makes Ollama
+    stop generating. With tools (native tool calling), on_tool_call(call)
+    receives every structured tool_calls entry. A stats dict receives the final
+    chunk's counters (done_reason, prompt_eval_count, eval_count, ...).
+    """
+    url = f"{OLLAMA_HOST}/api/chat"
+    payload = chat_payload(messages, stage, tools, **options)
     with requests.post(url, json=payload, stream=True) as r:
         r.raise_for_status()
         full_text = []
         for line in r.iter_lines(decode_unicode=True):
-            if not line:
-                continue
-            try:
-                chunk = json.loads(line)
-            except json.JSONDecodeError:
+            chunk = read_chat_line(line)
+            if chunk is None:
                 continue
             msg = chunk.get("message", {})
+            for call in msg.get("tool_calls") or []:
+                if on_tool_call is not None:
+                    on_tool_call(call)
             delta = msg.get("content", "")
             if delta:
                 full_text.append(delta)
                 print(delta, end="", flush=True)
+                if on_delta is not None and on_delta(delta):
+                    break
             if chunk.get("done"):
+                if stats is not None:
+                    stats.update({key: value for key, value in chunk.items() if key != "message"})
                 break
         print()
         return "".join(full_text)
 
-def parse_tool_call(text):
-    """Parse all tool calls from the text and return a list of tool specifications."""
-    matches = TOOL_BLOCK_RE.findall(text)
-    tool_calls = []
-    for match in matches:
+def warm_up(system_prompt: str, tools=None, host: str = OLLAMA_HOST) -> dict:
+    """Loads the chat model and primes the KV cache with the static system prompt.
+
+    The model is loaded with the options of the first tool pass (a different
+    num_ctx would reload it), then a one-token chat over the system prompt and
+    tool schemas lets Ollama reuse that prefix on the first real turn.
+    Returns timings in seconds.
+    """
+    messages = [{"role": "system", "content": system_prompt}]
+    options = chat_options("tools", messages, tools, host, num_predict=1)
+    timings = {}
+    started = time.perf_counter()
+    # A request without prompt only loads the model
+    r = requests.post(f"{host}/api/generate",
+                      json={"model": MODEL, "options": options, "keep_alive": keep_alive()}, timeout=300)
+    r.raise_for_status()
+    timings["load_seconds"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    payload = chat_payload(messages, "tools", tools, stream=False, host=host, num_predict=1)
+    r = requests.post(f"{host}/api/chat", json=payload, timeout=300)
+    r.raise_for_status()
+    timings["prime_seconds"] = time.perf_counter() - started
+    timings["prompt_tokens"] = r.json().get("prompt_eval_count")
+
+    if ANSWER_CACHE_ENABLED:
+        started = time.perf_counter()
         try:
-            data = json.loads(match)
-            tool = data.get("tool")
-            arguments = data.get("arguments", {})
-            if isinstance(tool, str) and isinstance(arguments, dict):
-                tool_calls.append({"tool": tool, "arguments": arguments})
-        except Exception:
+            embed_text("warm-up", host)
+            timings["embed_seconds"] = time.perf_counter() - started
+        except requests.RequestException as e:
+            print(f"(warm-up of embedding model {OLLAMA_EMBED_MODEL} failed: {e})")
+    return timings
+
+def keep_warm(stop: threading.Event, interval: float = OLLAMA_KEEP_WARM_INTERVAL, hosts=None):
+    """Background loop: during business hours, reloads/refreshes the model after `interval` idle seconds.
+
+    The ping loads the model with the num_ctx last used on each host (without
+    prompt it generates nothing), so an unloaded model is back before the next customer.
+    hosts defaults to [OLLAMA_HOST].
+    """
+    global _last_request_at
+    while not stop.wait(min(interval, 60)):
+        if not in_business_hours() or time.time() - _last_request_at < interval:
             continue
-    return tool_calls
+        for host in hosts or [OLLAMA_HOST]:
+            options = {"num_ctx": _ctx_buckets.get(host) or CTX_BUCKETS[0],
+                       "num_thread": NUM_THREAD, "num_gpu": NUM_GPU}
+            try:
+                requests.post(f"{host}/api/generate",
+                              json={"model": MODEL, "options": options, "keep_alive": keep_alive()},
+                              timeout=300).raise_for_status()
+            except requests.RequestException as e:
+                print(f"(keep-warm ping to {host} failed: {e})")
+        _last_request_at = time.time()
+
+def _parse_mcp_block(raw: str):
+    """Parses the JSON of one ```mcp block into {"tool", "arguments"} or {"uri"}; None if invalid."""
+    try:
+        data = json.loads(raw)
+    except Exception:
+        return None
+    if not isinstance(data, dict):
+        return None
+    tool = data.get("tool")
+    arguments = data.get("arguments", {})
+    if isinstance(tool, str) and isinstance(arguments, dict):
+        return {"tool": tool, "arguments": arguments}
+    uri = data.get("resource")
+    # Only restaurant:// resources can be read from MCP blocks
+    if isinstance(uri, str) and uri.startswith("restaurant://"):
+        return {"uri": uri}
+    return None
+
+def parse_mcp_blocks(text):
+    """Parses every ```mcp block of a complete response once, in order."""
+    calls = [_parse_mcp_block(match) for match in TOOL_BLOCK_RE.findall(text)]
+    return [call for call in calls if call is not None]
+
+def parse_tool_call(text):
+    """Parse all tool calls from the text and return a list of tool specifications."""
+    return [call for call in parse_mcp_blocks(text) if "tool" in call]
 
 def parse_resource_read(text):
     """Parse all resource reads from the text and return a list of resource URIs."""
-    matches = TOOL_BLOCK_RE.findall(text)
-    resource_reads = []
-    for match in matches:
-        try:
-            data = json.loads(match)
-            uri = data.get("resource")
-            if isinstance(uri, str) and uri.startswith("restaurant://"):
-                resource_reads.append({"uri": uri})
-        except Exception:
-            continue
-    return resource_reads
+    return [call for call in parse_mcp_blocks(text) if "uri" in call]
+
+
+class McpBlockParser:
+    """Incremental ```mcp block parser fed with streamed deltas.
+
+    feed() returns the calls whose block was completed by the delta, so they
+    can be dispatched while the model is still generating.
+    """
+
+    OPEN = "```mcp"
+    CLOSE = "```"
+
+    def __init__(self):
+        self.text = ""
+        self.calls = []
+        self._pos = 0  # end of the last complete block
+
+    def feed(self, delta: str) -> list[dict]:
+        self.text += delta
+        completed = []
+        while True:
+            start = self.text.find(self.OPEN, self._pos)
+            if start < 0:
+                break
+            end = self.text.find(self.CLOSE, start + len(self.OPEN))
+            if end < 0:
+                break
+            call = _parse_mcp_block(self.text[start + len(self.OPEN):end].strip())
+            self._pos = end + len(self.CLOSE)
+            if call is not None:
+                self.calls.append(call)
+                completed.append(call)
+        return completed
+
+    def prose_after_blocks(self) -> str:
+        """Text written after the last complete block, minus <think> sections and a pending fence."""
+        tail = THINK_RE.sub("", self.text[self._pos:])
+        fence = tail.find("```")
+        return (tail if fence < 0 else tail[:fence]).strip()
+
+    def should_stop(self) -> bool:
+        """True once the model has made calls and moved on to prose it will not need."""
+        return bool(self.calls) and len(self.prose_after_blocks()) >= MCP_EARLY_STOP_CHARS
 
 def call_client_http(tool: str, arguments: dict) -> dict:
     try:
@@ -238,7 +639,178 @@ def read_client_resource(uri: str) -> dict:
     except Exception as e:
         return {"ok": False, "error": repr(e)}
 
-def main():
+def call_key(call: dict) -> str:
+    return json.dumps(call, sort_keys=True, ensure_ascii=False)
+
+class ToolDispatcher:
+    """Starts tool calls and resource reads on threads as soon as they are known.
+
+    Identical calls run once; collect() waits for them until the deadline,
+    counted from the collect() call: with early dispatch the first calls start
+    while the model is still writing, and that time does not eat into it.
+    """
+
+    def __init__(self, deadline: float = MCP_TURN_DEADLINE, max_workers: int = 8):
+        self.deadline = deadline
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mcp-call")
+        self._futures = {}
+
+    def submit(self, call: dict):
+        key = call_key(call)
+        if key in self._futures:
+            return
+        if "uri" in call:
+            self._futures[key] = self._pool.submit(read_client_resource, call["uri"])
+        else:
+            self._futures[key] = self._pool.submit(call_client_http, call["tool"], call["arguments"])
+
+    def collect(self, calls: list[dict]) -> list[dict]:
+        """Results for calls (submitting any not started yet), in order."""
+        for call in calls:
+            self.submit(call)
+        futures = [self._futures[call_key(call)] for call in calls]
+        if futures:
+            wait(futures, timeout=self.deadline)
+        # Calls still queued are cancelled (done() but without a result)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        return [
+            future.result() if future.done() and not future.cancelled()
+            else {"ok": False, "error": f"Timed out after {self.deadline:g}s"}
+            for future in futures
+        ]
+
+def _dispatch_threaded(items: list[dict], deadline: float) -> list[dict]:
+    """Fallback for clients without /call_batch: one request per item, run on threads."""
+    return ToolDispatcher(deadline, max_workers=min(8, len(items))).collect(items)
+
+def _dispatch_batch(items: list[dict], deadline: float) -> list[dict] | None:
+    """Runs items through the client's /call_batch; None if the endpoint is missing."""
+    results = []
+    started = time.perf_counter()
+    for start in range(0, len(items), MCP_BATCH_MAX_ITEMS):
+        chunk = items[start:start + MCP_BATCH_MAX_ITEMS]
+        remaining = round(max(0.1, deadline - (time.perf_counter() - started)), 2)
+        try:
+            resp = requests.post(
+                f"{MCP_CLIENT_URL}/call_batch",
+                json={"items": chunk, "timeout": remaining},
+                timeout=remaining + 5,
+            )
+            if resp.status_code == 404:
+                return None
+            if resp.status_code != 200:
+                results += [{"ok": False, "error": f"HTTP {resp.status_code}: {resp.text}"}] * len(chunk)
+                continue
+            results += [
+                {"ok": True, "result": entry.get("result")} if entry.get("ok")
+                else {"ok": False, "error": entry.get("error")}
+                for entry in resp.json().get("results", [])
+            ]
+        except Exception as e:
+            results += [{"ok": False, "error": repr(e)}] * len(chunk)
+    return results
+
+def dispatch_calls(calls: list[dict], deadline: float = MCP_TURN_DEADLINE) -> list[dict]:
+    """Runs a turn's tool calls ({"tool", "arguments"}) and resource reads ({"uri"}) concurrently.
+
+    Identical calls run once; every call shares one overall deadline. Results
+    come back in the order of `calls`, in the shape of call_client_http /
+    read_client_resource ({"ok", "result"} or {"ok": False, "error"}).
+    """
+    if not calls:
+        return []
+    keys = [call_key(call) for call in calls]
+    unique = list(dict.fromkeys(keys))
+    items = [json.loads(key) for key in unique]
+    results = _dispatch_batch(items, deadline)
+    if results is None:
+        results = _dispatch_threaded(items, deadline)
+    by_key = dict(zip(unique, results))
+    return [by_key[key] for key in keys]
+
+def native_tools_for(tool_names: list[str]):
+    """Native tool definitions for the current tools and restaurant:// resources (None without tools)."""
+    if not tool_names:
+        return None
+    return native_tool_definitions(
+        tool_names, [uri for uri in discover_resources() if uri.startswith("restaurant://")])
+
+def tools_update_note(tool_names: list[str], text_mode: bool) -> str:
+    return ("Updated available MCP tools: " +
+            (", ".join(tool_names) if tool_names else "(none)") +
+            (". Use only these names in MCP blocks." if text_mode else "."))
+
+def plan_calls(turn_calls: list[dict], tool_names: list[str]) -> list[dict]:
+    """Calls to dispatch for a turn: every resource read, then the calls to available tools."""
+    resources = [{"uri": call["uri"]} for call in turn_calls if "uri" in call]
+    return resources + [call for call in turn_calls if "tool" in call and call["tool"] in tool_names]
+
+def format_results(turn_calls: list[dict], dispatched: list[dict], tool_names: list[str]):
+    """Result texts for the model, given the outcomes of plan_calls(turn_calls) in order.
+
+    Returns (results, cacheable, grounded_sources): the final answer is cacheable
+    only if every call succeeded, depends on local data alone and at least one
+    of them returned data-file sources (answers without them may depend on the
+    chat history and cannot be invalidated).
+    """
+    resource_specs = [call for call in turn_calls if "uri" in call]
+    tool_specs = [call for call in turn_calls if "tool" in call]
+    resource_outcomes = dispatched[:len(resource_specs)]
+    tool_outcomes = iter(dispatched[len(resource_specs):])
+
+    # Resource results first, then tool results, in the order the model asked for them
+    resource_results = []
+    for res_spec, result in zip(resource_specs, resource_outcomes):
+        if not result.get("ok"):
+            msg = f"Error reading MCP resource '{res_spec['uri']}': {result.get('error')}"
+        else:
+            payload = result.get("result", {})
+            text = payload.get("text")
+            msg = f"Resource content {res_spec['uri']}:\n{text}"
+        resource_results.append(msg)
+
+    tool_results = []
+    cacheable = all(spec["tool"] in ANSWER_CACHE_TOOLS for spec in tool_specs)
+    grounded_sources = set()
+    for spec in tool_specs:
+        if spec["tool"] not in tool_names:
+            cacheable = False
+            tool_msg = (f"Error: tool '{spec['tool']}' not available. "
+                        f"Valid tools: {', '.join(tool_names) if tool_names else '(none)'}")
+        else:
+            result = next(tool_outcomes)
+            if not result.get("ok"):
+                cacheable = False
+                tool_msg = f"Error executing MCP tool '{spec['tool']}': {result.get('error')}"
+            else:
+                if isinstance(result.get("result"), dict) and result["result"].get("isError"):
+                    cacheable = False
+                if spec["tool"] in ANSWER_CACHE_TOOLS and isinstance(result.get("result"), dict):
+                    grounded_sources.update(extract_rag_sources(result["result"]))
+                tool_msg = (f"MCP tool result '{spec['tool']}': "
+                            f"{json.dumps(result['result'], ensure_ascii=False)}")
+        tool_results.append(tool_msg)
+    cacheable = cacheable and bool(grounded_sources)
+    return resource_results + tool_results, cacheable, grounded_sources
+
+def finalization_messages(results: list[str], native: bool) -> list[dict]:
+    """Messages handing the tool results back to the model for the final answer."""
+    if native:
+        # Native tool calling: results go back as tool messages
+        return [{"role": "tool", "content": text} for text in results]
+    # Finalization prompt: no further MCP blocks
+    return [{"role": "user",
+             "content": "\n\n".join(results) + "\n\nNow provide the final response for the user, in English, without ```mcp``` blocks."}]
+
+def history_budget(stage: str = "answer", tools=None) -> int:
+    """Tokens available for the chat messages: the largest context minus the reply and tool schemas."""
+    if HISTORY_MAX_TOKENS > 0:
+        return HISTORY_MAX_TOKENS
+    reply_tokens = STAGE_PROFILES[stage]["num_predict"]
+    return max(256, CTX_BUCKETS[-1] - reply_tokens - prompt_tokens([], tools))
+
+def run_local():
+    """Single-user chat loop running the model and tool calls in this process."""
     print(f"🤖 Chat CLI with Ollama + MCP HTTP client – model: {MODEL}")
     print(f"(MCP Client: {MCP_CLIENT_URL})")
     print("Type 'exit' to quit.\n")
@@ -246,8 +818,41 @@ def main():
     # 1) Initial discovery
     tool_names = discover_tools(force=True)
     _ = discover_resources(force=True)
-    system_prompt = build_system_prompt(tool_names)
-    history = [{"role": "system", "content": system_prompt}]
+    tool_mode = TOOL_MODE if TOOL_MODE in {"native", "text"} else "text"
+    system_prompt = build_system_prompt(tool_names, native=tool_mode == "native")
+    history = ChatHistory(system_prompt, history_budget("answer"), keep_turns=HISTORY_KEEP_TURNS,
+                          summary_chars=HISTORY_SUMMARY_CHARS)
+
+    # Cached answers of later turns may depend on this conversation's history,
+    # so only the first turn is shared with other runs (ANSWER_CACHE_FILE)
+    answer_cache = None
+    run_scope = uuid.uuid4().hex
+    turns = 0
+    if ANSWER_CACHE_ENABLED:
+        answer_cache = AnswerCache(
+            embed_text,
+            threshold=ANSWER_CACHE_THRESHOLD,
+            max_entries=ANSWER_CACHE_MAX,
+            ttl=ANSWER_CACHE_TTL,
+            path=ANSWER_CACHE_FILE or None,
+        )
+
+    def current_native_tools():
+        return native_tools_for(tool_names) if tool_mode == "native" else None
+
+    # Cold start: load the model and prime the system prompt before the first question
+    if OLLAMA_WARMUP:
+        print(f"(warming up {MODEL}...)", flush=True)
+        try:
+            timings = warm_up(system_prompt, current_native_tools())
+            print("(warm-up: " + ", ".join(
+                f"{key} {value:.2f}" if isinstance(value, float) else f"{key} {value}"
+                for key, value in timings.items()) + ")")
+        except requests.RequestException as e:
+            print(f"(warm-up failed: {e})")
+    keep_warm_stop = threading.Event()
+    if OLLAMA_KEEP_WARM_INTERVAL > 0:
+        threading.Thread(target=keep_warm, args=(keep_warm_stop,), name="ollama-keep-warm", daemon=True).start()
 
     try:
         while True:
@@ -255,12 +860,7 @@ def main():
             new_tools = discover_tools(force=False)
             if set(new_tools) != set(tool_names):
                 tool_names = new_tools
-                history.append({
-                    "role": "system",
-                    "content": "Updated available MCP tools: " +
-                               (", ".join(tool_names) if tool_names else "(none)") +
-                               ". Use only these names in MCP blocks."
-                })
+                history.add_note(tools_update_note(tool_names, text_mode=tool_mode == "text"))
 
             try:
                 user_input = input("You ▸ ").strip()
@@ -268,75 +868,207 @@ def main():
                 print("\nGoodbye!"); break
 
             if user_input.lower() in {"exit", "quit", ":q"}:
+                if answer_cache is not None:
+                    print(f"(answer cache: {answer_cache.stats()})")
                 print("Goodbye!"); break
+            if user_input == ":cache-stats":
+                print(answer_cache.stats() if answer_cache is not None else "(answer cache disabled)")
+                continue
             if user_input == ":refresh-tools":
-                tool_names = discover_tools(force=True)
-                history.append({
-                    "role": "system",
-                    "content": "Manual tool update: " +
-                               (", ".join(tool_names) if tool_names else "(none)")
-                })
+                tool_names = discover_tools(refresh=True)
+                discover_resources(refresh=True)
+                history.add_note("Manual tool update: " +
+                                 (", ".join(tool_names) if tool_names else "(none)"))
                 continue
             if not user_input:
                 continue
 
-            history.append({"role": "user", "content": user_input})
+            # Older turns are compacted or forgotten so the prompt stays inside NUM_CTX
+            history.compact()
+            history.start_turn(user_input)
+            turns += 1
+
+            # 3) Answer cache: near-duplicate of a past question grounded on unchanged data?
+            cache_scope = None if turns == 1 else run_scope
+            question_vec = rag_status = None
+            if answer_cache is not None:
+                question_vec = answer_cache.embed(user_input)
+                rag_status = fetch_rag_status()
+                hit = answer_cache.lookup(question_vec, rag_status, run_scope)
+                if hit is not None:
+                    entry, similarity = hit
+                    print("AI ▸ " + entry["answer"])
+                    print(f"(answer cache hit: similarity {similarity:.2f}, "
+                          f"saved ~{entry.get('llm_seconds', 0.0):.1f}s of LLM time)")
+                    history.append({"role": "assistant", "content": entry["answer"]})
+                    continue
+
+            # 4) First model response, parsed while it streams: each complete
+            #    ```mcp block is dispatched right away (MCP_EARLY_DISPATCH)
+            #    In native mode structured tool_calls are dispatched the same way.
+            parser = McpBlockParser()
+            dispatcher = ToolDispatcher() if MCP_EARLY_DISPATCH else None
+            native_raw, native_calls = [], []
+
+            def dispatch_early(call):
+                if dispatcher is not None and ("uri" in call or call["tool"] in tool_names):
+                    dispatcher.submit(call)
+
+            def on_delta(delta):
+                for call in parser.feed(delta):
+                    dispatch_early(call)
+                return MCP_EARLY_STOP and parser.should_stop()
+
+            def on_tool_call(raw):
+                native_raw.append(raw)
+                call = native_tool_call(raw)
+                if call is not None:
+                    native_calls.append(call)
+                    dispatch_early(call)
 
-            # 3) First model response
             print("AI ▸ ", end="", flush=True)
-            assistant_text = stream_chat(history)
-            history.append({"role": "assistant", "content": assistant_text})
-
-            # 4) Handle multiple tool-calls and resource reads per turn, then finalize
-            resource_specs = parse_resource_read(assistant_text)
-            tool_specs = parse_tool_call(assistant_text)
-            
-            # Process all resource reads first
-            resource_results = []
-            for res_spec in resource_specs:
-                result = read_client_resource(res_spec["uri"])
-                if not result.get("ok"):
-                    msg = f"Error reading MCP resource '{res_spec['uri']}': {result.get('error')}"
-                else:
-                    payload = result.get("result", {})
-                    text = payload.get("text")
-                    msg = f"Resource content {res_spec['uri']}:\n{text}"
-                resource_results.append(msg)
-            
-            # Process all tool calls
-            tool_results = []
-            for spec in tool_specs:
-                if spec["tool"] not in tool_names:
-                    tool_msg = (f"Error: tool '{spec['tool']}' not available. "
-                                f"Valid tools: {', '.join(tool_names) if tool_names else '(none)'}")
-                else:
-                    result = call_client_http(spec["tool"], spec["arguments"])
-                    if not result.get("ok"):
-                        tool_msg = f"Error executing MCP tool '{spec['tool']}': {result.get('error')}"
-                    else:
-                        tool_msg = (f"MCP tool result '{spec['tool']}': "
-                                    f"{json.dumps(result['result'], ensure_ascii=False)}")
-                tool_results.append(tool_msg)
-            
+            llm_started = time.perf_counter()
+            native_tools = current_native_tools()
+
+            def first_pass(tools):
+                # Tool-decision pass with the tight "tools" budget. When it runs out before
+                # any tool call, the model is answering directly (or still thinking): the
+                # partial reply is continued with the "answer" budget.
+                messages = history.messages(history_budget("tools", tools))
+                stats = {}
+                text = stream_chat(messages, stage="tools", on_delta=on_delta, tools=tools,
+                                   on_tool_call=on_tool_call, stats=stats)
+                remaining = STAGE_PROFILES["answer"]["num_predict"] - STAGE_PROFILES["tools"]["num_predict"]
+                if stats.get("done_reason") == "length" and not parser.calls and not native_calls and remaining > 0:
+                    text += stream_chat(messages + [{"role": "assistant", "content": text}], stage="answer",
+                                        on_delta=on_delta, tools=tools, on_tool_call=on_tool_call,
+                                        num_predict=remaining)
+                return text
+
+            try:
+                assistant_text = first_pass(native_tools)
+            except requests.HTTPError as e:
+                if native_tools is None or e.response is None or e.response.status_code != 400:
+                    raise
+                # Model without tool support: switch to the ```mcp text protocol for the session
+                print(f"(native tools not supported by {MODEL}: using the text tool protocol)")
+                tool_mode = "text"
+                history.set_system(build_system_prompt(tool_names))
+                print("AI ▸ ", end="", flush=True)
+                assistant_text = first_pass(None)
+            llm_seconds = time.perf_counter() - llm_started
+            assistant_message = {"role": "assistant", "content": assistant_text}
+            if native_raw:
+                assistant_message["tool_calls"] = native_raw
+            history.append(assistant_message)
+
+            # 5) Handle multiple tool-calls and resource reads per turn, then finalize
+            turn_calls = parser.calls + native_calls
+            calls = plan_calls(turn_calls, tool_names)
+            dispatched = dispatcher.collect(calls) if dispatcher is not None else dispatch_calls(calls)
+            results, cacheable, grounded_sources = format_results(turn_calls, dispatched, tool_names)
+
             # If any tools or resources were used, provide results and get final response
-            if resource_results or tool_results:
-                all_results = resource_results + tool_results
-                results_text = "\n\n".join(all_results)
-                
-                # Finalization prompt: no further MCP blocks
-                history.append({"role": "user",
-                                "content": results_text + "\n\nNow provide the final response for the user, in English, without ```mcp``` blocks."})
+            if results:
+                history.extend(finalization_messages(results, native=bool(native_calls)))
                 print("AI ▸ ", end="", flush=True)
-                assistant_text = stream_chat(history)
+                llm_started = time.perf_counter()
+                assistant_text = stream_chat(history.messages(history_budget("answer")), stage="answer")
+                llm_seconds += time.perf_counter() - llm_started
                 # Filter any remaining MCP blocks in output (not in memory)
                 assistant_text_clean = re.sub(TOOL_BLOCK_RE, "", assistant_text).strip()
-                if assistant_text_clean != assistant_text:
+                if TOOL_BLOCK_RE.search(assistant_text):
                     print("\rAI ▸ " + assistant_text_clean)  # re-print clean (optional)
                 history.append({"role": "assistant", "content": assistant_text})
+                final_answer = assistant_text_clean
+            else:
+                final_answer = assistant_text
+
+            if answer_cache is not None and cacheable and not TOOL_BLOCK_RE.search(final_answer):
+                answer_cache.store(user_input, question_vec, final_answer, rag_status,
+                                   sorted(grounded_sources), llm_seconds, cache_scope)
 
     except KeyboardInterrupt:
         print("\nInterrupted. Goodbye!")
         sys.exit(0)
+    finally:
+        keep_warm_stop.set()
+
+def iter_sse(response):
+    """Yields (event, data) pairs from a text/event-stream response."""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+def main():
+    """Thin CLI client of chat_server.py (`--local` runs the model in this process instead)."""
+    if "--local" in sys.argv[1:]:
+        return run_local()
+
+    print(f"🤖 Chat CLI – chat server: {CHAT_SERVER_URL}")
+    print("Type 'exit' to quit.\n")
+    try:
+        resp = requests.post(f"{CHAT_SERVER_URL}/sessions", timeout=30)
+        resp.raise_for_status()
+    except requests.RequestException as e:
+        print(f"Chat server not reachable ({e}). Start it with `python chat_server.py` "
+              f"or run `python ollama_bot.py --local`.")
+        return
+    session_id = resp.json()["session_id"]
+
+    try:
+        while True:
+            try:
+                user_input = input("You ▸ ").strip()
+            except EOFError:
+                print("\nGoodbye!"); break
+
+            if user_input.lower() in {"exit", "quit", ":q"}:
+                print("Goodbye!"); break
+            if user_input == ":cache-stats":
+                print(requests.get(f"{CHAT_SERVER_URL}/stats", timeout=30).json().get("answer_cache"))
+                continue
+            if user_input == ":refresh-tools":
+                print(requests.post(f"{CHAT_SERVER_URL}/refresh-tools", timeout=30).json())
+                continue
+            if not user_input:
+                continue
+
+            try:
+                with requests.post(f"{CHAT_SERVER_URL}/sessions/{session_id}/messages",
+                                   json={"content": user_input}, stream=True, timeout=(10, None)) as r:
+                    r.raise_for_status()
+                    for event, data in iter_sse(r):
+                        if event == "pass":
+                            print("AI ▸ ", end="", flush=True)
+                        elif event == "token":
+                            print(data["text"], end="", flush=True)
+                        elif event == "pass_end":
+                            print()
+                        elif event == "notice":
+                            print(f"({data['text']})")
+                        elif event == "done" and data.get("cleaned"):
+                            print("\rAI ▸ " + data["answer"])  # re-print without MCP blocks
+                        elif event == "error":
+                            print(f"\n(error: {data['error']})")
+            except requests.RequestException as e:
+                print(f"\n(chat server error: {e})")
+    except KeyboardInterrupt:
+        print("\nInterrupted. Goodbye!")
+    finally:
+        try:
+            requests.delete(f"{CHAT_SERVER_URL}/sessions/{session_id}", timeout=5)
+        except requests.RequestException:
+            pass
 
 if __name__ == "__main__":
     main()
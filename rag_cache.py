@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Query cache for rag_search.
+Two tiers: an in-process LRU with TTL and an optional sqlite file shared by
+every server process. Result entries are keyed on the index version, so a
+change to the data files makes them unreachable; query embeddings are keyed
+on the embedding model only.
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict
+
+from rag_config import CACHE_CONFIG
+
+_MISSING = object()
+
+
+def normalize_query(query: str) -> str:
+    """Normalizes query text for cache keys: case, whitespace and trailing punctuation."""
+    text = re.sub(r"\s+", " ", (query or "").strip().lower())
+    return text.rstrip("?!.;, ")
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after ttl seconds."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: str, value: Any):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SqliteCache:
+    """On-disk cache tier in a sqlite file, safe to share between processes."""
+
+    def __init__(self, path: Path, ttl: float):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, version TEXT, value TEXT, expires REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any, version: str = ""):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, version, value, expires) VALUES (?, ?, ?, ?)",
+                (key, version, json.dumps(value, ensure_ascii=False), time.time() + self.ttl),
+            )
+            self._conn.commit()
+
+    def purge(self, keep_version: str | None = None):
+        """Drops expired entries and, if given, versioned entries of any other index version."""
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+            if keep_version is not None:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE version != '' AND version != ?", (keep_version,)
+                )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class QueryCache:
+    """Caches query embeddings and final rag_search results.
+
+    Lookups try memory first, then disk (if enabled); disk hits are promoted
+    to memory.
+    """
+
+    def __init__(self, embedding_model: str, disk_path: Path | None = None):
+        self.embedding_model = embedding_model
+        self.version = ""
+        self.embeddings = TTLCache(CACHE_CONFIG["embedding_max_entries"], CACHE_CONFIG["embedding_ttl_seconds"])
+        self.results = TTLCache(CACHE_CONFIG["max_entries"], CACHE_CONFIG["ttl_seconds"])
+        self.disk = None
+        if CACHE_CONFIG["disk_enabled"] and disk_path is not None:
+            try:
+                self.disk = SqliteCache(disk_path, CACHE_CONFIG["ttl_seconds"])
+            except Exception as e:
+                print(f"Disk query cache disabled ({disk_path}): {e}")
+
+    # --- Keys ---
+    def _embedding_key(self, query: str) -> str:
+        return f"emb|{self.embedding_model}|{normalize_query(query)}"
+
+    def _result_key(self, query: str, top_k: int, version: str, variant: str) -> str:
+        return f"res|{version}|{top_k}|{variant}|{normalize_query(query)}"
+
+    # --- Tiered get/put ---
+    def _get(self, memory: TTLCache, key: str):
+        value = memory.get(key, _MISSING)
+        if value is _MISSING and self.disk is not None:
+            value = self.disk.get(key, _MISSING)
+            if value is not _MISSING:
+                memory.put(key, value)
+        return None if value is _MISSING else value
+
+    def _put(self, memory: TTLCache, key: str, value: Any, version: str = ""):
+        memory.put(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, value, version)
+            except Exception as e:
+                print(f"Error writing disk query cache: {e}")
+
+    def get_embedding(self, query: str):
+        return self._get(self.embeddings, self._embedding_key(query))
+
+    def put_embedding(self, query: str, vector):
+        self._put(self.embeddings, self._embedding_key(query), vector)
+
+    def get_results(self, query: str, top_k: int, version: str, variant: str = ""):
+        """variant distinguishes other search options (e.g. the retrieval mode)."""
+        return self._get(self.results, self._result_key(query, top_k, version, variant))
+
+    def put_results(self, query: str, top_k: int, version: str, results, variant: str = ""):
+        self._put(self.results, self._result_key(query, top_k, version, variant), results, version)
+
+    def set_version(self, version: str):
+        """Called when the index changes: drops result entries of older versions."""
+        if version == self.version:
+            return
+        self.version = version
+        self.results.clear()
+        if self.disk is not None:
+            try:
+                self.disk.purge(keep_version=version)
+            except Exception as e:
+                print(f"Error purging disk query cache: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "results": {"entries": len(self.results), "hits": self.results.hits, "misses": self.results.misses},
+            "embeddings": {"entries": len(self.embeddings), "hits": self.embeddings.hits, "misses": self.embeddings.misses},
+        }
+        if self.disk is not None:
+            stats["disk"] = {"path": str(self.disk.path), "hits": self.disk.hits, "misses": self.disk.misses}
+        return stats
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Structure-aware chunking for the RAG ingest path.
+Splits data files on markdown headers, section labels (e.g. "Antipasti:",
+"Primi:" in menus) and paragraphs, then packs the pieces into chunks of at
+most CHUNK_CONFIG["chunk_size"] characters with a configurable overlap.
+"""
+
+import re
+from typing import Any, Dict, List, Tuple
+
+from rag_config import CHUNK_CONFIG
+
+# "# Title", "## Subtitle", ...
+MD_HEADER_RE = re.compile(r"^\s{0,3}#{1,6}\s+\S")
+# A short line ending with ':' and nothing after it, e.g. "Antipasti:" or "**Pet Guidelines:**"
+SECTION_LABEL_RE = re.compile(r"^\s*(?:\*\*|__)?[^\W\d_][^:\n]{0,48}:(?:\*\*|__)?\s*$")
+PARAGRAPH_BREAK_RE = re.compile(r"\n[ \t]*\n")
+
+
+def chunking_signature() -> str:
+    """Short string identifying the chunking settings (stored with indexed chunks)."""
+    return "{chunk_size}/{chunk_overlap}/{split_on_headers:d}".format(**CHUNK_CONFIG)
+
+
+def _is_section_header(line: str) -> bool:
+    return bool(MD_HEADER_RE.match(line) or SECTION_LABEL_RE.match(line))
+
+
+def _split_sections(text: str) -> List[Tuple[int, int, str]]:
+    """Splits text into (start, end, header_line) sections at headers and section labels."""
+    if not CHUNK_CONFIG["split_on_headers"]:
+        return [(0, len(text), "")]
+
+    sections = []
+    start, header = 0, ""
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        if _is_section_header(line) and offset > start:
+            sections.append((start, offset, header))
+            start = offset
+        if _is_section_header(line) and offset == start:
+            header = line.strip()
+        offset += len(line)
+    sections.append((start, len(text), header))
+    return sections
+
+
+def _trim(text: str, start: int, end: int) -> Tuple[int, int]:
+    """Shrinks [start, end) so it does not begin or end with whitespace."""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _split_units(text: str, start: int, end: int, chunk_size: int, chunk_overlap: int) -> List[Tuple[int, int]]:
+    """Splits a section into units no longer than chunk_size: paragraphs, then lines, then windows."""
+    units = []
+    para_start = start
+    for match in list(PARAGRAPH_BREAK_RE.finditer(text, start, end)) + [None]:
+        para_end = match.start() if match else end
+        p_start, p_end = _trim(text, para_start, para_end)
+        para_start = match.end() if match else end
+        if p_start >= p_end:
+            continue
+        if p_end - p_start <= chunk_size:
+            units.append((p_start, p_end))
+            continue
+
+        # Paragraph too long: fall back to lines
+        line_start = p_start
+        for line in text[p_start:p_end].splitlines(keepends=True):
+            l_start, l_end = _trim(text, line_start, line_start + len(line))
+            line_start += len(line)
+            if l_start >= l_end:
+                continue
+            if l_end - l_start <= chunk_size:
+                units.append((l_start, l_end))
+                continue
+
+            # Line too long: fixed windows, broken at whitespace when possible
+            w_start = l_start
+            while w_start < l_end:
+                w_end = min(w_start + chunk_size, l_end)
+                if w_end < l_end:
+                    space = text.rfind(" ", w_start + chunk_size // 2, w_end)
+                    if space > w_start:
+                        w_end = space
+                units.append(_trim(text, w_start, w_end))
+                if w_end >= l_end:
+                    break
+                w_start = max(w_end - chunk_overlap, w_start + 1)
+    return units
+
+
+def _pack_units(units: List[Tuple[int, int]], chunk_size: int, chunk_overlap: int) -> List[Tuple[int, int]]:
+    """Greedily packs consecutive units into chunks, repeating trailing units up to chunk_overlap chars."""
+    chunks = []
+    current: List[Tuple[int, int]] = []
+    for unit in units:
+        if current and unit[1] - current[0][0] > chunk_size:
+            chunks.append((current[0][0], current[-1][1]))
+            # Carry over trailing units that fit in the overlap budget
+            carry: List[Tuple[int, int]] = []
+            for prev in reversed(current):
+                if current[-1][1] - prev[0] > chunk_overlap or unit[1] - prev[0] > chunk_size:
+                    break
+                carry.insert(0, prev)
+            current = carry
+        current.append(unit)
+    if current:
+        chunks.append((current[0][0], current[-1][1]))
+    return chunks
+
+
+def chunk_text(text: str) -> List[Dict[str, Any]]:
+    """Splits a document into chunks.
+
+    Returns a list of {"text", "start_offset", "end_offset", "section"} where
+    offsets index into the original text. The section header line is kept
+    out of the offsets and prepended to every chunk of its section, so each
+    chunk still carries its context (e.g. "Primi:").
+    """
+    chunk_size = max(1, int(CHUNK_CONFIG["chunk_size"]))
+    chunk_overlap = max(0, min(int(CHUNK_CONFIG["chunk_overlap"]), chunk_size // 2))
+
+    chunks = []
+    parent_header = ""
+    for sec_start, sec_end, header in _split_sections(text):
+        body_start = sec_start
+        if header:
+            newline = text.find("\n", sec_start, sec_end)
+            body_start = sec_end if newline < 0 else newline + 1
+        units = _split_units(text, body_start, sec_end, chunk_size, chunk_overlap)
+
+        # A header with no body (e.g. "# Title" right above "## Sub") becomes context for the next section
+        if not units:
+            parent_header = "\n".join(filter(None, [parent_header, header]))
+            continue
+
+        context = "\n".join(filter(None, [parent_header, header]))
+        section = header.strip("#*_ ").rstrip(":*_ ")
+        for start, end in _pack_units(units, chunk_size, chunk_overlap):
+            chunks.append({
+                "text": "\n".join(filter(None, [context, text[start:end]])),
+                "start_offset": start,
+                "end_offset": end,
+                "section": section,
+            })
+        parent_header = ""
+    return chunks
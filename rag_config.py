@@ -25,6 +25,88 @@ SEARCH_CONFIG = {
     "min_relevance_score": 0.1,  # Minimum relevance score
 }
 
+# Context packing: bounds how much retrieved text is handed to the LLM
+CONTEXT_CONFIG = {
+    # Context window of the chat model, used when OLLAMA_NUM_CTX is not set
+    "num_ctx": 2048,
+    # Share of the context window that retrieved passages may fill
+    "context_fraction": float(os.environ.get("RAG_CONTEXT_FRACTION", "0.4")),
+    # Rough token estimate used without a tokenizer
+    "chars_per_token": 4.0,
+    # MMR trade-off between relevance (1.0) and diversity (0.0)
+    "mmr_lambda": 0.7,
+    # Passages at least this similar (term Jaccard) to a kept one are dropped
+    "duplicate_threshold": 0.8,
+    # Excerpts shorter than this are not worth returning
+    "min_excerpt_tokens": 30,
+}
+
+# Query routing configuration (type-filtered search)
+ROUTER_CONFIG = {
+    # Predict the document type(s) from the query and search those first
+    "enabled": True,
+    # Keywords in customer questions, added to DATA_CONFIG["type_patterns"]
+    "query_patterns": {
+        "menu": ["eat", "vegetarian", "vegan", "dessert", "desserts", "drink", "drinks", "wine",
+                 "pasta", "pizza", "antipasti", "primi", "secondi", "dolci", "piatti", "mangiare"],
+        "location": ["located", "directions", "parking", "indirizzo", "dove"],
+        "contact": ["call", "number", "reservation", "book", "booking", "telefono", "prenotare"],
+        "hours": ["close", "closed", "closing", "opening", "sunday", "monday", "weekend", "orari", "aperto"],
+        "special": ["discount", "deal", "deals", "happy", "birthday", "student", "offerta", "sconto"],
+        "policy": ["dog", "dogs", "pet", "pets", "animal", "animals", "allowed", "cani", "animali"],
+    },
+    # Pattern names covering several file types (see _determine_file_type)
+    "type_families": {
+        "menu": ["menu", "menu_today", "menu_dated"],
+    },
+}
+
+# Hybrid retrieval configuration (BM25 + vector)
+HYBRID_CONFIG = {
+    "default_mode": "auto",          # "auto", "hybrid", "vector" or "lexical"
+    "lexical_max_terms": 2,          # "auto": queries with at most this many terms skip the embedding model
+    "candidate_multiplier": 3,       # Hybrid: each ranking contributes top_k * multiplier candidates
+    "rrf_k": 60,                     # Reciprocal rank fusion constant
+    "bm25_k1": 1.5,
+    "bm25_b": 0.75,
+    "lexical_score_midpoint": 4.0,   # BM25 score mapped to relevance_score 0.5
+}
+
+# Query cache configuration (rag_search)
+CACHE_CONFIG = {
+    "max_entries": 1024,              # In-memory result lists
+    "ttl_seconds": 600,               # Result TTL (results are also keyed on the index version)
+    "embedding_max_entries": 4096,    # In-memory query embeddings
+    "embedding_ttl_seconds": 86400,
+    # Optional sqlite tier shared by all server processes
+    "disk_enabled": os.environ.get("RAG_CACHE_DISK", "0").lower() in {"1", "true", "yes"},
+    "disk_file": "rag_cache.sqlite3",  # Inside the data directory
+    # Pre-populate the cache at startup with the example and test queries
+    "warmup": True,
+}
+
+# Chunking configuration (ingest path)
+CHUNK_CONFIG = {
+    "chunk_size": 400,         # Maximum characters per chunk
+    "chunk_overlap": 60,       # Characters repeated between consecutive chunks of a section
+    "split_on_headers": True,  # Markdown headers and "Label:" lines (e.g. "Primi:") start a new chunk
+}
+
+# Persistent embedding store (content-addressed, reused across restarts and rebuilds)
+EMBEDDING_STORE_CONFIG = {
+    "enabled": True,
+    "directory": "embedding_store",  # Inside the data directory
+    "dtype": "float16",              # "float16" halves disk size, "float32" keeps full precision
+}
+
+# Ingest pipeline configuration
+INGEST_CONFIG = {
+    "reader_threads": 4,         # Threads reading and chunking files
+    "batch_size": 64,            # Chunks per embedding + upsert batch (bounds ingest memory)
+    "progress_every": 50,        # Print progress every N files
+    "manifest_page_size": 1000,  # Page size when reading the indexed manifest from Chroma
+}
+
 # Data files configuration
 DATA_CONFIG = {
     # Supported text file extensions
@@ -40,7 +122,9 @@ DATA_CONFIG = {
     },
     "data_dir": os.environ.get("RESTAURANT_DATA_DIR", "data"),
     # Auto-rebuild database on startup
-    "auto_rebuild": True
+    "auto_rebuild": True,
+    # Seconds between background stat scans of the data directory (0 disables the watcher)
+    "watch_interval": float(os.environ.get("RAG_WATCH_INTERVAL", "2.0"))
 }
 
 # Web search configuration
@@ -48,7 +132,19 @@ WEB_SEARCH_CONFIG = {
     "default_country": "it",
     "default_language": "it",
     "timeout": 15,
-    "max_retries": 3
+    "max_retries": 3,
+    # Brave endpoint (point it at fake_brave_server.py for tests and benchmarks)
+    "base_url": os.environ.get("BRAVE_API_URL", "https://api.search.brave.com/res/v1/web/search"),
+    # First retry delay in seconds, doubled on every further attempt
+    "backoff_seconds": 0.5,
+    "max_backoff_seconds": 8.0,
+    # Maximum concurrent requests to the API (also the HTTP connection pool size)
+    "max_concurrency": int(os.environ.get("BRAVE_MAX_CONCURRENCY", "4")),
+    # Response cache: fresh for cache_ttl_seconds, then served stale for up to
+    # stale_ttl_seconds more while a background request refreshes it
+    "cache_ttl_seconds": float(os.environ.get("BRAVE_CACHE_TTL", "900")),
+    "stale_ttl_seconds": float(os.environ.get("BRAVE_CACHE_STALE_TTL", "3600")),
+    "cache_max_entries": 512,
 }
 
 # Logging configuration
@@ -99,7 +195,7 @@ def get_tool_description() -> str:
     Features:
     - Dynamic file discovery: Automatically loads all text files from data directory
     - Supported formats: .txt, .md, .rst, .text files
-    - Semantic search on local data using ChromaDB
+    - Semantic search on local data using ChromaDB, fused with BM25 keyword search
     - Relevance score for result ranking
     - Support for metadata and sources
     - Auto-rebuilds database on server restart
@@ -107,6 +203,9 @@ def get_tool_description() -> str:
     Parameters:
     - query/question/q: Search query (required)
     - top_k: Number of local results (default: 3, max: 10)
+    - mode: "auto" (default), "hybrid" (BM25 + vector), "vector" or "lexical"
+    - type/types: restrict to document types (e.g. "menu", "hours", "policy"); by default
+      the type is predicted from the query and searched first
     
     Examples:
     - Search menu: query="Today's menu"
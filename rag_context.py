@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Context packing for RAG results.
+Turns ranked hits into a bounded context for the LLM. It drops hits below
+the relevance floor and removes near-duplicate passages with maximal
+marginal relevance (MMR). The remaining passages are excerpted around the
+query terms until they fit a token budget.
+"""
+
+import math
+import os
+import re
+from typing import Any, Dict, List, Set, Tuple
+
+from rag_config import CONTEXT_CONFIG, SEARCH_CONFIG
+from rag_lexical import tokenize
+
+_SENTENCE_RE = re.compile(r"[^.!?]+[.!?]*\s*")
+
+# Tokens charged per passage for its source/section labels in the prompt
+_PASSAGE_OVERHEAD_TOKENS = 8
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (no tokenizer needed): characters / chars_per_token."""
+    return int(math.ceil(len(text or "") / CONTEXT_CONFIG["chars_per_token"]))
+
+
+def default_budget() -> int:
+    """Token budget for retrieved passages, derived from the chat model's context window.
+
+    OLLAMA_NUM_CTX is read at call time so values loaded from .env after import apply.
+    """
+    num_ctx = int(os.environ.get("OLLAMA_NUM_CTX", CONTEXT_CONFIG["num_ctx"]))
+    return max(1, int(num_ctx * CONTEXT_CONFIG["context_fraction"]))
+
+
+def _similarity(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _select_mmr(results: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """Orders hits by MMR over term sets and drops near-duplicates; returns (selected, dropped)."""
+    lam = CONTEXT_CONFIG["mmr_lambda"]
+    threshold = CONTEXT_CONFIG["duplicate_threshold"]
+    remaining = [(item, set(tokenize(item.get("content", "")))) for item in results]
+    selected: List[Tuple[Dict[str, Any], Set[str]]] = []
+    dropped = 0
+    while remaining:
+        best_index, best_score = None, None
+        for index, (item, terms) in enumerate(remaining):
+            redundancy = max((_similarity(terms, kept) for _, kept in selected), default=0.0)
+            if redundancy >= threshold:
+                continue
+            score = lam * item.get("relevance_score", 0.0) - (1 - lam) * redundancy
+            if best_score is None or score > best_score:
+                best_index, best_score = index, score
+        if best_index is None:
+            dropped += len(remaining)
+            break
+        selected.append(remaining.pop(best_index))
+    return [item for item, _ in selected], dropped
+
+
+def excerpt(text: str, query: str, max_tokens: int) -> str:
+    """Shortens text to about max_tokens, keeping the lines that mention query terms.
+
+    Lines keep their original order; gaps are marked with "...". The first line
+    (usually the section header) is preferred when nothing else matches better.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = int(max_tokens * CONTEXT_CONFIG["chars_per_token"])
+    terms = set(tokenize(query))
+
+    segments = []
+    for line in text.splitlines():
+        if len(line) <= max_chars:
+            segments.append(line)
+        else:
+            segments.extend(part.strip() for part in _SENTENCE_RE.findall(line) if part.strip())
+
+    def score(index: int) -> float:
+        matches = len(terms.intersection(tokenize(segments[index])))
+        return matches + (0.5 if index == 0 else 0.0)
+
+    chosen, used = set(), 0
+    for index in sorted(range(len(segments)), key=lambda i: (-score(i), i)):
+        cost = len(segments[index]) + 4
+        if segments[index].strip() and used + cost <= max_chars:
+            chosen.add(index)
+            used += cost
+
+    if not chosen:
+        # A single segment longer than the budget: cut a window around the first match
+        lowered = text.lower()
+        positions = [lowered.find(term) for term in terms if lowered.find(term) >= 0]
+        start = max(0, min(positions, default=0) - max_chars // 4)
+        return ("..." if start else "") + text[start:start + max_chars].strip() + "..."
+
+    parts, previous = [], -1
+    for index in sorted(chosen):
+        if index != previous + 1:
+            parts.append("...")
+        parts.append(segments[index])
+        previous = index
+    if previous != len(segments) - 1:
+        parts.append("...")
+    return "\n".join(parts)
+
+
+def pack_context(query: str, results: List[Dict[str, Any]], max_tokens: int | None = None):
+    """Fits ranked RAG hits into a token budget.
+
+    Steps: drop hits below SEARCH_CONFIG["min_relevance_score"], reorder with
+    MMR while dropping near-duplicates, then add passages whole while they
+    fit and excerpt the next one into the remaining budget.
+
+    Returns (packed hits, info); excerpted hits have "excerpt": True.
+    """
+    budget = default_budget() if max_tokens is None else max(1, int(max_tokens))
+    floor = SEARCH_CONFIG["min_relevance_score"]
+    relevant = [item for item in results if item.get("relevance_score", 0.0) >= floor]
+    ordered, duplicates = _select_mmr(relevant)
+
+    packed: List[Dict[str, Any]] = []
+    used = 0
+    excerpted = 0
+    for item in ordered:
+        available = budget - used - _PASSAGE_OVERHEAD_TOKENS
+        if available < CONTEXT_CONFIG["min_excerpt_tokens"]:
+            break
+        content = item.get("content", "")
+        packed_item = dict(item)
+        if estimate_tokens(content) > available:
+            packed_item["content"] = excerpt(content, query, available)
+            packed_item["excerpt"] = True
+            excerpted += 1
+        used += estimate_tokens(packed_item["content"]) + _PASSAGE_OVERHEAD_TOKENS
+        packed.append(packed_item)
+
+    info = {
+        "budget_tokens": budget,
+        "context_tokens": used,
+        "dropped_low_relevance": len(results) - len(relevant),
+        "dropped_duplicates": duplicates,
+        "dropped_over_budget": len(ordered) - len(packed),
+        "excerpted": excerpted,
+    }
+    return packed, info
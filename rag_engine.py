@@ -0,0 +1,849 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Long-lived RAG engine for the MCP server.
+Owns the ChromaDB client, the collection, the embedding model and the index
+version, keeps the index in sync with the data directory and serves searches.
+"""
+
+import hashlib
+import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, List
+
+import chromadb
+from chromadb.config import Settings
+from sentence_transformers import SentenceTransformer
+
+from embedding_store import EmbeddingStore
+from rag_cache import QueryCache
+from rag_chunking import chunk_text, chunking_signature
+from rag_lexical import BM25Index, lexical_relevance, reciprocal_rank_fusion, tokenize
+from rag_config import (
+    CACHE_CONFIG,
+    CHROMA_CONFIG,
+    DATA_CONFIG,
+    EMBEDDING_STORE_CONFIG,
+    HYBRID_CONFIG,
+    INGEST_CONFIG,
+    ROUTER_CONFIG,
+    SEARCH_CONFIG,
+    TEST_CONFIG,
+    get_example_queries,
+)
+
+# Retrieval modes accepted by RagEngine.search()
+SEARCH_MODES = ("auto", "hybrid", "vector", "lexical")
+
+# Text files indexed from the data directory
+_TEXT_EXTENSIONS = {ext.lower() for ext in DATA_CONFIG["supported_extensions"]}
+
+
+def _iter_text_files(data_dir: Path) -> Dict[str, Path]:
+    """Returns the indexable text files in the data directory, keyed by relative path."""
+    files = {}
+    for file_path in data_dir.rglob('*'):
+        if file_path.is_file() and file_path.suffix.lower() in _TEXT_EXTENSIONS:
+            files[str(file_path.relative_to(data_dir))] = file_path
+    return files
+
+def _get_file_hash(file_path: Path) -> str:
+    """Get a hash of file content (touching a file does not change it)."""
+    try:
+        return hashlib.sha256(file_path.read_bytes()).hexdigest()
+    except Exception:
+        return ""
+
+def _chunk_id(relative_path: str, chunk_index: int) -> str:
+    """Stable document ID for a chunk of a data file."""
+    return f"{relative_path}#{chunk_index}"
+
+def _diff_manifests(old: Dict[str, str], new: Dict[str, str]):
+    """Returns (added, changed, removed) relative paths between two manifests."""
+    added = sorted(path for path in new if path not in old)
+    changed = sorted(path for path in new if path in old and old[path] != new[path])
+    removed = sorted(path for path in old if path not in new)
+    return added, changed, removed
+
+def _manifest_version(manifest: Dict[str, str]) -> str:
+    """Deterministic index version: same data files, chunking and metric -> same version, across processes."""
+    payload = json.dumps([chunking_signature(), CHROMA_CONFIG["distance_metric"], sorted(manifest.items())],
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _determine_file_type(file_path: Path) -> str:
+    """Determines the type of a file based on its name and content."""
+    filename = file_path.name.lower()
+
+    # Menu files
+    if 'menu' in filename:
+        if 'today' in filename:
+            return 'menu_today'
+        elif any(date_pattern in filename for date_pattern in ['2024', '2025', '2023']):
+            return 'menu_dated'
+        else:
+            return 'menu'
+
+    # Location files
+    if any(loc_word in filename for loc_word in ['location', 'address', 'where', 'map']):
+        return 'location'
+
+    # Contact files
+    if any(contact_word in filename for contact_word in ['contact', 'phone', 'email', 'info']):
+        return 'contact'
+
+    # Hours files
+    if any(hour_word in filename for hour_word in ['hours', 'schedule', 'time', 'open']):
+        return 'hours'
+
+    # Special files
+    if 'special' in filename or 'promo' in filename:
+        return 'special'
+
+    if 'policy' in filename or 'terms' in filename:
+        return 'policy'
+
+    # Default type based on extension
+    if file_path.suffix == '.md':
+        return 'markdown'
+    elif file_path.suffix == '.rst':
+        return 'restructured'
+    else:
+        return 'general'
+
+
+def expand_types(types: List[str]) -> List[str]:
+    """Maps type names (file types or type_patterns keys like "menu") to the file types they cover."""
+    families = ROUTER_CONFIG["type_families"]
+    expanded: List[str] = []
+    for name in types:
+        for file_type in families.get(name, [name]):
+            if file_type not in expanded:
+                expanded.append(file_type)
+    return expanded
+
+
+def route_query(query: str) -> List[str]:
+    """Predicts the file types a question is about from type keywords; empty if unsure."""
+    terms = set(tokenize(query))
+    matched = []
+    for name, keywords in DATA_CONFIG["type_patterns"].items():
+        extra = ROUTER_CONFIG["query_patterns"].get(name, [])
+        if terms.intersection(tokenize(" ".join(keywords + extra))):
+            matched.append(name)
+    return expand_types(matched)
+
+
+def _collection_space(collection) -> str:
+    """Distance metric a collection was created with (Chroma defaults to l2)."""
+    configuration = getattr(collection, "configuration", None)
+    if isinstance(configuration, dict) and (configuration.get("hnsw") or {}).get("space"):
+        return configuration["hnsw"]["space"]
+    return (collection.metadata or {}).get("hnsw:space", "l2")
+
+def _relevance(distance: float, space: str) -> float:
+    """Relevance in [0, 1] from a Chroma distance between normalized embeddings."""
+    if space == "l2":
+        return 1.0 - distance / 2.0  # squared L2 = 2 - 2 * cosine similarity
+    return 1.0 - distance  # cosine and ip: 1 - similarity
+
+def _type_filter(types: List[str] | None) -> Dict[str, Any] | None:
+    """Chroma where clause restricting results to the given file types."""
+    if not types:
+        return None
+    return {"type": types[0]} if len(types) == 1 else {"type": {"$in": list(types)}}
+
+
+class RagEngine:
+    """RAG engine created once per server process.
+
+    - search(): vector, BM25 or fused retrieval over the cached collection (no
+      filesystem I/O), with query embeddings and results cached in a QueryCache;
+      results can be restricted to file types, or routed to the predicted ones
+    - reindex(): detects file changes and incrementally syncs the collection
+    - stats(): index and usage counters
+    A background watcher thread calls reindex() periodically.
+    """
+
+    def __init__(
+        self,
+        data_dir: Path,
+        collection_name: str | None = None,
+        embedding_model: str | None = None,
+        watch_interval: float | None = None,
+    ):
+        self.data_dir = Path(data_dir)
+        self.chroma_path = self.data_dir / "chroma_db"
+        self.collection_name = collection_name or CHROMA_CONFIG["collection_name"]
+        self.embedding_model = embedding_model or CHROMA_CONFIG["embedding_model"]
+        self.watch_interval = DATA_CONFIG["watch_interval"] if watch_interval is None else watch_interval
+
+        self.index_version = ""
+
+        self._client = None
+        self._collection = None
+        self._space = CHROMA_CONFIG["distance_metric"]
+        self._embedder = None
+        self._embedder_lock = threading.Lock()
+        self.lexical = BM25Index()
+        self._lexical_loaded = False
+        self.cache = QueryCache(self.embedding_model, self.data_dir / CACHE_CONFIG["disk_file"])
+        self.embedding_store = None
+        if EMBEDDING_STORE_CONFIG["enabled"]:
+            try:
+                self.embedding_store = EmbeddingStore(
+                    self.data_dir / EMBEDDING_STORE_CONFIG["directory"],
+                    self.embedding_model,
+                    EMBEDDING_STORE_CONFIG["dtype"],
+                )
+            except Exception as e:
+                print(f"Embedding store disabled: {e}")
+
+        # Last synced manifest (relative path -> content hash) and stat fingerprints
+        self._file_hashes: Dict[str, str] = {}
+        self._file_stats: Dict[str, tuple] = {}
+        # Indexed files without chunks (empty or whitespace only): they leave no
+        # trace in the collection, so they are remembered here (path -> hash)
+        self._empty_files: Dict[str, str] = {}
+
+        # Serializes index syncs: concurrent callers coalesce on a single sync
+        self._sync_lock = threading.Lock()
+        self._watcher_stop = threading.Event()
+        self._watcher_thread = None
+
+        self._last_sync = None
+        self._last_sync_stats: Dict[str, int] = {}
+        self._ingest_progress: Dict[str, int] = {}
+        self._search_count = 0
+        self._routed_count = 0
+        self._route_fallbacks = 0
+        self._error_count = 0
+
+    # --- Lifecycle ---
+    def start(self, watch: bool = True):
+        """Opens the index, warms up the embedder, runs the first sync and starts the watcher."""
+        self.warmup()
+        self.reindex()
+        if CACHE_CONFIG["warmup"]:
+            self.warmup_cache()
+        if watch:
+            self.start_watcher()
+        return self
+
+    def close(self):
+        """Stops the background watcher."""
+        self._watcher_stop.set()
+
+    def warmup(self):
+        """Loads the embedding model and runs one encode so the first query is fast."""
+        self.embed(["warmup"])
+        print(f"Embedding model ready: {self.embedding_model}")
+
+    def warmup_cache(self):
+        """Runs the example and test queries so the most common questions start cached."""
+        queries = [(q["query"], q.get("top_k", SEARCH_CONFIG["default_top_k"])) for q in get_example_queries()]
+        queries += [(q, SEARCH_CONFIG["default_top_k"]) for q in TEST_CONFIG["test_queries"]]
+        for query, top_k in queries:
+            self.search(query, top_k)
+        print(f"Query cache warmed up with {len(queries)} queries")
+
+    # --- Chroma and embedder handles ---
+    def _get_client(self):
+        if self._client is None:
+            self._client = chromadb.PersistentClient(
+                path=str(self.chroma_path),
+                settings=Settings(anonymized_telemetry=False)
+            )
+        return self._client
+
+    def _open_collection(self):
+        # Embeddings are always computed by the engine, so Chroma gets no embedding function
+        client = self._get_client()
+        space = CHROMA_CONFIG["distance_metric"]
+
+        def open_():
+            return client.get_or_create_collection(
+                name=self.collection_name,
+                metadata={"description": "Restaurant knowledge for RAG", "hnsw:space": space},
+                embedding_function=None,
+            )
+
+        collection = open_()
+        actual = _collection_space(collection)
+        if actual != space:
+            # hnsw:space only applies when a collection is created: rebuild one made with
+            # another metric (the sync then re-adds every file, mostly from the embedding store)
+            print(f"Collection '{self.collection_name}' uses {actual} distance instead of {space}: rebuilding it")
+            client.delete_collection(self.collection_name)
+            self.lexical.clear()
+            self._lexical_loaded = False
+            collection = open_()
+            actual = _collection_space(collection)
+        self._space = actual
+        return collection
+
+    def _get_embedder(self) -> SentenceTransformer:
+        if self._embedder is None:
+            with self._embedder_lock:
+                if self._embedder is None:
+                    self._embedder = SentenceTransformer(self.embedding_model)
+        return self._embedder
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embeds a list of texts with the engine's model."""
+        if not texts:
+            return []
+        vectors = self._get_embedder().encode(
+            texts,
+            batch_size=INGEST_CONFIG["batch_size"],
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return vectors.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeds chunk texts, reusing vectors from the persistent embedding store."""
+        if self.embedding_store is None:
+            return self.embed(texts)
+        return self.embedding_store.embed(texts, self.embed)
+
+    # --- Change detection ---
+    def _check_files_changed(self) -> bool:
+        """Check if any files have changed since last scan.
+
+        Uses cheap stat fingerprints (mtime_ns, size, inode) and only re-hashes
+        files whose fingerprint changed, so an idle scan reads no file content.
+        """
+        current_stats = {}
+        current_hashes = {}
+
+        for relative_path, file_path in _iter_text_files(self.data_dir).items():
+            try:
+                stat = file_path.stat()
+            except OSError:
+                continue
+            fingerprint = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            current_stats[relative_path] = fingerprint
+            if self._file_stats.get(relative_path) == fingerprint and relative_path in self._file_hashes:
+                current_hashes[relative_path] = self._file_hashes[relative_path]
+            else:
+                current_hashes[relative_path] = _get_file_hash(file_path)
+
+        self._file_stats = current_stats
+
+        if self._file_hashes != current_hashes:
+            self._file_hashes = current_hashes
+            return True
+
+        return False
+
+    # --- Incremental indexing ---
+    def _load_indexed_manifest(self, collection) -> Dict[str, Dict[str, Any]]:
+        """Rebuilds the manifest of what is already indexed from the collection metadata.
+
+        Returns: source -> {"hash": content hash, "ids": [chunk ids]}.
+        Entries indexed before content hashes were stored, or with different
+        chunking settings, get an empty hash so they are treated as changed.
+        """
+        indexed: Dict[str, Dict[str, Any]] = {}
+        signature = chunking_signature()
+        page_size = max(1, int(INGEST_CONFIG["manifest_page_size"]))
+        offset = 0
+        while True:
+            # Page through the collection so a large index is never loaded in one response
+            existing = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            page_ids = existing.get("ids") or []
+            for doc_id, meta in zip(page_ids, existing.get("metadatas") or []):
+                meta = meta or {}
+                source = meta.get("source") or doc_id
+                content_hash = meta.get("content_hash", "") if meta.get("chunking") == signature else ""
+                entry = indexed.setdefault(source, {"hash": content_hash, "ids": []})
+                if entry["hash"] != content_hash:
+                    entry["hash"] = ""
+                entry["ids"].append(doc_id)
+            if len(page_ids) < page_size:
+                break
+            offset += page_size
+        return indexed
+
+    def _build_file_chunks(self, file_path: Path, relative_path: str, content_hash: str):
+        """Reads a data file, chunks it and returns (documents, metadatas, ids)."""
+        content = file_path.read_text(encoding='utf-8')
+        if not content.strip():  # Skip empty files
+            return [], [], []
+
+        # Determine file type based on name or path
+        file_type = _determine_file_type(file_path)
+        signature = chunking_signature()
+
+        documents, metadatas, ids = [], [], []
+        for chunk_index, chunk in enumerate(chunk_text(content)):
+            documents.append(chunk["text"])
+            metadatas.append({
+                "source": relative_path,
+                "type": file_type,
+                "filename": file_path.name,
+                "full_path": str(file_path),
+                "content_hash": content_hash,
+                "chunking": signature,
+                "chunk_index": chunk_index,
+                "start_offset": chunk["start_offset"],
+                "end_offset": chunk["end_offset"],
+                "section": chunk["section"],
+            })
+            ids.append(_chunk_id(relative_path, chunk_index))
+        return documents, metadatas, ids
+
+    def _sync_index(self, collection, manifest: Dict[str, str]) -> Dict[str, int]:
+        """Brings the collection in line with the manifest.
+
+        Only added or changed files are re-read and re-embedded; removed files
+        have their chunks deleted. Unchanged files are not touched.
+        """
+        indexed = self._load_indexed_manifest(collection)
+        for source, content_hash in self._empty_files.items():
+            indexed.setdefault(source, {"hash": content_hash, "ids": []})
+        old_manifest = {source: entry["hash"] for source, entry in indexed.items()}
+        added, changed, removed = _diff_manifests(old_manifest, manifest)
+
+        stats = {"added": 0, "changed": 0, "removed": 0, "unchanged": len(manifest) - len(added) - len(changed)}
+
+        for relative_path in removed:
+            self._empty_files.pop(relative_path, None)
+            if indexed[relative_path]["ids"]:
+                collection.delete(ids=indexed[relative_path]["ids"])
+            for doc_id in indexed[relative_path]["ids"]:
+                self.lexical.remove(doc_id)
+            stats["removed"] += 1
+            print(f"Removed: {relative_path}")
+
+        pending = added + changed
+        batch_size = max(1, int(INGEST_CONFIG["batch_size"]))
+        progress_every = max(1, int(INGEST_CONFIG["progress_every"]))
+        batch_docs, batch_metas, batch_ids = [], [], []
+        chunk_count = 0
+
+        def flush():
+            # Embed and write one bounded batch of chunks
+            if batch_ids:
+                collection.upsert(
+                    documents=batch_docs,
+                    metadatas=batch_metas,
+                    ids=batch_ids,
+                    embeddings=self.embed_documents(batch_docs),
+                )
+                for doc_id, document, metadata in zip(batch_ids, batch_docs, batch_metas):
+                    self.lexical.add(doc_id, document, metadata.get("type", ""))
+                batch_docs.clear()
+                batch_metas.clear()
+                batch_ids.clear()
+
+        for done, (relative_path, chunks, error) in enumerate(self._iter_file_chunks(pending, manifest), start=1):
+            if error is not None:
+                print(f"Error reading {self.data_dir / relative_path}: {error}")
+                continue
+
+            documents, metadatas, ids = chunks
+            for document, metadata, doc_id in zip(documents, metadatas, ids):
+                batch_docs.append(document)
+                batch_metas.append(metadata)
+                batch_ids.append(doc_id)
+                if len(batch_ids) >= batch_size:
+                    flush()
+            chunk_count += len(ids)
+            if ids:
+                self._empty_files.pop(relative_path, None)
+            else:
+                self._empty_files[relative_path] = manifest[relative_path]
+
+            # Drop chunks that no longer exist (file shrank or became empty)
+            stale_ids = [doc_id for doc_id in indexed.get(relative_path, {}).get("ids", []) if doc_id not in ids]
+            if stale_ids:
+                collection.delete(ids=stale_ids)
+                for doc_id in stale_ids:
+                    self.lexical.remove(doc_id)
+
+            if relative_path in indexed:
+                stats["changed"] += 1
+                print(f"Updated: {relative_path} ({len(ids)} chunks)")
+            else:
+                stats["added"] += 1
+                print(f"Loaded: {relative_path} ({len(ids)} chunks)")
+
+            self._ingest_progress = {"files_done": done, "files_total": len(pending), "chunks": chunk_count}
+            if done % progress_every == 0 or done == len(pending):
+                print(f"Ingest progress: {done}/{len(pending)} files, {chunk_count} chunks")
+
+        flush()
+        return stats
+
+    def _iter_file_chunks(self, relative_paths: List[str], manifest: Dict[str, str]):
+        """Reads and chunks files on a thread pool, yielding (relative_path, chunks, error) in order.
+
+        Read-ahead is bounded to twice the number of reader threads, so only a
+        handful of files are held in memory at any time.
+        """
+        def read(relative_path):
+            try:
+                file_path = self.data_dir / relative_path
+                return relative_path, self._build_file_chunks(file_path, relative_path, manifest[relative_path]), None
+            except Exception as e:
+                return relative_path, ([], [], []), e
+
+        workers = max(1, int(INGEST_CONFIG["reader_threads"]))
+        paths = iter(relative_paths)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-reader") as pool:
+            in_flight = deque(pool.submit(read, path) for path in islice(paths, workers * 2))
+            while in_flight:
+                result = in_flight.popleft().result()
+                next_path = next(paths, None)
+                if next_path is not None:
+                    in_flight.append(pool.submit(read, next_path))
+                yield result
+
+    def _load_lexical(self, collection):
+        """Builds the BM25 index from the chunks already stored in the collection."""
+        self.lexical.clear()
+        page_size = max(1, int(INGEST_CONFIG["manifest_page_size"]))
+        offset = 0
+        while True:
+            existing = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            page_ids = existing.get("ids") or []
+            metadatas = existing.get("metadatas") or [None] * len(page_ids)
+            for doc_id, document, meta in zip(page_ids, existing.get("documents") or [], metadatas):
+                self.lexical.add(doc_id, document or "", (meta or {}).get("type", ""))
+            if len(page_ids) < page_size:
+                break
+            offset += page_size
+        self._lexical_loaded = True
+
+    def _sync(self):
+        """Scans the data files and incrementally syncs the collection (caller holds _sync_lock)."""
+        try:
+            # If files haven't changed, keep the current collection
+            if not self._check_files_changed() and self._collection is not None:
+                return self._collection
+
+            collection = self._open_collection()
+            if not self._lexical_loaded:
+                self._load_lexical(collection)
+            print(f"Syncing RAG database with: {self.data_dir}")
+            stats = self._sync_index(collection, self._file_hashes)
+            print(
+                f"RAG sync done: {stats['added']} added, {stats['changed']} changed, "
+                f"{stats['removed']} removed, {stats['unchanged']} unchanged"
+            )
+
+            self._collection = collection
+            self.index_version = _manifest_version(self._file_hashes)
+            self.cache.set_version(self.index_version)
+            self._last_sync = datetime.now()
+            self._last_sync_stats = stats
+            return collection
+
+        except Exception as e:
+            # Force a full re-scan on next sync
+            self._file_hashes = {}
+            self._file_stats = {}
+            self._error_count += 1
+            print(f"Error in RAG initialization: {e}")
+            return None
+
+    def reindex(self, full: bool = False):
+        """Detects file changes and syncs the collection.
+
+        With full=True, every file is re-hashed (the write side stays incremental).
+        """
+        with self._sync_lock:
+            if full:
+                self._file_hashes = {}
+                self._file_stats = {}
+            return self._sync()
+
+    def _get_collection(self):
+        """Returns the collection, syncing it first only if it is not ready.
+
+        Once the collection is open this does no filesystem I/O. Concurrent
+        callers arriving before the first sync wait for that single sync.
+        """
+        collection = self._collection
+        if collection is not None:
+            return collection
+        with self._sync_lock:
+            if self._collection is not None:
+                return self._collection
+            return self._sync()
+
+    # --- Background watcher ---
+    def _watcher_loop(self, interval: float):
+        """Background loop: polls stat fingerprints and re-syncs on changes."""
+        while not self._watcher_stop.wait(interval):
+            try:
+                self.reindex()
+            except Exception as e:
+                print(f"Error in RAG watcher: {e}")
+
+    def start_watcher(self, interval: float | None = None):
+        """Starts the background change watcher (no-op if disabled or running)."""
+        if interval is None:
+            interval = self.watch_interval
+        if interval <= 0 or (self._watcher_thread is not None and self._watcher_thread.is_alive()):
+            return
+
+        self._watcher_stop.clear()
+        self._watcher_thread = threading.Thread(
+            target=self._watcher_loop, args=(interval,), name="rag-watcher", daemon=True
+        )
+        self._watcher_thread.start()
+        print(f"RAG watcher started (every {interval}s)")
+
+    # --- Queries ---
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embeds queries in one model call, reusing cached vectors for repeated questions."""
+        vectors = [self.cache.get_embedding(query) for query in queries]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.embed([queries[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+                self.cache.put_embedding(queries[i], vector)
+        return vectors
+
+    def _vector_rankings(self, collection, queries: List[str], n: int, types: List[str] | None = None):
+        """Dense retrieval for several queries in one Chroma call, optionally filtered by file type.
+
+        Returns one (ranked ids, id -> (document, metadata, relevance)) pair per query.
+        """
+        results = collection.query(
+            query_embeddings=self._embed_queries(queries),
+            n_results=n,
+            where=_type_filter(types),
+            include=["documents", "metadatas", "distances"]
+        )
+        rankings = []
+        for q in range(len(queries)):
+            ranking, hits = [], {}
+            ids = results['ids'][q] if results['ids'] else []
+            for i, doc_id in enumerate(ids):
+                distance = results['distances'][q][i] if results['distances'] and results['distances'][q] else 0.0
+                hits[doc_id] = (results['documents'][q][i], results['metadatas'][q][i],
+                                _relevance(distance, self._space))
+                ranking.append(doc_id)
+            rankings.append((ranking, hits))
+        return rankings
+
+    def _lexical_ranking(self, query: str, n: int, types: List[str] | None = None):
+        """BM25 retrieval: returns (ranked ids, id -> relevance). No embedding involved."""
+        scored = self.lexical.search(query, n, types)
+        return [doc_id for doc_id, _ in scored], {doc_id: lexical_relevance(score) for doc_id, score in scored}
+
+    def _fetch_chunks(self, collection, ids: List[str]) -> Dict[str, tuple]:
+        """Loads documents and metadata for chunk ids found only by the lexical index."""
+        if not ids:
+            return {}
+        got = collection.get(ids=ids, include=["documents", "metadatas"])
+        return {
+            doc_id: (document, meta)
+            for doc_id, document, meta in zip(got.get("ids") or [], got.get("documents") or [], got.get("metadatas") or [])
+        }
+
+    def _format_result(self, doc_id: str, doc: str, meta: Dict[str, Any] | None, relevance: float, retrieval: str) -> Dict[str, Any]:
+        meta = meta or {}
+        return {
+            "id": doc_id,
+            "content": doc,
+            "source": meta.get('source', 'unknown'),
+            "type": meta.get('type', 'unknown'),
+            "section": meta.get('section', ''),
+            "chunk_index": meta.get('chunk_index', 0),
+            "start_offset": meta.get('start_offset', 0),
+            "end_offset": meta.get('end_offset', len(doc)),
+            "relevance_score": relevance,
+            "retrieval": retrieval,
+        }
+
+    def _resolve_mode(self, query: str, mode: str) -> str:
+        """'auto' picks the lexical fast path for short keyword queries, hybrid otherwise."""
+        if mode != "auto":
+            return mode
+        terms = tokenize(query)
+        return "lexical" if 0 < len(terms) <= HYBRID_CONFIG["lexical_max_terms"] else "hybrid"
+
+    def _run_queries(
+        self, collection, queries: List[str], top_k: int, mode: str, types: List[str] | None = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Runs uncached queries: lexical ones one by one (cheap), dense ones in a single batch.
+
+        types restricts every query to those file types (None searches everything).
+        """
+        resolved = [self._resolve_mode(query, mode) for query in queries]
+        output: List[List[Dict[str, Any]]] = [[] for _ in queries]
+
+        for i, query in enumerate(queries):
+            if resolved[i] != "lexical":
+                continue
+            ranking, lexical_scores = self._lexical_ranking(query, top_k, types)
+            chunks = self._fetch_chunks(collection, ranking)
+            output[i] = [
+                self._format_result(doc_id, *chunks[doc_id], lexical_scores[doc_id], "lexical")
+                for doc_id in ranking if doc_id in chunks
+            ]
+            # Fast path found nothing: fall back to hybrid unless lexical was explicitly requested
+            if not output[i] and mode == "auto":
+                resolved[i] = "hybrid"
+
+        dense = [i for i in range(len(queries)) if resolved[i] in ("vector", "hybrid")]
+        if not dense:
+            return output
+
+        candidates = max(top_k, top_k * HYBRID_CONFIG["candidate_multiplier"])
+        n = candidates if any(resolved[i] == "hybrid" for i in dense) else top_k
+        for i, (vector_ids, hits) in zip(dense, self._vector_rankings(collection, [queries[i] for i in dense], n, types)):
+            if resolved[i] == "vector":
+                output[i] = [
+                    self._format_result(doc_id, hits[doc_id][0], hits[doc_id][1], hits[doc_id][2], "vector")
+                    for doc_id in vector_ids[:top_k]
+                ]
+                continue
+
+            lexical_ids, lexical_scores = self._lexical_ranking(queries[i], candidates, types)
+            fused = reciprocal_rank_fusion([vector_ids, lexical_ids])[:top_k]
+            lexical_only = self._fetch_chunks(collection, [doc_id for doc_id, _ in fused if doc_id not in hits])
+            for doc_id, rrf_score in fused:
+                if doc_id in hits:
+                    doc, meta, relevance = hits[doc_id]
+                elif doc_id in lexical_only:
+                    (doc, meta), relevance = lexical_only[doc_id], 0.0
+                else:
+                    continue
+                item = self._format_result(doc_id, doc, meta, max(relevance, lexical_scores.get(doc_id, 0.0)), "hybrid")
+                item["rrf_score"] = rrf_score
+                output[i].append(item)
+        return output
+
+    def _run_routed(self, collection, queries: List[str], top_k: int, mode: str) -> List[List[Dict[str, Any]]]:
+        """Searches each query's predicted file types first, then the whole collection if that is not enough."""
+        routes = [route_query(query) for query in queries]
+        output: List[List[Dict[str, Any]]] = [[] for _ in queries]
+
+        # One filtered pass per distinct route (unrouted queries go straight to the full search)
+        groups: Dict[tuple, List[int]] = {}
+        for i, route in enumerate(routes):
+            groups.setdefault(tuple(route), []).append(i)
+        for route, indexes in groups.items():
+            if not route:
+                continue
+            self._routed_count += len(indexes)
+            computed = self._run_queries(collection, [queries[i] for i in indexes], top_k, mode, list(route))
+            for i, results in zip(indexes, computed):
+                output[i] = results
+
+        fallback = [i for i in range(len(queries)) if len(output[i]) < top_k]
+        if fallback:
+            self._route_fallbacks += sum(1 for i in fallback if routes[i])
+            computed = self._run_queries(collection, [queries[i] for i in fallback], top_k, mode)
+            for i, results in zip(fallback, computed):
+                seen = {item["id"] for item in output[i]}
+                output[i].extend(item for item in results if item["id"] not in seen)
+                del output[i][top_k:]
+        return output
+
+    def search_batch(
+        self,
+        queries: List[str],
+        top_k: int = 3,
+        mode: str | None = None,
+        types: List[str] | None = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """Performs several RAG searches at once; returns one result list per query.
+
+        mode: "vector" (dense only), "lexical" (BM25 only, no embedding),
+        "hybrid" (both, fused with reciprocal rank fusion) or "auto"
+        (lexical for short keyword queries that have BM25 hits, hybrid otherwise).
+        types: only return chunks of these file types ("menu" also covers
+        menu_today and menu_dated). Without types, each query is routed to the
+        file types its keywords point at, falling back to the whole collection.
+        Cached queries are answered from the cache; the rest share one
+        embedding call and one Chroma query per file-type filter.
+        """
+        mode = (mode or HYBRID_CONFIG["default_mode"]).lower()
+        if mode not in SEARCH_MODES:
+            mode = HYBRID_CONFIG["default_mode"]
+        types = expand_types(types) if types else None
+        routed = types is None and ROUTER_CONFIG["enabled"]
+        if types:
+            variant = f"{mode}|types={','.join(sorted(types))}"
+        else:
+            variant = f"{mode}|routed" if routed else mode
+        try:
+            collection = self._get_collection()
+            if not collection:
+                return [[] for _ in queries]
+
+            self._search_count += len(queries)
+            version = self.index_version
+            output = [self.cache.get_results(query, top_k, version, variant) for query in queries]
+            pending = [i for i, cached in enumerate(output) if cached is None]
+            if pending:
+                pending_queries = [queries[i] for i in pending]
+                if routed:
+                    computed = self._run_routed(collection, pending_queries, top_k, mode)
+                else:
+                    computed = self._run_queries(collection, pending_queries, top_k, mode, types)
+                for i, results in zip(pending, computed):
+                    self.cache.put_results(queries[i], top_k, version, results, variant)
+                    output[i] = results
+            return [[dict(item) for item in results] for results in output]
+
+        except Exception as e:
+            # Collection may have been deleted underneath us: re-sync on next request.
+            # The BM25 index stays (a real rebuild of the collection clears it)
+            self._collection = None
+            self._error_count += 1
+            print(f"Error in RAG search: {e}")
+            return [[] for _ in queries]
+
+    def search(
+        self, query: str, top_k: int = 3, mode: str | None = None, types: List[str] | None = None
+    ) -> List[Dict[str, Any]]:
+        """Performs RAG search on restaurant data (see search_batch for modes and types)."""
+        return self.search_batch([query], top_k, mode, types)[0]
+
+    def manifest(self) -> Dict[str, str]:
+        """Returns the synced file manifest: relative path -> content hash."""
+        return dict(self._file_hashes)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns index and usage statistics."""
+        collection = self._collection
+        try:
+            documents = collection.count() if collection is not None else 0
+        except Exception:
+            documents = 0
+        return {
+            "collection": self.collection_name,
+            "embedding_model": self.embedding_model,
+            "embedder_loaded": self._embedder is not None,
+            "index_version": self.index_version,
+            "files": len(self._file_hashes),
+            "documents": documents,
+            "lexical_documents": len(self.lexical),
+            "last_sync": self._last_sync.isoformat() if self._last_sync else None,
+            "last_sync_stats": dict(self._last_sync_stats),
+            "ingest_progress": dict(self._ingest_progress),
+            "searches": self._search_count,
+            "routed_queries": self._routed_count,
+            "route_fallbacks": self._route_fallbacks,
+            "errors": self._error_count,
+            "cache": self.cache.stats(),
+            "embedding_store": self.embedding_store.stats() if self.embedding_store is not None else None,
+            "watcher_running": self._watcher_thread is not None and self._watcher_thread.is_alive(),
+        }
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+In-memory lexical retrieval for the RAG engine.
+A BM25 inverted index kept next to the Chroma collection, plus reciprocal
+rank fusion (RRF) to merge lexical and vector rankings.
+"""
+
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Set, Tuple
+
+from rag_config import HYBRID_CONFIG
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Words that carry no lexical signal in customer questions (English and Italian)
+STOPWORDS = {
+    "a", "an", "and", "are", "at", "be", "can", "do", "does", "for", "from", "have", "how",
+    "i", "in", "is", "it", "me", "my", "of", "on", "or", "s", "the", "there", "to", "we",
+    "what", "whats", "when", "where", "which", "who", "with", "you", "your",
+    "al", "che", "ci", "con", "da", "del", "della", "di", "e", "il", "in", "la", "le",
+    "lo", "per", "quali", "quando", "si", "un", "una",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases, strips accents (so "tiramisu" matches "Tiramisù") and drops stopwords."""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return [token for token in _TOKEN_RE.findall(text) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Thread-safe BM25 inverted index over chunk IDs."""
+
+    def __init__(self, k1: float | None = None, b: float | None = None):
+        self.k1 = HYBRID_CONFIG["bm25_k1"] if k1 is None else k1
+        self.b = HYBRID_CONFIG["bm25_b"] if b is None else b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_terms: Dict[str, Set[str]] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._doc_type: Dict[str, str] = {}
+        self._total_len = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def add(self, doc_id: str, text: str, doc_type: str = ""):
+        """Indexes (or re-indexes) a chunk; doc_type allows filtered searches."""
+        counts = Counter(tokenize(text))
+        with self._lock:
+            self._remove(doc_id)
+            for term, tf in counts.items():
+                self._postings.setdefault(term, {})[doc_id] = tf
+            self._doc_terms[doc_id] = set(counts)
+            self._doc_len[doc_id] = sum(counts.values())
+            self._doc_type[doc_id] = doc_type
+            self._total_len += self._doc_len[doc_id]
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        for term in self._doc_terms.pop(doc_id, ()):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_len -= self._doc_len.pop(doc_id, 0)
+        self._doc_type.pop(doc_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_len.clear()
+            self._doc_type.clear()
+            self._total_len = 0
+
+    def search(self, query: str, top_k: int, types: Iterable[str] | None = None) -> List[Tuple[str, float]]:
+        """Returns up to top_k (doc_id, bm25 score) pairs, best first, optionally only for chunks of the given types."""
+        allowed = set(types) if types else None
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self._doc_len)
+            if not terms or not n_docs:
+                return []
+            avg_len = self._total_len / n_docs or 1.0
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    if allowed is not None and self._doc_type.get(doc_id) not in allowed:
+                        continue
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+def lexical_relevance(score: float) -> float:
+    """Maps an unbounded BM25 score to [0, 1) for the relevance_score field."""
+    return score / (score + HYBRID_CONFIG["lexical_score_midpoint"])
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int | None = None) -> List[Tuple[str, float]]:
+    """Fuses ranked ID lists: score(d) = sum over lists of 1 / (k + rank)."""
+    k = HYBRID_CONFIG["rrf_k"] if k is None else k
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,101 @@
+"""The chat server's answer cache must not leak answers between sessions."""
+
+import asyncio
+import json
+
+import pytest
+
+import chat_server
+from answer_cache import AnswerCache
+from llm_scheduler import LLMScheduler
+
+RAG_STATUS = {"index_version": "v1", "files": {"menu.txt": "hash-menu"}}
+
+
+def _embed(text: str, host=None):
+    # Same question (ignoring case and spacing) -> same vector
+    key = " ".join(text.lower().split())
+    return [float(ord(c)) for c in key.ljust(40)[:40]]
+
+
+async def _fake_ollama_chat(client, session_id, messages, stage, tools=None, **options):
+    """Calls rag_search for a fresh question, then answers with the session's first message in it."""
+    if stage == "tools" and messages[-1]["role"] == "user" and "?" in messages[-1]["content"]:
+        call = {"function": {"name": "rag_search", "arguments": {"query": messages[-1]["content"]}}}
+        yield {"message": {"role": "assistant", "content": "", "tool_calls": [call]}, "done": False}
+    else:
+        first_user = next(m["content"] for m in messages if m["role"] == "user")
+        yield {"message": {"role": "assistant", "content": f"Answer for someone who said: {first_user}"},
+               "done": False}
+    yield {"message": {"role": "assistant", "content": ""}, "done": True, "done_reason": "stop"}
+
+
+async def _fake_call_mcp(client, call):
+    payload = {"local_results": [{"source": "menu.txt", "content": "Tiramisu, panna cotta"}]}
+    return {"ok": True, "result": {"content": [{"type": "text", "text": json.dumps(payload)}]}}
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(chat_server, "ollama_chat", _fake_ollama_chat)
+    monkeypatch.setattr(chat_server, "call_mcp", _fake_call_mcp)
+    monkeypatch.setattr(chat_server.bot, "discover_tools", lambda force=False: ["rag_search"])
+    monkeypatch.setattr(chat_server.bot, "native_tools_for", lambda tool_names: [])
+    monkeypatch.setattr(chat_server.bot, "fetch_rag_status", lambda force=False: RAG_STATUS)
+    state = chat_server.app.state
+    state.http = None
+    state.scheduler = LLMScheduler(["http://ollama.invalid"])
+    state.sessions = {}
+    state.stats = {"turns": 0}
+    state.tool_mode = "native"
+    state.answer_cache = AnswerCache(_embed, threshold=0.99)
+    return state
+
+
+def _turn(session, text):
+    async def run():
+        return [event async for event in chat_server.run_turn(session, text)][-1]
+    return asyncio.run(run())
+
+
+def _session(state, session_id):
+    session = chat_server.Session(session_id, ["rag_search"], "native")
+    state.sessions[session_id] = session
+    return session
+
+
+def test_answer_depending_on_history_is_not_served_to_other_sessions(server):
+    alice = _session(server, "alice")
+    bob = _session(server, "bob")
+
+    _turn(alice, "I am allergic to nuts")
+    personal = _turn(alice, "Which desserts can I have?")
+    assert personal["event"] == "done" and not personal["data"]["cached"]
+    assert "allergic to nuts" in personal["data"]["answer"]
+
+    # Same question from another session: answered afresh, not from Alice's entry
+    answer = _turn(bob, "Which desserts can I have?")
+    assert not answer["data"]["cached"]
+    assert "allergic" not in answer["data"]["answer"]
+
+    # Alice herself still gets her cached answer
+    again = _turn(alice, "which desserts can I have?")
+    assert again["data"]["cached"]
+    assert again["data"]["answer"] == personal["data"]["answer"]
+
+
+def test_first_turn_answers_are_shared_and_private_entries_go_with_the_session(server):
+    carol = _session(server, "carol")
+    dave = _session(server, "dave")
+
+    first = _turn(carol, "Which desserts are on the menu?")
+    assert not first["data"]["cached"]
+    _turn(carol, "Is the tiramisu homemade?")
+
+    shared = _turn(dave, "Which desserts are on the menu?")
+    assert shared["data"]["cached"]
+
+    entries = len(server.answer_cache._entries)
+    asyncio.run(chat_server._forget_session("carol"))
+    assert "carol" not in server.sessions
+    assert len(server.answer_cache._entries) == entries - 1
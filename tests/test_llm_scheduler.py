@@ -0,0 +1,38 @@
+"""A retried request must not be queued back onto the backend that just failed it."""
+
+import asyncio
+
+from llm_scheduler import PRIORITY_FINALIZE, LLMScheduler
+
+
+def test_queued_retry_avoids_the_failed_backend():
+    async def run():
+        scheduler = LLMScheduler(["http://a", "http://b"], max_inflight=2)
+        a, b = scheduler.backends
+        held = [await scheduler.acquire(f"s{i}") for i in range(4)]
+        assert sorted(backend.url for backend in held) == ["http://a", "http://a", "http://b", "http://b"]
+
+        retry = asyncio.create_task(scheduler.acquire("retry", PRIORITY_FINALIZE, avoid=a))
+        await asyncio.sleep(0)
+        # Free both of A's slots and one of B's: A is the least loaded, but the retry avoids it
+        a.outstanding = 0
+        b.outstanding = 1
+        scheduler._dispatch()
+        assert await retry is b
+
+    asyncio.run(run())
+
+
+def test_queued_retry_falls_back_to_the_failed_backend_when_it_is_the_only_one_free():
+    async def run():
+        scheduler = LLMScheduler(["http://a", "http://b"], max_inflight=1)
+        a, b = scheduler.backends
+        await scheduler.acquire("s1")
+        await scheduler.acquire("s2")
+
+        retry = asyncio.create_task(scheduler.acquire("retry", PRIORITY_FINALIZE, avoid=a))
+        await asyncio.sleep(0)
+        scheduler.release(a, True)
+        assert await retry is a
+
+    asyncio.run(run())
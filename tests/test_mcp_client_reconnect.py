@@ -0,0 +1,76 @@
+"""The session pool reconnects when the MCP server restarts and forgets its sessions."""
+
+import asyncio
+import socket
+import subprocess
+import sys
+import time
+
+import mcp_client
+
+SERVER = """
+import sys
+
+import uvicorn
+from mcp.server.fastmcp import FastMCP
+
+mcp = FastMCP(name="restart-test")
+
+
+@mcp.tool()
+def echo(message: str) -> str:
+    return message
+
+
+uvicorn.run(mcp.streamable_http_app(), host="127.0.0.1", port=int(sys.argv[1]), log_level="warning")
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(script, port) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, str(script), str(port)])
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("MCP test server did not start")
+
+
+def _stop_server(process: subprocess.Popen):
+    process.terminate()
+    process.wait(timeout=10)
+
+
+def test_pool_reopens_the_session_after_a_server_restart(tmp_path):
+    script = tmp_path / "server.py"
+    script.write_text(SERVER)
+    port = _free_port()
+
+    async def echo(pool, message):
+        result = await pool.run(lambda session: session.call_tool("echo", {"message": message}))
+        return result.content[0].text
+
+    async def run():
+        pool = mcp_client.SessionPool(f"http://127.0.0.1:{port}/mcp", 1)
+        server = _start_server(script, port)
+        try:
+            assert await echo(pool, "before") == "before"
+            _stop_server(server)
+            server = _start_server(script, port)
+            # The pooled session id is unknown to the new server: it answers 404
+            assert await echo(pool, "after") == "after"
+            assert pool.slots[0].connects == 2
+        finally:
+            await pool.close()
+            _stop_server(server)
+
+    asyncio.run(run())
@@ -0,0 +1,39 @@
+"""Tool calls of a turn that miss the deadline come back as errors instead of raising."""
+
+import time
+
+import ollama_bot
+
+
+def _slow_tool(delay):
+    def call(tool, arguments):
+        time.sleep(delay)
+        return {"ok": True, "result": {"tool": tool, **arguments}}
+    return call
+
+
+def test_threaded_dispatch_over_the_deadline_with_more_items_than_workers(monkeypatch):
+    monkeypatch.setattr(ollama_bot, "call_client_http", _slow_tool(0.5))
+    items = [{"tool": "echo", "arguments": {"message": str(i)}} for i in range(10)]
+
+    started = time.perf_counter()
+    results = ollama_bot._dispatch_threaded(items, deadline=0.2)
+
+    assert time.perf_counter() - started < 0.5
+    assert len(results) == 10
+    assert all(result == {"ok": False, "error": "Timed out after 0.2s"} for result in results)
+
+
+def test_early_dispatch_deadline_starts_at_collect(monkeypatch):
+    monkeypatch.setattr(ollama_bot, "call_client_http", _slow_tool(0.1))
+    first = {"tool": "echo", "arguments": {"message": "first"}}
+    second = {"tool": "echo", "arguments": {"message": "second"}}
+
+    dispatcher = ollama_bot.ToolDispatcher(deadline=0.3)
+    dispatcher.submit(first)
+    # The model keeps writing for longer than the deadline before its next tool block
+    time.sleep(0.4)
+    dispatcher.submit(second)
+    results = dispatcher.collect([first, second])
+
+    assert [result["ok"] for result in results] == [True, True]
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Brave Search API client used by the MCP `search` tool.
+It holds one pooled keep-alive HTTP session per process. Responses are
+cached for a TTL and, once expired, served stale while a background request
+refreshes them. Failed requests (connection errors, 429 and 5xx) are retried
+with exponential backoff, and a semaphore caps concurrent API calls.
+Concurrent misses for the same query share a single request.
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rag_config import WEB_SEARCH_CONFIG
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class _Call:
+    """An in-flight request that concurrent callers for the same key wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Dict[str, Any] | None = None
+        self.error: Exception | None = None
+
+
+class BraveSearchClient:
+    """Thread-safe Brave web search client with pooling, caching and retries."""
+
+    def __init__(self, base_url: str | None = None, config: Dict[str, Any] | None = None):
+        self.config = {**WEB_SEARCH_CONFIG, **(config or {})}
+        self.base_url = base_url or self.config["base_url"]
+
+        pool_size = max(1, int(self.config["max_concurrency"]))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._semaphore = threading.BoundedSemaphore(pool_size)
+
+        self._cache: "OrderedDict[Tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[Tuple, _Call] = {}
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+
+    # --- Cache ---
+    @staticmethod
+    def _cache_key(params: Dict[str, Any]) -> Tuple:
+        return (
+            " ".join(str(params["q"]).split()).lower(),
+            params.get("count"),
+            params.get("country"),
+            params.get("search_lang"),
+            params.get("safesearch"),
+        )
+
+    def _store(self, key: Tuple, data: Dict[str, Any]):
+        with self._lock:
+            self._cache[key] = (time.monotonic(), data)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.config["cache_max_entries"]:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    # --- HTTP ---
+    def _retry_delay(self, attempt: int, response: requests.Response | None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.config["max_backoff_seconds"])
+            except ValueError:
+                pass
+        delay = self.config["backoff_seconds"] * (2 ** attempt)
+        # Jitter spreads out retries of concurrent callers
+        return min(delay, self.config["max_backoff_seconds"]) * random.uniform(0.8, 1.2)
+
+    def _request(self, params: Dict[str, Any], api_key: str) -> Dict[str, Any]:
+        """GETs the search endpoint, retrying transient failures with exponential backoff."""
+        headers = {
+            "X-Subscription-Token": api_key,
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip",
+        }
+        max_retries = max(0, int(self.config["max_retries"]))
+        for attempt in range(max_retries + 1):
+            response = None
+            try:
+                with self._semaphore:
+                    self.requests += 1
+                    response = self.session.get(
+                        self.base_url, headers=headers, params=params, timeout=self.config["timeout"]
+                    )
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response.json()
+                error: Exception = requests.HTTPError(
+                    f"{response.status_code} Error for url: {response.url}", response=response
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt == max_retries:
+                break
+            self.retries += 1
+            time.sleep(self._retry_delay(attempt, response))
+        raise error
+
+    def _fetch(self, key: Tuple, params: Dict[str, Any], api_key: str) -> Dict[str, Any]:
+        """Requests and caches a response; concurrent callers for the same key share one request."""
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._request(params, api_key)
+            self._store(key, call.result)
+            return call.result
+        except Exception as e:
+            self.errors += 1
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+
+    def _refresh_in_background(self, key: Tuple, params: Dict[str, Any], api_key: str):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self._fetch(key, params, api_key)
+            except Exception as e:
+                print(f"Brave cache refresh failed for '{params['q']}': {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name="brave-refresh", daemon=True).start()
+
+    # --- Public API ---
+    def search(
+        self,
+        api_key: str,
+        q: str,
+        count: int | None = None,
+        country: str | None = None,
+        search_lang: str | None = None,
+        safesearch: str | None = None,
+    ) -> Dict[str, Any]:
+        """Returns the raw Brave JSON response for a query, from cache when possible."""
+        params: Dict[str, Any] = {"q": q}
+        if count is not None:
+            params["count"] = count
+        if country:
+            params["country"] = country
+        if search_lang:
+            params["search_lang"] = search_lang
+        if safesearch:
+            params["safesearch"] = safesearch
+
+        key = self._cache_key(params)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                age = time.monotonic() - entry[0]
+                if age < self.config["cache_ttl_seconds"]:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                if age < self.config["cache_ttl_seconds"] + self.config["stale_ttl_seconds"]:
+                    self.stale_hits += 1
+                    stale = entry[1]
+                else:
+                    del self._cache[key]
+                    stale = None
+            else:
+                stale = None
+
+        if stale is not None:
+            self._refresh_in_background(key, params, api_key)
+            return stale
+
+        self.misses += 1
+        return self._fetch(key, params, api_key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+        }